@@ -0,0 +1,165 @@
+import random
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict
+
+from synthetizer.metadata import DT_INF
+
+TZ_INFO = timezone(timedelta(hours=2))
+
+RESOURCE_TYPES = {
+    "ehpads": "Organization",
+    "services": "Organization",
+    "soins": "ActivityDefinition",
+    "animations": "ActivityDefinition",
+    "chambres": "Location",
+    "patients_actifs": "Patient",
+    "activites_planifiees": "Appointment",
+    "soins_planifies": "ServiceRequest",
+    "hospitalisations": "Encounter",
+    "sejours": "Encounter",
+    "vacances": "Encounter",
+    "consultations_specialisees": "Encounter",
+    "practitioner": "Practitioner",
+}
+
+# Numbers of distinct referenced resources, as in a real EHPAD
+N_PATIENTS = 500
+N_PRACTITIONERS = 50
+N_ORGANIZATIONS = 10
+N_LOCATIONS = 200
+
+
+def random_dt(rng: random.Random) -> datetime:
+    """Draw a datetime rounded to 5 minutes, within a few years."""
+    start = datetime(2016, 1, 1, tzinfo=TZ_INFO)
+    return start + timedelta(days=rng.randint(0, 900), minutes=5 * rng.randint(0, 24 * 12 - 1))
+
+
+def make_resource(resource_name: str, i: int, rng: random.Random) -> Dict[str, Any]:
+    """Make a realistic resource, with the attributes which are deleted, sampled & referenced."""
+    resource: Dict[str, Any] = {
+        "resourceType": RESOURCE_TYPES[resource_name],
+        "id": str(i),
+        "meta": {"versionId": "1", "lastUpdated": "2021-11-05T10:00:00.000+00:00"},
+    }
+    subject = {"reference": f"Patient/{rng.randrange(N_PATIENTS)}", "type": "Patient"}
+    organization = {"reference": f"Organization/{rng.randrange(N_ORGANIZATIONS)}"}
+
+    if resource_name in {"ehpads", "services"}:
+        resource["name"] = rng.choice(["EHPAD", "Unité A", "Unité B", "Unité protégée"])
+        if resource_name == "services":
+            resource["partOf"] = organization
+    elif resource_name in {"soins", "animations"}:
+        resource["title"] = rng.choice(["Toilette", "Pansement", "Gym douce", "Chorale"])
+        resource["status"] = "active"
+    elif resource_name == "chambres":
+        resource["name"] = f"Chambre {rng.randint(1, 300)}"
+        resource["managingOrganization"] = organization
+    elif resource_name == "patients_actifs":
+        resource["birthDate"] = f"19{rng.randint(20, 45)}-0{rng.randint(1, 9)}-1{rng.randint(0, 9)}"
+        resource["gender"] = rng.choice(["female", "male"])
+        resource["text"] = {"status": "generated", "div": "<div>...</div>"}
+        resource["identifier"] = [{"value": str(rng.randrange(10**9))}]
+        resource["name"] = [{"text": "NOM Prénom", "family": "NOM", "given": ["Prénom"]}]
+        resource["managingOrganization"] = organization
+    elif resource_name == "practitioner":
+        resource["identifier"] = [{"value": str(rng.randrange(10**9))}]
+        resource["name"] = [{"text": "NOM Prénom", "family": "NOM", "given": ["Prénom"]}]
+        if rng.random() < 0.7:
+            resource["qualification"] = [{"code": {"text": rng.choice(["IDE", "AS", "MED"])}}]
+    elif resource_name == "activites_planifiees":
+        resource["status"] = rng.choice(["booked", "fulfilled", "cancelled"])
+        resource["description"] = rng.choice(["Gym douce", "Chorale", "Peinture", "Loto"])
+        patients = rng.sample(range(N_PATIENTS), rng.randint(1, 5))
+        practitioners = rng.sample(range(N_PRACTITIONERS), rng.randint(0, 2))
+        resource["participant"] = [
+            {
+                "actor": {
+                    "reference": f"Patient/{patient}",
+                    "type": "Patient",
+                    "identifier": {"value": str(patient)},
+                },
+                "status": "accepted",
+            }
+            for patient in patients
+        ] + [
+            {
+                "actor": {"reference": f"Practitioner/{practitioner}", "type": "Practitioner"},
+                "status": "accepted",
+            }
+            for practitioner in practitioners
+        ]
+        start = random_dt(rng)
+        resource["start"] = start.isoformat()
+        resource["end"] = (start + timedelta(minutes=5 * rng.randint(1, 36))).isoformat()
+    elif resource_name == "soins_planifies":
+        resource["status"] = "active"
+        resource["subject"] = subject
+        resource["code"] = {"text": rng.choice(["Toilette", "Pansement", "Prise de sang"])}
+        start = random_dt(rng)
+        p = rng.random()
+        if p < 0.3:
+            end = DT_INF
+        elif p < 0.5:
+            end = start.isoformat()
+        else:
+            end = (start + timedelta(minutes=5 * rng.randint(1, 3000))).isoformat()
+        bounds_period = {"start": start.isoformat(), "end": end}
+        if rng.random() < 0.2:  # Some dates are in UTC
+            bounds_period = {
+                key: value if value == DT_INF else f"{value[:-6]}Z"
+                for key, value in bounds_period.items()
+            }
+        resource["occurrenceTiming"] = {"repeat": {"boundsPeriod": bounds_period}}
+        resource["note"] = [{"text": "Note"}]
+    else:  # Encounters
+        resource["status"] = rng.choice(["planned", "in-progress", "finished"])
+        resource["subject"] = subject
+        start = random_dt(rng)
+        resource["period"] = {"start": start.isoformat()}
+        if resource_name != "sejours":
+            resource["period"]["end"] = (start + timedelta(days=rng.randint(0, 30))).isoformat()
+        resource["type"] = [{"text": rng.choice(["Hospitalisation", "Vacances", "Séjour"])}]
+        if resource_name in {"hospitalisations", "sejours"} and rng.random() < 0.8:
+            resource["serviceProvider"] = organization
+        if resource_name == "sejours":
+            location = {"reference": f"Location/{rng.randrange(N_LOCATIONS)}"}
+            resource["location"] = [{"location": location}]
+        if resource_name == "consultations_specialisees":
+            resource["priority"] = {"text": rng.choice(["urgent", "routine"])}
+            resource["reasonCode"] = [{"text": rng.choice(["Cardiologie", "Dermatologie"])}]
+            resource["hospitalization"] = {"origin": {"display": rng.choice(["a", "b"])}}
+
+    return resource
+
+
+def make_bundle(resource_name: str, n_entries: int, seed: int = 0) -> Dict[str, Any]:
+    """Make a realistic searchset bundle of the resource, as fetched from Hapi Fhir.
+
+    Args:
+        resource_name: Name of the resource, as in `synthetizer.metadata.RESOURCE_NAMES`.
+        n_entries: Number of entries of the bundle.
+        seed: Seed of the random generator, so that the bundle is reproducible.
+
+    Returns:
+        Bundle of the resource.
+    """
+    rng = random.Random(seed)  # nosec
+    entries = []
+    for i in range(n_entries):
+        resource = make_resource(resource_name, i, rng)
+        entries.append(
+            {
+                "fullUrl": f"http://hapi/fhir/{resource['resourceType']}/{i}",
+                "resource": resource,
+                "search": {"mode": "match"},
+            }
+        )
+
+    return {
+        "resourceType": "Bundle",
+        "type": "searchset",
+        "total": n_entries,
+        "link": [{"relation": "self", "url": "http://hapi/fhir"}],
+        "entry": entries,
+    }
@@ -0,0 +1,321 @@
+import contextlib
+import io
+import json
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional
+from unittest import mock
+
+import typer
+
+from benchmarks.bundles import make_bundle
+
+from synthetizer.anonymize import anonymize_entries
+from synthetizer.main import anonymization_pipeline
+from synthetizer.metadata import RESOURCE_NAMES
+from synthetizer.preprocess import preprocess_sampling_data
+from synthetizer.sampling_data import (
+    SamplingData,
+    SpecialDtDurationSamplingData,
+    UniqueCategoricalSamplingData,
+)
+from synthetizer.sources import loads
+from synthetizer.writers import dumps, write_bundle, write_ndjson
+
+DEFAULT_SIZES = [1000, 10000]
+
+
+def copy_bundle(resource_bundle: Dict[str, Any]) -> Dict[str, Any]:
+    """Deep copy a bundle, as the anonymization modifies it in-place."""
+    return loads(dumps(resource_bundle))
+
+
+def measure(
+    func: Callable[..., Any], repeat: int, setup: Optional[Callable[[], Any]] = None
+) -> float:
+    """Output the best duration of `func` over `repeat` runs, `setup` being run untimed before
+    each run, its output being passed to `func` if not None.
+    """
+    durations = []
+    for _ in range(repeat):
+        args = [setup()] if setup is not None else []
+        t0 = time.perf_counter()
+        func(*args)
+        durations.append(time.perf_counter() - t0)
+
+    return min(durations)
+
+
+DEFAULT_RSS_INTERVAL = 0.001
+
+
+def measure_tracemalloc_peak(func: Callable[[], Any]) -> int:
+    """Output the peak of the memory allocated by Python while running `func`, in bytes, as traced
+    by tracemalloc, i.e. without the buffers allocated by C extensions like those of numpy.
+    """
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def get_rss() -> Optional[int]:
+    """Output the current resident set size of the process in bytes, None if it isn't available
+    (i.e. outside of Linux).
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def measure_rss_increase(func: Callable[[], Any], interval: float = DEFAULT_RSS_INTERVAL) -> int:
+    """Output the increase of the resident set size of the process while running `func`, in bytes,
+    which includes all the memory allocated, numpy buffers included, but not the memory reused from
+    what the allocators already hold.
+
+    On Linux, the RSS is sampled every `interval` seconds by a thread, and the increase is the peak
+    of the samples minus the RSS before the run. Elsewhere, it's the increase of the peak RSS of the
+    process, which is 0 if `func` doesn't exceed the peak reached before it.
+    """
+    rss_before = get_rss()
+    if rss_before is None:
+        max_rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        func()
+        # ru_maxrss is in KiB on Linux
+        return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - max_rss_before) * 1024
+
+    peak_rss = rss_before
+    done = threading.Event()
+
+    def sample():
+        nonlocal peak_rss
+        while not done.wait(interval):
+            peak_rss = max(peak_rss, get_rss() or 0)
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    try:
+        func()
+    finally:
+        done.set()
+        sampler.join()
+    peak_rss = max(peak_rss, get_rss() or 0)
+
+    return peak_rss - rss_before
+
+
+def sample_column(sampling_data: SamplingData, size: int, resource_bundle: Dict[str, Any]):
+    """Sample a column of `size` values, as done by `synthetizer.anonymize.anonymize_entries`."""
+    if isinstance(sampling_data, UniqueCategoricalSamplingData):
+        # Distinct values are sampled a few at a time, for each entry
+        n_values = min(2, len(sampling_data.values))
+        for _ in range(size):
+            sampling_data.to_values(sampling_data.sample_many(n_values))
+        return
+
+    kwargs = {}
+    if isinstance(sampling_data, SpecialDtDurationSamplingData):
+        bounds_periods = [
+            entry["resource"]["occurrenceTiming"]["repeat"]["boundsPeriod"]
+            for entry in resource_bundle["entry"][:size]
+        ]
+        kwargs = {
+            "starts": [bounds_period["start"] for bounds_period in bounds_periods],
+            "ends": [bounds_period["end"] for bounds_period in bounds_periods],
+        }
+    sampling_data.to_values(sampling_data.sample_many(size, **kwargs))
+
+
+def run_pipeline(resource_name: str, resource_bundle: Dict[str, Any]):
+    """Run the full anonymization pipeline on the resource, with the fetch stubbed."""
+    with tempfile.TemporaryDirectory() as output_dir, mock.patch(
+        "synthetizer.main.fetch", return_value=resource_bundle
+    ), contextlib.redirect_stdout(io.StringIO()):
+        anonymization_pipeline(resource_names=[resource_name], output_dir=output_dir)
+
+
+def benchmark_resource(
+    resource_name: str, n_entries: int, repeat: int, memory: bool
+) -> List[Dict[str, Any]]:
+    """Benchmark separately each stage of the anonymization of a generated bundle of the resource.
+
+    Args:
+        resource_name: Name of the resource.
+        n_entries: Number of entries of the generated bundle.
+        repeat: Number of runs of each stage, of which the best duration is kept.
+        memory: If True, also measure the memory of each stage, in separate runs: the increase of
+            the RSS of the process (see `measure_rss_increase`) & the peak traced by tracemalloc.
+
+    Returns:
+        Result of each stage, with its duration & number of entries processed per second.
+    """
+    resource_bundle = make_bundle(resource_name, n_entries=n_entries)
+    resource_sampling_data = preprocess_sampling_data(
+        resource_name=resource_name, resource_bundle=resource_bundle, id_suffix=""
+    )
+    anonymized_entries = list(
+        anonymize_entries(
+            resource_name=resource_name,
+            entries=copy_bundle(resource_bundle)["entry"],
+            resource_sampling_data=resource_sampling_data,
+            id_suffix="",
+        )
+    )
+
+    stages: Dict[str, Callable[..., Any]] = {
+        "preprocess": lambda: preprocess_sampling_data(
+            resource_name=resource_name, resource_bundle=resource_bundle, id_suffix=""
+        ),
+        "anonymize": lambda bundle: list(
+            anonymize_entries(
+                resource_name=resource_name,
+                entries=bundle["entry"],
+                resource_sampling_data=resource_sampling_data,
+                id_suffix="",
+            )
+        ),
+        "write_bundle": lambda: write_bundle(anonymized_entries, io.BytesIO()),
+        "write_ndjson": lambda: write_ndjson(anonymized_entries, io.BytesIO()),
+        "pipeline": lambda bundle: run_pipeline(resource_name, bundle),
+    }
+    # The stages which modify the bundle in-place run on copies of it
+    setups = {"anonymize": lambda: copy_bundle(resource_bundle)}
+    setups["pipeline"] = setups["anonymize"]
+
+    # Each sampling data class is timed on all the columns of its class
+    for sampling_data in resource_sampling_data.values():
+        name = f"sample:{type(sampling_data).__name__}"
+        previous = stages.get(name, lambda: None)
+        stages[name] = lambda previous=previous, sampling_data=sampling_data: (
+            previous(),
+            sample_column(sampling_data, n_entries, resource_bundle),
+        )
+
+    results = []
+    for stage, func in stages.items():
+        duration = measure(func, repeat=repeat, setup=setups.get(stage))
+        result = {
+            "resource_name": resource_name,
+            "n_entries": n_entries,
+            "stage": stage,
+            "duration": duration,
+            "entries_per_s": n_entries / duration if duration else 0.0,
+        }
+        if memory:
+            setup = setups.get(stage)
+            args = [setup()] if setup is not None else []
+            result["rss_increase"] = measure_rss_increase(lambda: func(*args))
+            args = [setup()] if setup is not None else []
+            result["tracemalloc_peak"] = measure_tracemalloc_peak(lambda: func(*args))
+        results.append(result)
+
+    return results
+
+
+def compare(
+    results: List[Dict[str, Any]], baseline: List[Dict[str, Any]], tolerance: float
+) -> List[str]:
+    """Compare the results to those of a baseline, and output the regressions, i.e. the stages
+    more than `tolerance` (relatively) slower than in the baseline.
+    """
+    baseline_durations = {
+        (result["resource_name"], result["n_entries"], result["stage"]): result["duration"]
+        for result in baseline
+    }
+    regressions = []
+    for result in results:
+        key = (result["resource_name"], result["n_entries"], result["stage"])
+        if key in baseline_durations and result["duration"] > baseline_durations[key] * (
+            1 + tolerance
+        ):
+            regressions.append(
+                f"{'/'.join(map(str, key))}: {result['duration']:.4f}s instead of "
+                f"{baseline_durations[key]:.4f}s"
+            )
+
+    return regressions
+
+
+def print_results(results: List[Dict[str, Any]]):
+    memory = any("rss_increase" in result for result in results)
+    header = f"{'Resource':<30}{'Entries':>10}  {'Stage':<40}{'Duration (s)':>13}{'Entries/s':>13}"
+    if memory:
+        header += f"{'RSS incr. (MiB)':>17}{'Tracemalloc peak (MiB)':>24}"
+    print(header)
+    for result in results:
+        line = (
+            f"{result['resource_name']:<30}{result['n_entries']:>10}  {result['stage']:<40}"
+            f"{result['duration']:>13.4f}{result['entries_per_s']:>13.1f}"
+        )
+        if memory:
+            line += (
+                f"{result['rss_increase'] / 2**20:>17.1f}"
+                f"{result['tracemalloc_peak'] / 2**20:>24.1f}"
+            )
+        print(line)
+
+
+def run_benchmarks(
+    resource_names: List[str] = RESOURCE_NAMES,
+    sizes: List[int] = DEFAULT_SIZES,
+    repeat: int = 3,
+    memory: bool = False,
+    output: Optional[str] = None,
+    baseline: Optional[str] = None,
+    tolerance: float = 0.2,
+) -> List[Dict[str, Any]]:
+    """Benchmark offline the anonymization of each resource, on generated bundles of each size,
+    with each stage timed separately: the preprocessing, the sampling with each SamplingData
+    class, the anonymization, the serialization & the full pipeline (with the fetch stubbed).
+
+    Args:
+        resource_names: Names of the resources to benchmark.
+        sizes: Numbers of entries of the generated bundles, e.g. from 1000 to 1000000.
+        repeat: Number of runs of each stage, of which the best duration is kept.
+        memory: If True, also measure the memory of each stage, in separate runs: the increase of
+            the RSS of the process, numpy buffers included, & the peak traced by tracemalloc.
+        output: If not None, path of a json file to save the results in, e.g. to use them as a
+            baseline afterwards.
+        baseline: If not None, path of a json file of results saved previously, to compare the
+            results with; the exit code is 1 in case of regression.
+        tolerance: Relative slowdown compared with the baseline above which a stage regressed.
+
+    Returns:
+        Result of each stage.
+    """
+    results = []
+    for n_entries in sizes:
+        for resource_name in resource_names:
+            results.extend(benchmark_resource(resource_name, n_entries, repeat, memory))
+
+    print_results(results)
+    # Peak resident set size of the whole run, in KiB on Linux
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f"Peak RSS of the whole run: {max_rss / 1024:.1f} MiB.")
+
+    if output is not None:
+        with open(output, "w") as f:
+            json.dump({"max_rss": max_rss, "results": results}, f, indent=2)
+
+    if baseline is not None:
+        with open(baseline) as f:
+            regressions = compare(results, json.load(f)["results"], tolerance=tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        if regressions:
+            sys.exit(1)
+
+    return results
+
+
+if __name__ == "__main__":
+    typer.run(run_benchmarks)
@@ -6,6 +6,10 @@ with open("README.md", "r") as f:
 with open("requirements.txt") as f:
     requirements = f.read().splitlines()
 
+# Dependencies needed only to display the sampling data & the progress within notebooks
+with open("requirements-notebook.txt") as f:
+    notebook_requirements = f.read().splitlines()
+
 setup(
     name="synthetizer",
     version="0.1.0",
@@ -15,12 +19,13 @@ setup(
     long_description=long_description,
     long_description_content_type="text/markdown",
     url="https://github.com/arkhn/fhir-synthetizer",
-    packages=find_packages(),
+    packages=find_packages(exclude=["tests", "tests.*", "benchmarks"]),
     install_requires=requirements,
+    extras_require={"notebook": notebook_requirements},
     classifiers=[
         "Programming Language :: Python :: 3",
         "License :: Apache :: 2.0",
         "Operating System :: OS Independent",
     ],
-    python_requires=">=3.6",
+    python_requires=">=3.7",
 )
@@ -3,3 +3,4 @@ from .fetch import fetch
 from .main import anonymization_pipeline
 from .metadata import RESOURCE_NAMES
 from .preprocess import preprocess_sampling_data
+from .push import push_pipeline
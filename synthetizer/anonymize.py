@@ -1,137 +1,243 @@
-import random
-from typing import Any, Dict
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, Optional
 
-from faker import Faker
-from glom import PathAccessError, assign, delete, glom
-from tqdm.notebook import tqdm
+import numpy as np
+from glom import PathAccessError
 
-from synthetizer.metadata import PATHS_DEFAULT_VALUE, PATHS_ID_REF, PATHS_TO_DELETE, PATHS_TO_SAMPLE
+from synthetizer.metadata import PERSON_RESOURCE_NAMES
+from synthetizer.tools.accessors import compile_resource_paths, follow
+from synthetizer.tools.frozen import replace_at
+from synthetizer.tools.instrumentation import count, stage
+from synthetizer.tools.names import get_name_generator
+from synthetizer.tools.progress import make_progress
+from synthetizer.tools.references import ReferenceIndex
 
-fake = Faker("fr_FR")
 
-
-def anonymize(
+def anonymize_entries(
     resource_name: str,
-    resource_bundle: dict,
+    entries: Iterable[dict],
     resource_sampling_data: dict,
     id_suffix: str,
-    verbose: bool = False,
-) -> Dict[str, Any]:
-    """Generate synthetic data starting from `resource_bundle`, by deleting the relevant
-    attributes and modifying in-place other attributes.
+    chunk_size: int = 10000,
+    total: Optional[int] = None,
+    rng: Optional[np.random.Generator] = None,
+    show_progress: bool = True,
+    reference_index: Optional[ReferenceIndex] = None,
+) -> Iterator[Dict[str, Any]]:
+    """Generate synthetic entries starting from `entries`, by deleting the relevant attributes and
+    modifying in-place other attributes. Entries are processed by chunks of `chunk_size`, so that
+    they can be streamed from the input to the output.
+
+    The sampled values are frozen (see `synthetizer.tools.frozen`) and shared between entries,
+    instead of being copied; `thaw` gives mutable copies of them, if needed.
 
     Args:
         resource_name: Name of the input resource.
-        resource_bundle: Bundle of the input resource.
+        entries: Entries of the input resource.
         resource_sampling_data: Sampling data corresponding to the resource.
         id_suffix: Suffix to append to the identifiers, to make sure they are unique.
-        verbose: If True, display information about the current step.
+        chunk_size: Number of entries whose attributes are sampled at once.
+        total: Total number of entries, if known, to display the progress.
+        rng: If not None, random number generator to draw all the samples with, including those
+            of the sampling data, so that the output can be reproduced by seeding it.
+        show_progress: If False, don't display the progress (e.g. for a shard of the entries).
+        reference_index: If not None, index of the resources generated so far, in the namespace
+            `id_suffix`: the references to a type of resources which has been generated, but
+            which point at none of them, are redrawn from the index.
 
     Returns:
-        Input resource, modified in-place to make it anonymous.
+        Anonymous entries, ready to be put in a transaction bundle.
     """
-    if verbose:
-        print("Anonymizing...")
-
     if resource_name == "activites_planifiees":
-        practitioners = resource_sampling_data.pop("practitioners")
-        n_practitioners = resource_sampling_data.pop("n_practitioners")
-        patients = resource_sampling_data.pop("patients")
-        n_patients = resource_sampling_data.pop("n_patients")
-        starts_ends = resource_sampling_data.pop("starts_ends")
+        practitioners = resource_sampling_data["practitioners"]
+        n_practitioners = resource_sampling_data["n_practitioners"]
+        patients = resource_sampling_data["patients"]
+        n_patients = resource_sampling_data["n_patients"]
+        starts_ends = resource_sampling_data["starts_ends"]
+
+    paths = compile_resource_paths(resource_name)
+    if rng is not None:
+        for sampling_data in resource_sampling_data.values():
+            sampling_data.set_rng(rng)
     else:
-        practitioners = None
-        n_practitioners = None
-        patients = None
-        n_patients = None
-        starts_ends = None
-
-    resource = {"entry": resource_bundle["entry"]}
-    n_entries = len(resource["entry"])
-    for i, entry in tqdm(enumerate(resource["entry"]), total=n_entries):
-
-        # Update the ids and refs to add a suffix
-        if resource_name in PATHS_ID_REF:
-            for path in PATHS_ID_REF[resource_name]:
-                try:
-                    assign(resource, path.format(i), f"{glom(resource, path.format(i))}{id_suffix}")
-                except PathAccessError:
-                    pass
-
-        # Delete attributes that must be deleted
-        if resource_name in PATHS_TO_DELETE:
-            for path in PATHS_TO_DELETE[resource_name]:  # type: ignore
-                delete(resource, path.format(i), ignore_missing=True)
-
-        # Sample attributes that must be sampled
-        if resource_name in PATHS_TO_SAMPLE:
-            for path, sampling_data in resource_sampling_data.items():
+        rng = np.random.default_rng()
+
+    def is_dangling(reference: Any) -> bool:
+        if reference_index is None or not isinstance(reference, str):
+            return False
+        resource_type = reference.split("/", 1)[0]
+        return reference_index.covers(
+            resource_type, namespace=id_suffix
+        ) and not reference_index.contains(reference, namespace=id_suffix)
+
+    def redraw(reference: str) -> str:
+        count("redrawn_references")
+        resource_type = reference.split("/", 1)[0]
+        return reference_index.draw(  # type: ignore
+            resource_type, size=1, namespace=id_suffix, rng=rng
+        )[0]
+
+    entries = iter(entries)
+    progress = make_progress(total=total, desc=resource_name, mode=None if show_progress else "off")
+    chunk = list(islice(entries, chunk_size))
+    while chunk:
+        n_entries = len(chunk)
+
+        # Sample at once the whole column of each attribute that must be sampled
+        columns = {}
+        for path, (getter, _, _) in paths["to_sample"].items():
+            sampling_data = resource_sampling_data[path]
+            with stage("anonymize.sample", path=path, sampler=type(sampling_data).__name__):
                 kwargs = {}
                 if (
                     resource_name == "soins_planifies"
                     and path == "entry.{}.resource.occurrenceTiming.repeat.boundsPeriod"
                 ):
-                    bounds_period = glom(resource, path.format(i))
-                    kwargs = {"start": bounds_period["start"], "end": bounds_period["end"]}
-
-                new_value = sampling_data.sample(**kwargs)
+                    bounds_periods = [getter(entry) for entry in chunk]
+                    kwargs = {
+                        "starts": [bounds_period["start"] for bounds_period in bounds_periods],
+                        "ends": [bounds_period["end"] for bounds_period in bounds_periods],
+                    }
+
+                columns[path] = sampling_data.to_values(
+                    sampling_data.sample_many(n_entries, **kwargs)
+                )
+                count("values", n_entries)
 
-                # Unflatten the data which has been flatten previously
-                n_flattens = set(
-                    n_flatten
-                    for path_temp, _, n_flatten in PATHS_TO_SAMPLE[resource_name]
-                    if path == path_temp
+        if resource_name == "activites_planifiees":
+            with stage("anonymize.sample", path="participant"):
+                n_patients_column = n_patients.to_values(n_patients.sample_many(n_entries))
+                n_practitioners_column = n_practitioners.to_values(
+                    n_practitioners.sample_many(n_entries)
+                )
+                starts_ends_column = starts_ends.to_values(starts_ends.sample_many(n_entries))
+
+        if resource_name in PERSON_RESOURCE_NAMES:
+            with stage("anonymize.sample", path="name"):
+                names = get_name_generator().generate(n_entries, rng=rng)
+
+        # The entries of the chunk are modified before being output, so that the time spent
+        # modifying them can be measured apart from the time spent by the consumer
+        anonymous_entries = []
+        with stage("anonymize.entries"):
+            for i, entry in enumerate(chunk):
+
+                # Update the ids and refs to add a suffix
+                for getter, setter in paths["id_ref"]:
+                    try:
+                        setter(entry, f"{getter(entry)}{id_suffix}")
+                    except PathAccessError:
+                        pass
+
+                # Delete attributes that must be deleted
+                for deleter in paths["to_delete"]:
+                    deleter(entry)
+
+                # Set attributes that must be sampled
+                for path, column in columns.items():
+                    _, setter, n_flatten = paths["to_sample"][path]
+                    new_value = column[i]
+
+                    # Unflatten the data which has been flatten previously
+                    for _ in range(n_flatten):
+                        new_value = [new_value]
+
+                    setter(entry, new_value)
+
+                # Set default values
+                for setter, default_value in paths["default_value"]:
+                    setter(entry, default_value)
+
+                # In the case of an appointment, handle participants and periods manually
+                if resource_name == "activites_planifiees":
+                    fake_patients = patients.to_values(patients.sample_many(n_patients_column[i]))
+                    fake_practitioners = practitioners.to_values(
+                        practitioners.sample_many(n_practitioners_column[i])
+                    )
+                    entry["resource"]["participant"] = fake_patients + fake_practitioners
+
+                    fake_start, fake_end = starts_ends_column[i]
+                    entry["resource"]["start"] = fake_start
+                    entry["resource"]["end"] = fake_end
+
+                # Set the random name sampled for persons (patients or practitioners)
+                if resource_name in PERSON_RESOURCE_NAMES:
+                    entry["resource"]["name"] = [names[i]]
+
+                # Redraw the references which point at no generated resource; the sampled values
+                # are shared, so they are replaced copy-on-write
+                if reference_index is not None:
+                    for keys in paths["references"]:
+                        try:
+                            reference = follow(entry, keys)
+                        except PathAccessError:
+                            continue
+                        if is_dangling(reference):
+                            entry = replace_at(entry, keys, redraw)
+
+                    if resource_name == "activites_planifiees":
+                        participants = entry["resource"]["participant"]
+                        for j, participant in enumerate(participants):
+                            if is_dangling(participant["actor"].get("reference")):
+                                participants[j] = replace_at(
+                                    participant, ["actor", "reference"], redraw
+                                )
+
+                # Keep only the desired information
+                resource = entry["resource"]
+                anonymous_entries.append(
+                    {
+                        "resource": resource,
+                        "request": {
+                            "method": "PUT",
+                            "url": f"{resource['resourceType']}/{resource['id']}",
+                        },
+                    }
                 )
-                if len(n_flattens) != 1:
-                    raise ValueError("Not able to retrieve a unique `n_flatten`.")
-                n_flatten = n_flattens.pop()
-                for _ in range(n_flatten):
-                    new_value = [new_value]
+            count("entries", n_entries)
+        yield from anonymous_entries
+        progress.update(n_entries)
 
-                assign(resource, path.format(i), new_value)
+        chunk = list(islice(entries, chunk_size))
+    progress.close()
 
-        # Set default values
-        if resource_name in PATHS_DEFAULT_VALUE:
-            for path, default_value in PATHS_DEFAULT_VALUE[resource_name]:  # type: ignore
-                assign(resource, path.format(i), default_value)
 
-        # In the case of an appointment, handle participants and periods manually
-        if resource_name == "activites_planifiees":
-            n_patient = n_patients.sample()
-            fake_patients = patients.sample(size=n_patient)
-            n_practitioner = n_practitioners.sample()
-            fake_practitioners = practitioners.sample(size=n_practitioner)
-            fake_participants = list(fake_patients) + list(fake_practitioners)
-            assign(resource, f"entry.{i}.resource.participant", fake_participants)
-
-            fake_start, fake_end = starts_ends.sample()
-            assign(resource, f"entry.{i}.resource.start", fake_start)
-            assign(resource, f"entry.{i}.resource.end", fake_end)
-
-        # Sample a random name for persons (patients or practitioners)
-        if resource_name in {"patients_actifs", "practitioner"}:
-            gender = random.choice(["f", "m"])  # nosec
-            n_given_names = random.choices([1, 2, 3], weights=[7, 2, 1], k=1)[0]  # nosec
-            family = fake.last_name().upper()
-            if gender == "f":
-                given = [fake.first_name_female() for _ in range(n_given_names)]
-                prefix = random.choice(["Melle", "Mme"])  # nosec
-            else:
-                given = [fake.first_name_male() for _ in range(n_given_names)]
-                prefix = "M."
-            text = f"{prefix} {family} {', '.join(given)}"
-
-            name = [{"text": text, "family": family, "given": given}]
-            assign(resource, f"entry.{i}.resource.name", name)
+def anonymize(
+    resource_name: str,
+    resource_bundle: dict,
+    resource_sampling_data: dict,
+    id_suffix: str,
+    verbose: bool = False,
+    rng: Optional[np.random.Generator] = None,
+) -> Dict[str, Any]:
+    """Generate synthetic data starting from `resource_bundle`, by deleting the relevant
+    attributes and modifying in-place other attributes.
+
+    Args:
+        resource_name: Name of the input resource.
+        resource_bundle: Bundle of the input resource.
+        resource_sampling_data: Sampling data corresponding to the resource.
+        id_suffix: Suffix to append to the identifiers, to make sure they are unique.
+        verbose: If True, display information about the current step.
+        rng: If not None, random number generator to draw all the samples with.
+
+    Returns:
+        Input resource, modified in-place to make it anonymous.
+    """
+    if verbose:
+        print("Anonymizing...")
 
     # Re-organize the final bundle with the desired information
-    entries = [{"resource": entry["resource"]} for entry in resource["entry"]]
-    for entry in entries:
-        entry["request"] = {
-            "method": "PUT",
-            "url": f"{entry['resource']['resourceType']}/{entry['resource']['id']}",
-        }
-    resource_bundle["entry"] = entries
+    resource_bundle["entry"] = list(
+        anonymize_entries(
+            resource_name=resource_name,
+            entries=resource_bundle["entry"],
+            resource_sampling_data=resource_sampling_data,
+            id_suffix=id_suffix,
+            total=len(resource_bundle["entry"]),
+            rng=rng,
+        )
+    )
 
     final_keys = ["resource_bundle", "entry"]
     final_resource_bundle = {
@@ -0,0 +1,209 @@
+import gzip
+import hashlib
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from synthetizer.fetch import fetch, hapi_fhir_url
+from synthetizer.metadata import REQUESTS
+from synthetizer.sources import loads
+from synthetizer.tools.paths import DATA_PATH
+from synthetizer.writers import dumps
+
+CACHE_PATH = os.path.join(DATA_PATH, "cache")
+
+# Maximum size of the cache on disk, in bytes
+CACHE_MAX_SIZE = 10 * 2**30
+
+# Safety margin taken on the instant of the last update, to cover the clock skew with the server;
+# the resources fetched again are simply merged again
+LAST_UPDATED_MARGIN = timedelta(minutes=5)
+
+
+class BundleCache:
+    """On-disk cache of fetched resource bundles, each one stored in a gzipped json file named after
+    the hash of its request, along with the instant it was last updated. When the cache exceeds
+    `max_size` bytes, the least recently used bundles are evicted.
+    """
+
+    def __init__(self, cache_dir: str = CACHE_PATH, max_size: int = CACHE_MAX_SIZE):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+
+    def key(self, resource_name: str, all_pages: bool, page_size: Optional[int] = None) -> str:
+        """Output the key of a resource bundle, as the hash of the request used to fetch it."""
+        request = (
+            f"{hapi_fhir_url}/{REQUESTS[resource_name]}all_pages={all_pages}&page_size={page_size}"
+        )
+        return hashlib.sha256(request.encode("utf-8")).hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json.gz")
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Output the cached snapshot, with the bundle & the instant it was last updated, if any."""
+        path = self.path(key)
+        try:
+            with gzip.open(path, "rb") as f:
+                snapshot = loads(f.read())
+        except FileNotFoundError:
+            return None
+
+        os.utime(path)  # Mark the snapshot as recently used
+        return snapshot
+
+    def put(self, key: str, snapshot: Dict[str, Any]):
+        """Store a snapshot in the cache, and evict the least recently used ones if needed."""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self.path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with gzip.open(tmp_path, "wb", compresslevel=6) as f:
+            f.write(dumps(snapshot))
+        os.replace(tmp_path, path)  # The snapshot is replaced at once
+
+        self.evict()
+
+    def evict(self):
+        """Remove the least recently used snapshots until the cache fits in `max_size` bytes."""
+        paths = [
+            os.path.join(self.cache_dir, file_name)
+            for file_name in os.listdir(self.cache_dir)
+            if file_name.endswith(".json.gz")
+        ]
+        stats = []
+        for path in paths:
+            try:
+                stats.append((path, os.stat(path)))
+            except FileNotFoundError:  # Removed by another process in the meantime
+                continue
+
+        size = sum(stat.st_size for _, stat in stats)
+        for path, stat in sorted(stats, key=lambda path_stat: path_stat[1].st_mtime):
+            if size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            size -= stat.st_size
+
+
+class SamplerKindCache:
+    """On-disk cache of the kinds of sampling data inferred for the paths to sample of each
+    resource (see `synthetizer.preprocess.compute_sampling_data`), in a json file per resource, so
+    that they are inferred only once across runs. The cache should be cleared if the types of the
+    values of a path change.
+    """
+
+    def __init__(self, cache_dir: str = CACHE_PATH):
+        self.cache_dir = os.path.join(cache_dir, "sampler_kinds")
+
+    def path(self, resource_name: str) -> str:
+        return os.path.join(self.cache_dir, f"{resource_name}.json")
+
+    def get(self, resource_name: str) -> Dict[str, str]:
+        """Output the cached kinds of the paths of the resource, by path."""
+        try:
+            with open(self.path(resource_name), "rb") as f:
+                return loads(f.read())
+        except FileNotFoundError:
+            return {}
+
+    def put(self, resource_name: str, kinds: Dict[str, str]):
+        """Store the kinds of the paths of the resource in the cache."""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self.path(resource_name)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(dumps(kinds))
+        os.replace(tmp_path, path)  # The kinds are replaced at once
+
+
+def merge_entries(entries: List[dict], new_entries: List[dict]) -> List[dict]:
+    """Merge in-place `new_entries` in `entries`, replacing the entries of the same resources, as
+    identified by their type & id.
+    """
+    indices = {
+        (entry["resource"]["resourceType"], entry["resource"].get("id")): i
+        for i, entry in enumerate(entries)
+    }
+    for entry in new_entries:
+        key = (entry["resource"]["resourceType"], entry["resource"].get("id"))
+        if key in indices:
+            entries[indices[key]] = entry
+        else:
+            indices[key] = len(entries)
+            entries.append(entry)
+
+    return entries
+
+
+def fetch_cached(
+    resource_name: str,
+    all_pages: bool = False,
+    verbose: bool = False,
+    page_size: Optional[int] = None,
+    concurrency: int = 1,
+    cache: Optional[BundleCache] = None,
+) -> Dict[str, Any]:
+    """Fetch the input data from Hapi Fhir corresponding to `resource_name` like `fetch`, going
+    through an on-disk cache: if the bundle is cached, only the resources updated since it was
+    last updated are fetched (with `_lastUpdated`), and merged in the cached bundle.
+
+    Only whole bundles (`all_pages=True`) are cached: the first page of the updates wouldn't hold
+    all of them, and would hold resources outside of the cached first page, so the first page is
+    simply fetched again.
+
+    The updated resources are merged by type & id, so the cached bundle may hold resources which
+    no longer belong to it: those deleted from the server since the bundle was cached, and those
+    updated so that they no longer match the filters of the request (e.g. patients which are no
+    longer active, for `Patient?active=true&`), as they aren't part of the fetched updates. The
+    cache should therefore be cleared from time to time.
+
+    Args:
+        resource_name: Name of the resource bundle to fetch.
+        all_pages: If True, get all pages of resources and store them in a list; else, get
+            only the first page (which is far quicker).
+        verbose: If True, display information about the current step.
+        page_size: Number of entries per page; if None, use the server's default.
+        concurrency: Maximum number of pages fetched at the same time.
+        cache: Cache to go through; if None, use the default one.
+
+    Returns:
+        Requested resource bundle.
+    """
+    if not all_pages:
+        return fetch(
+            resource_name=resource_name,
+            all_pages=False,
+            verbose=verbose,
+            page_size=page_size,
+            concurrency=concurrency,
+        )
+
+    if cache is None:
+        cache = BundleCache()
+
+    key = cache.key(resource_name, all_pages=all_pages, page_size=page_size)
+    snapshot = cache.get(key)
+    last_updated = (datetime.now(timezone.utc) - LAST_UPDATED_MARGIN).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+    resource_bundle = fetch(
+        resource_name=resource_name,
+        all_pages=all_pages,
+        verbose=verbose,
+        page_size=page_size,
+        concurrency=concurrency,
+        last_updated=snapshot["last_updated"] if snapshot is not None else None,
+    )
+    entries = resource_bundle.get("entry", [])
+
+    if snapshot is not None:
+        if verbose:
+            print(f"{len(entries)} resources updated since {snapshot['last_updated']}.")
+        entries = merge_entries(snapshot["bundle"]["entry"], entries)
+
+    resource_bundle = {"resourceType": "Bundle", "entry": entries}
+    cache.put(key, {"last_updated": last_updated, "bundle": resource_bundle})
+
+    return resource_bundle
@@ -1,22 +1,305 @@
+import asyncio
 import os
-from typing import Any, Dict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional
+from urllib.parse import parse_qs, urlencode, urlsplit, urlunsplit
 
 import requests  # type: ignore
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter  # type: ignore
 from requests.models import HTTPBasicAuth  # type: ignore
+from urllib3.util.retry import Retry
 
 from .metadata import REQUESTS
+from .tools.instrumentation import count, stage
 
 load_dotenv()  # Take environment variables from .env
 hapi_fhir_url = os.getenv("HAPI_FHIR_URL")
 hapi_fhir_user = os.getenv("HAPI_FHIR_USER")
 hapi_fhir_pwd = os.getenv("HAPI_FHIR_PWD")
 
+# HTTP statuses for which a request is retried, with an exponential backoff
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+def make_session(
+    pool_size: int = 10,
+    retries: int = 3,
+    backoff_factor: float = 0.5,
+    retry_methods: Optional[List[str]] = None,
+) -> requests.Session:
+    """Create a session authenticated on Hapi Fhir, whose connections are kept alive and pooled,
+    and whose requests are retried with an exponential backoff on connection errors and on
+    `RETRY_STATUSES`.
+
+    Args:
+        pool_size: Maximum number of connections kept alive in the pool.
+        retries: Maximum number of retries of a request.
+        backoff_factor: Factor of the exponential backoff between retries, in seconds.
+        retry_methods: HTTP methods which can be retried; if None, only idempotent methods.
+
+    Returns:
+        Session to use for all the requests to Hapi Fhir.
+    """
+    session = requests.Session()
+    if hapi_fhir_user is not None:
+        session.auth = HTTPBasicAuth(hapi_fhir_user, hapi_fhir_pwd or "")
+
+    retry_kwargs: Dict[str, Any] = (
+        {} if retry_methods is None else {"allowed_methods": frozenset(retry_methods)}
+    )
+    max_retries = Retry(
+        total=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=RETRY_STATUSES,
+        raise_on_status=False,
+        **retry_kwargs,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=pool_size, pool_maxsize=pool_size, max_retries=max_retries
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+    return session
+
+
+def get_request_url(
+    resource_name: str, page_size: Optional[int] = None, last_updated: Optional[str] = None
+) -> str:
+    """Output the url of the first page of the resource, with `page_size` entries per page if not
+    None, or the server's default otherwise, and only the resources updated since `last_updated`
+    if not None.
+    """
+    if hapi_fhir_url is None:
+        raise ValueError("Missing environment variable for 'HAPI_FHIR_URL'.")
+
+    request = REQUESTS[resource_name]
+    count = f"_count={page_size}&" if page_size is not None else ""
+    since = f"_lastUpdated=ge{last_updated}&" if last_updated is not None else ""
+
+    return f"{hapi_fhir_url}/{request}{since}{count}_format=json"
+
+
+def get_next_url(page: Dict[str, Any]) -> Optional[str]:
+    """Output the url of the page following `page`, if any."""
+    relations = {link["relation"]: link["url"] for link in page.get("link", [])}
+    return relations.get("next")
+
+
+def get_page_urls(next_url: str, total: int) -> Optional[List[str]]:
+    """Output the urls of all the pages following the first one, computed from the url of the
+    second page, when the server exposes its pages with `_getpages` and `_getpagesoffset`, like
+    Hapi Fhir does, e.g. '<base>?_getpages=<id>&_getpagesoffset=20&_count=20&_bundletype=searchset'.
+
+    Args:
+        next_url: Url of the second page.
+        total: Total number of entries of the resource.
+
+    Returns:
+        Urls of all the pages following the first one; None if they cannot be computed.
+    """
+    url = urlsplit(next_url)
+    query = parse_qs(url.query, keep_blank_values=True)
+    if "_getpages" not in query or "_getpagesoffset" not in query:
+        return None
+
+    offset = int(query["_getpagesoffset"][0])
+    count = int(query["_count"][0]) if "_count" in query else offset
+    if count <= 0:
+        return None
+
+    page_urls = []
+    for page_offset in range(offset, total, count):
+        query["_getpagesoffset"] = [str(page_offset)]
+        page_urls.append(urlunsplit(url._replace(query=urlencode(query, doseq=True))))
+
+    return page_urls
+
+
+def get_page(session: requests.Session, url: str, resource_name: str) -> Dict[str, Any]:
+    """Fetch a single page of a resource with `session`, instrumented as a 'fetch.page' stage."""
+    with stage("fetch.page", resource=resource_name):
+        r = session.get(url)
+        r.raise_for_status()
+        count("bytes", len(r.content))
+        page = r.json()
+        count("entries", len(page.get("entry", [])))
+
+    return page
+
+
+def iter_pages(
+    resource_name: str,
+    all_pages: bool = False,
+    verbose: bool = False,
+    page_size: Optional[int] = None,
+    last_updated: Optional[str] = None,
+) -> Iterator[Dict[str, Any]]:
+    """Fetch the input data from Hapi Fhir corresponding to `resource_name` page by page, yielding
+    each page bundle as soon as it is fetched, so that the full bundle is never held in memory.
+
+    Args:
+        resource_name: Name of the resource bundle to fetch.
+        all_pages: If True, get all pages of resources; else, get only the first page (which is
+            far quicker).
+        verbose: If True, display information about the current step.
+        page_size: Number of entries per page; if None, use the server's default.
+        last_updated: If not None, fetch only the resources updated since this instant.
+
+    Returns:
+        Pages of the requested resource bundle.
+    """
+    if verbose:
+        print("Fetching...")
+
+    url = get_request_url(resource_name, page_size=page_size, last_updated=last_updated)
+
+    # A connection to the server is needed to access the data; it is kept alive for all pages
+    with make_session(pool_size=1) as session:
+        page = get_page(session, url, resource_name=resource_name)
+        print(f"Using request: {REQUESTS[resource_name]}")
+        yield page
+
+        if not all_pages:
+            return
+
+        next_url = get_next_url(page)
+        while next_url is not None:
+            page = get_page(session, next_url, resource_name=resource_name)
+            yield page
+            next_url = get_next_url(page)
+
+
+class AsyncFetcher:
+    """Asynchronous fetcher of Hapi Fhir resources, which fetches several resources and several
+    pages of a resource at once, with at most `concurrency` requests in flight, over a pool of
+    kept-alive connections. The blocking requests are run in a pool of threads, driven by asyncio.
+
+    Must be created within a running event loop.
+    """
+
+    def __init__(self, concurrency: int = 8, page_size: Optional[int] = None):
+        self.page_size = page_size
+        self.session = make_session(pool_size=concurrency)
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+        self.semaphore = asyncio.Semaphore(concurrency)
+
+    async def get_page(self, url: str, resource_name: str) -> Dict[str, Any]:
+        """Fetch a single page; it is fetched & parsed in a thread of the pool."""
+        async with self.semaphore:
+            loop = asyncio.get_event_loop()
+            return await loop.run_in_executor(
+                self.executor, get_page, self.session, url, resource_name
+            )
+
+    async def fetch(
+        self, resource_name: str, all_pages: bool = False, last_updated: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Fetch a resource; when all its pages are needed and the server exposes them with
+        offsets, all the pages following the first one are prefetched concurrently.
+        """
+        url = get_request_url(resource_name, self.page_size, last_updated=last_updated)
+        resource_bundle = await self.get_page(url, resource_name)
+        print(f"Using request: {REQUESTS[resource_name]}")
+
+        if not all_pages:
+            return resource_bundle
+
+        resource_bundle.setdefault("entry", [])
+        next_url = get_next_url(resource_bundle)
+        page_urls = None
+        if next_url is not None and "total" in resource_bundle:
+            page_urls = get_page_urls(next_url, total=resource_bundle["total"])
+
+        if page_urls is not None:
+            pages = await asyncio.gather(
+                *(self.get_page(page_url, resource_name) for page_url in page_urls)
+            )
+            for page in pages:
+                resource_bundle["entry"] += page.get("entry", [])
+        else:
+            # Otherwise, follow the links to the next pages one after another
+            while next_url is not None:
+                page = await self.get_page(next_url, resource_name)
+                resource_bundle["entry"] += page.get("entry", [])
+                next_url = get_next_url(page)
+
+        return resource_bundle
+
+    def close(self):
+        self.executor.shutdown()
+        self.session.close()
+
+
+async def fetch_all_async(
+    resource_names: List[str],
+    all_pages: bool = False,
+    verbose: bool = False,
+    page_size: Optional[int] = None,
+    concurrency: int = 8,
+    last_updated: Optional[str] = None,
+) -> Dict[str, Dict[str, Any]]:
+    """Asynchronous version of `fetch_all`."""
+    if verbose:
+        print("Fetching...")
+
+    fetcher = AsyncFetcher(concurrency=concurrency, page_size=page_size)
+    try:
+        resource_bundles = await asyncio.gather(
+            *(
+                fetcher.fetch(resource_name, all_pages=all_pages, last_updated=last_updated)
+                for resource_name in resource_names
+            )
+        )
+    finally:
+        fetcher.close()
+
+    return dict(zip(resource_names, resource_bundles))
+
+
+def fetch_all(
+    resource_names: List[str],
+    all_pages: bool = False,
+    verbose: bool = False,
+    page_size: Optional[int] = None,
+    concurrency: int = 8,
+    last_updated: Optional[str] = None,
+) -> Dict[str, Dict[str, Any]]:
+    """Fetch concurrently the input data from Hapi Fhir corresponding to all the `resource_names`
+    and output it in a bundle format.
+
+    Args:
+        resource_names: Names of the resource bundles to fetch.
+        all_pages: If True, get all pages of resources and store them in a list; else, get
+            only the first page (which is far quicker).
+        verbose: If True, display information about the current step.
+        page_size: Number of entries per page; if None, use the server's default.
+        concurrency: Maximum number of requests in flight at the same time.
+        last_updated: If not None, fetch only the resources updated since this instant.
+
+    Returns:
+        Requested resource bundles, for each resource name.
+    """
+    return asyncio.run(
+        fetch_all_async(
+            resource_names=resource_names,
+            all_pages=all_pages,
+            verbose=verbose,
+            page_size=page_size,
+            concurrency=concurrency,
+            last_updated=last_updated,
+        )
+    )
+
 
 def fetch(
     resource_name: str,
     all_pages: bool = False,
     verbose: bool = False,
+    page_size: Optional[int] = None,
+    concurrency: int = 1,
+    last_updated: Optional[str] = None,
 ) -> Dict[str, Any]:
     """Fetch the input data from Hapi Fhir corresponding to `resource_name` and output it in a
     bundle format.
@@ -26,40 +309,34 @@ def fetch(
         all_pages: If True, get all pages of resources and store them in a list; else, get
             only the first page (which is far quicker).
         verbose: If True, display information about the current step.
+        page_size: Number of entries per page; if None, use the server's default.
+        concurrency: If above 1, maximum number of pages fetched at the same time with
+            `fetch_all`; else, fetch the pages one after another.
+        last_updated: If not None, fetch only the resources updated since this instant.
 
     Returns:
         Requested resource bundle.
     """
-    if verbose:
-        print("Fetching...")
-
-    if hapi_fhir_url is None:
-        raise ValueError("Missing environment variable for 'HAPI_FHIR_URL'.")
-
-    request = REQUESTS[resource_name]
+    if concurrency > 1:
+        return fetch_all(
+            resource_names=[resource_name],
+            all_pages=all_pages,
+            verbose=verbose,
+            page_size=page_size,
+            concurrency=concurrency,
+            last_updated=last_updated,
+        )[resource_name]
 
-    # A connection to the server is needed to access the data
-    r = requests.get(
-        f"{hapi_fhir_url}/{request}_format=json",
-        auth=HTTPBasicAuth(hapi_fhir_user, hapi_fhir_pwd),
+    pages = iter_pages(
+        resource_name=resource_name,
+        all_pages=all_pages,
+        verbose=verbose,
+        page_size=page_size,
+        last_updated=last_updated,
     )
-    print(f"Using request: {request}")
-
-    resource_bundle = r.json()
-
-    if not all_pages:
-        return resource_bundle
 
-    relations = {
-        k: v for k, v in [(link["relation"], link["url"]) for link in resource_bundle["link"]]
-    }
-    while "next" in relations.keys():
-        next_url = relations["next"]
-        r = requests.get(next_url, auth=HTTPBasicAuth(hapi_fhir_user, hapi_fhir_pwd))
-        new_result = r.json()
-        resource_bundle["entry"] += new_result["entry"]
-        relations = {
-            k: v for k, v in [(link["relation"], link["url"]) for link in new_result["link"]]
-        }
+    resource_bundle = next(pages)
+    for page in pages:
+        resource_bundle["entry"] += page["entry"]
 
     return resource_bundle
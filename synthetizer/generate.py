@@ -0,0 +1,88 @@
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import typer
+
+from synthetizer.main import print_summary
+from synthetizer.metadata import RESOURCE_NAMES
+from synthetizer.models import generate_entries, load_model
+from synthetizer.tools.paths import DATA_PATH, MODELS_PATH
+from synthetizer.tools.utils import derive_seed_sequence
+from synthetizer.writers import write_manifest, write_resource
+
+
+def generation_pipeline(
+    resource_names: List[str] = RESOURCE_NAMES,
+    model_dir: str = MODELS_PATH,
+    scale: float = 1.0,
+    verbose: bool = False,
+    output_dir: Optional[str] = DATA_PATH,
+    output_format: str = "bundle",
+    compression: Optional[str] = None,
+    seed: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """Generation pipeline, which generates synthetic data from the models saved by
+    `synthetizer.main.anonymization_pipeline`, without the input data, before saving them.
+
+    Args:
+        resource_names: Names of the resources to generate.
+        model_dir: Path of the directory where the models are saved.
+        scale: Number of entries generated for each resource, relatively to the number of input
+            entries the model was fitted on, e.g. 10 to generate a dataset 10 times bigger.
+        verbose: If True, display information about the current step.
+        output_dir: Path of the directory to save the outputs in; if None, don't save them.
+        output_format: Format of the outputs, either 'bundle' or 'ndjson', as in
+            `synthetizer.main.anonymization_pipeline`.
+        compression: If not None, compression of the outputs, either 'gzip' or 'zstd'.
+        seed: If not None, seed of the random number generators, to reproduce the outputs
+            exactly; each resource gets its own generator, seeded from `seed` & its name.
+
+    Returns:
+        Summary of the generation of each resource, with its name, number of entries, duration &
+        the description of its output files.
+    """
+    t0 = time.time()
+    seed_sequence = np.random.SeedSequence(seed)
+
+    summaries = []
+    for resource_name in resource_names:
+        t1 = time.time()
+        model = load_model(model_dir=model_dir, resource_name=resource_name)
+        n_entries = round(scale * len(model["ids"]))
+        if verbose:
+            print(f"Generating {n_entries} entries of '{resource_name}'...")
+
+        written = write_resource(
+            resource_name=resource_name,
+            entries=generate_entries(
+                model,
+                n_entries=n_entries,
+                rng=np.random.default_rng(derive_seed_sequence(seed_sequence, resource_name)),
+            ),
+            output_dir=output_dir,
+            output_format=output_format,
+            compression=compression,
+        )
+        summaries.append(
+            {
+                "resource_name": resource_name,
+                "n_entries": written["n_entries"],
+                "duration": time.time() - t1,
+                "output": written["output"],
+            }
+        )
+
+    if output_format == "ndjson" and output_dir is not None:
+        write_manifest(
+            outputs=[output for summary in summaries for output in summary["output"]],
+            output_dir=output_dir,
+        )
+
+    print_summary(summaries, duration=time.time() - t0)
+
+    return summaries
+
+
+if __name__ == "__main__":
+    typer.run(generation_pipeline)
@@ -1,15 +1,328 @@
-import json
-import os
 import time
-from typing import List, Optional
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Callable, Dict, Iterator, List, Optional
 
+import numpy as np
 import typer
 
-from synthetizer.anonymize import anonymize
-from synthetizer.fetch import fetch
-from synthetizer.metadata import RESOURCE_NAMES
-from synthetizer.preprocess import preprocess_sampling_data
+from synthetizer.cache import BundleCache, SamplerKindCache, fetch_cached
+from synthetizer.fetch import fetch, fetch_all, iter_pages
+from synthetizer.metadata import PUSH_ORDER, RESOURCE_NAMES
+from synthetizer.models import fit_model, save_model
+from synthetizer.preprocess import preprocess_sampling_data, preprocess_sampling_data_stream
+from synthetizer.shards import anonymize_sharded
+from synthetizer.sources import DEFAULT_PAGE_SIZE, iter_file_pages, load
+from synthetizer.tools.instrumentation import (
+    METRICS_FORMATS,
+    Instrumentation,
+    NullInstrumentation,
+    count,
+    instrumented,
+    run_instrumented,
+    stage,
+)
 from synthetizer.tools.paths import DATA_PATH
+from synthetizer.tools.references import ReferenceIndex
+from synthetizer.tools.utils import derive_seed_sequence
+from synthetizer.writers import write_manifest, write_resource
+
+
+def iter_resource_pages(
+    resource_name: str,
+    all_pages: bool,
+    verbose: bool,
+    page_size: Optional[int] = None,
+    input_dir: Optional[str] = None,
+) -> Iterator[Dict[str, Any]]:
+    """Iterate over the pages of a resource, either fetched from Hapi Fhir, or read from its file
+    in `input_dir` if not None (in which case all its entries are read).
+    """
+    if input_dir is not None:
+        return iter_file_pages(
+            input_dir=input_dir,
+            resource_name=resource_name,
+            page_size=page_size if page_size is not None else DEFAULT_PAGE_SIZE,
+        )
+
+    return iter_pages(
+        resource_name=resource_name, all_pages=all_pages, verbose=verbose, page_size=page_size
+    )
+
+
+def stream_resource(
+    resource_name: str,
+    id_suffix: str,
+    all_pages: bool,
+    verbose: bool,
+    output_dir: Optional[str],
+    page_size: Optional[int] = None,
+    output_format: str = "bundle",
+    compression: Optional[str] = None,
+    input_dir: Optional[str] = None,
+    seed_sequence: Optional[np.random.SeedSequence] = None,
+    shard_workers: int = 1,
+    replicas: int = 1,
+    reference_index: Optional[ReferenceIndex] = None,
+    kinds: Optional[Dict[str, str]] = None,
+) -> Dict[str, Any]:
+    """Anonymize a resource in two passes over its pages, so that the full bundle is never held
+    in memory: the first pass computes the sampling data, and the second pass anonymizes the
+    entries and writes them as they come.
+
+    Args:
+        resource_name: Name of the resource to anonymize.
+        id_suffix: Suffix to append to all identifiers to make sure they remain unique.
+        all_pages: If False, fetch only the first page of the resource.
+        verbose: If True, display information about the current step.
+        output_dir: Path of the directory to save the output in; if None, don't save it.
+        page_size: Number of entries per fetched page; if None, use the server's default.
+        output_format: Format of the output, among `synthetizer.writers.OUTPUT_FORMATS`.
+        compression: Compression of the output, among `synthetizer.writers.COMPRESSIONS`.
+        input_dir: If not None, path of the directory to read the resource from, instead of
+            fetching it.
+        seed_sequence: Seed sequence of the random number generators with which all the samples
+            are drawn; if None, they are seeded randomly.
+        shard_workers: Number of processes anonymizing the shards of the entries concurrently.
+        replicas: Number of synthetic replicas of the entries to generate.
+        reference_index: If not None, index of the resources generated so far, from which the
+            dangling references are redrawn, and which the generated resources are added to.
+        kinds: Kinds of the sampling data decided previously, updated in-place (see
+            `synthetizer.preprocess.compute_sampling_data`).
+
+    Returns:
+        Number of anonymized entries, along with the description of the output files.
+    """
+    with stage("preprocess"):
+        resource_sampling_data = preprocess_sampling_data_stream(
+            resource_name=resource_name,
+            pages=iter_resource_pages(
+                resource_name=resource_name,
+                all_pages=all_pages,
+                verbose=verbose,
+                page_size=page_size,
+                input_dir=input_dir,
+            ),
+            id_suffix=id_suffix,
+            verbose=verbose,
+            rng=np.random.default_rng(seed_sequence),
+            kinds=kinds,
+        )
+
+    if verbose:
+        print("Anonymizing...")
+
+    pages = iter_resource_pages(
+        resource_name=resource_name,
+        all_pages=all_pages,
+        verbose=verbose,
+        page_size=page_size,
+        input_dir=input_dir,
+    )
+    entries = anonymize_sharded(
+        resource_name=resource_name,
+        entries=(entry for page in pages for entry in page.get("entry", [])),
+        resource_sampling_data=resource_sampling_data,
+        id_suffix=id_suffix,
+        seed_sequence=seed_sequence,
+        workers=shard_workers,
+        replicas=replicas,
+        reference_index=reference_index,
+    )
+
+    with stage("write", format=output_format):
+        written = write_resource(
+            resource_name=resource_name,
+            entries=entries,
+            output_dir=output_dir,
+            output_format=output_format,
+            compression=compression,
+        )
+        count("entries", written["n_entries"])
+
+    return written
+
+
+def process_resource(
+    resource_name: str,
+    id_suffix: str,
+    all_pages: bool,
+    verbose: bool,
+    output_dir: Optional[str],
+    stream: bool,
+    page_size: Optional[int] = None,
+    fetch_concurrency: int = 1,
+    output_format: str = "bundle",
+    compression: Optional[str] = None,
+    input_dir: Optional[str] = None,
+    cache_dir: Optional[str] = None,
+    model_dir: Optional[str] = None,
+    seed_sequence: Optional[np.random.SeedSequence] = None,
+    shard_workers: int = 1,
+    replicas: int = 1,
+    reference_index: Optional[ReferenceIndex] = None,
+    resource_bundle: Optional[dict] = None,
+    pseudonym_key: Optional[bytes] = None,
+) -> Dict[str, Any]:
+    """Fetch, preprocess & anonymize a resource, before saving it in a json file.
+
+    Args:
+        resource_name: Name of the resource to anonymize.
+        id_suffix: Suffix to append to all identifiers to make sure they remain unique.
+        all_pages: If False, fetch only the first page of the resource.
+        verbose: If True, display information about the current step.
+        output_dir: Path of the directory to save the output in; if None, don't save it.
+        stream: If True, process the resource page by page with `stream_resource`.
+        page_size: Number of entries per fetched page; if None, use the server's default.
+        fetch_concurrency: Maximum number of pages fetched at the same time.
+        output_format: Format of the output, among `synthetizer.writers.OUTPUT_FORMATS`.
+        compression: Compression of the output, among `synthetizer.writers.COMPRESSIONS`.
+        input_dir: If not None, path of the directory to read the resource from, instead of
+            fetching it.
+        cache_dir: If not None, path of the directory where the fetched bundles & the inferred
+            kinds of sampling data are cached.
+        model_dir: If not None, path of the directory to save the model of the resource in.
+        seed_sequence: Seed sequence of the random number generators of the resource, with which
+            all its samples are drawn; if None, the generators are seeded randomly.
+        shard_workers: Number of processes anonymizing the shards of the entries concurrently.
+        replicas: Number of synthetic replicas of the entries to generate.
+        reference_index: If not None, index of the resources generated so far, from which the
+            dangling references are redrawn, and which the generated resources are added to.
+        resource_bundle: If not None, already fetched resource bundle, which isn't fetched again.
+        pseudonym_key: Secret key of the pseudonyms of the identifiers in the model, shared by
+            all the resources; if None, a random one is used.
+
+    Returns:
+        Summary of the processing of the resource, with its name, number of entries, duration &
+        the description of its output files.
+    """
+    t0 = time.time()
+
+    if seed_sequence is None:
+        seed_sequence = np.random.SeedSequence()
+    rng = np.random.default_rng(seed_sequence)
+
+    # Kinds of sampling data inferred by the previous runs, for the paths whose kind isn't given
+    kind_cache = SamplerKindCache(cache_dir) if cache_dir is not None else None
+    cached_kinds = kind_cache.get(resource_name) if kind_cache is not None else {}
+    kinds = dict(cached_kinds)
+
+    with stage("resource", resource=resource_name):
+        if stream:
+            written = stream_resource(
+                resource_name=resource_name,
+                id_suffix=id_suffix,
+                all_pages=all_pages,
+                verbose=verbose,
+                output_dir=output_dir,
+                page_size=page_size,
+                output_format=output_format,
+                compression=compression,
+                input_dir=input_dir,
+                seed_sequence=seed_sequence,
+                shard_workers=shard_workers,
+                replicas=replicas,
+                reference_index=reference_index,
+                kinds=kinds,
+            )
+        else:
+            with stage("fetch"):
+                if resource_bundle is None and input_dir is not None:
+                    resource_bundle = load(
+                        input_dir=input_dir, resource_name=resource_name, verbose=verbose
+                    )
+                elif resource_bundle is None and cache_dir is not None:
+                    resource_bundle = fetch_cached(
+                        resource_name=resource_name,
+                        all_pages=all_pages,
+                        verbose=verbose,
+                        page_size=page_size,
+                        concurrency=fetch_concurrency,
+                        cache=BundleCache(cache_dir),
+                    )
+                elif resource_bundle is None:
+                    resource_bundle = fetch(
+                        resource_name=resource_name,
+                        all_pages=all_pages,
+                        verbose=verbose,
+                        page_size=page_size,
+                        concurrency=fetch_concurrency,
+                    )
+                count("entries", len(resource_bundle["entry"]))
+
+            with stage("preprocess"):
+                resource_sampling_data = preprocess_sampling_data(
+                    resource_name=resource_name,
+                    resource_bundle=resource_bundle,
+                    id_suffix=id_suffix,
+                    verbose=verbose,
+                    rng=rng,
+                    kinds=kinds,
+                )
+
+            if model_dir is not None:
+                with stage("model"):
+                    model = fit_model(
+                        resource_name=resource_name,
+                        entries=resource_bundle["entry"],
+                        resource_sampling_data=resource_sampling_data,
+                        id_suffix=id_suffix,
+                        key=pseudonym_key,
+                    )
+                    save_model(model, model_dir=model_dir)
+
+            if verbose:
+                print("Anonymizing...")
+
+            # The anonymized entries are written as they come, without building the output bundle
+            entries = anonymize_sharded(
+                resource_name=resource_name,
+                entries=resource_bundle["entry"],
+                resource_sampling_data=resource_sampling_data,
+                id_suffix=id_suffix,
+                seed_sequence=seed_sequence,
+                workers=shard_workers,
+                total=len(resource_bundle["entry"]),
+                replicas=replicas,
+                reference_index=reference_index,
+            )
+            with stage("write", format=output_format):
+                written = write_resource(
+                    resource_name=resource_name,
+                    entries=entries,
+                    output_dir=output_dir,
+                    output_format=output_format,
+                    compression=compression,
+                )
+                count("entries", written["n_entries"])
+
+    if kind_cache is not None and kinds != cached_kinds:
+        kind_cache.put(resource_name, kinds)
+
+    t1 = time.time()
+    if verbose:
+        print(f"Resources '{resource_name}' done in {round(t1-t0, 3)}s.\n")
+
+    return {
+        "resource_name": resource_name,
+        "n_entries": written["n_entries"],
+        "duration": t1 - t0,
+        "output": written["output"],
+    }
+
+
+def print_summary(summaries: List[Dict[str, Any]], duration: float):
+    """Print the summary of the processing of each resource, along with the total duration."""
+    print(f"{'Resource':<30}{'Entries':>10}{'Duration (s)':>15}{'Entries/s':>12}")
+    for summary in summaries:
+        speed = summary["n_entries"] / summary["duration"] if summary["duration"] else 0
+        print(
+            f"{summary['resource_name']:<30}{summary['n_entries']:>10}"
+            f"{summary['duration']:>15.3f}{speed:>12.1f}"
+        )
+    n_entries = sum(summary["n_entries"] for summary in summaries)
+    cumulated_duration = sum(summary["duration"] for summary in summaries)
+    print(f"{'Total':<30}{n_entries:>10}{duration:>15.3f}")
+    print(f"Cumulated duration of the resources: {round(cumulated_duration, 3)}s.")
 
 
 def anonymization_pipeline(
@@ -18,7 +331,24 @@ def anonymization_pipeline(
     all_pages: bool = True,
     verbose: bool = False,
     output_dir: Optional[str] = DATA_PATH,
-):
+    stream: bool = False,
+    workers: int = 1,
+    shard_workers: int = 1,
+    replicas: int = 1,
+    reference_index: bool = False,
+    page_size: Optional[int] = None,
+    fetch_concurrency: int = 1,
+    output_format: str = "bundle",
+    compression: Optional[str] = None,
+    input_dir: Optional[str] = None,
+    cache_dir: Optional[str] = None,
+    model_dir: Optional[str] = None,
+    metrics_path: Optional[str] = None,
+    metrics_format: str = "json",
+    profile_stages: Optional[List[str]] = None,
+    profile_dir: Optional[str] = None,
+    seed: Optional[int] = None,
+) -> List[Dict[str, Any]]:
     """Full anonymization pipeline, which fetches the resources one by one, preprocess then &
     anonymize them, before saving them in json files.
 
@@ -28,43 +358,198 @@ def anonymization_pipeline(
         all_pages: If False, fetch only the first page of each resource.
         verbose: If True, display information about the current step.
         output_dir: Path of the directory to save the outputs in; if None, don't save them.
+        stream: If True, never hold a full resource bundle in memory, by fetching each resource
+            twice page by page: a first time to compute the sampling data, and a second time to
+            anonymize the entries and write them as they come.
+        workers: Number of processes processing the resources concurrently; if 1, the resources
+            are processed one after another in the current process.
+        shard_workers: Number of processes anonymizing the entries of each resource concurrently,
+            by shards of `synthetizer.shards.SHARD_SIZE` entries, when the resources are processed
+            one after another; it speeds up the anonymization of large resources.
+        replicas: Number of synthetic replicas generated from each resource in a single run,
+            e.g. to scale a dataset up for load tests. The distributions are fitted once, and
+            each replica gets its own identifiers: the first one keeps `id_suffix`, and the k-th
+            following one gets the suffix '<id_suffix>-<k>', along with the references to the
+            resources of its replica.
+        reference_index: If True, generate the resources in dependency order (see
+            `synthetizer.metadata.PUSH_ORDER`), indexing the generated resources in memory, and
+            redraw the references which point at none of the generated resources of their type
+            (e.g. patients fetched partially), so that no transaction is rejected when pushed.
+        page_size: Number of entries per fetched page; if None, use the server's default.
+        fetch_concurrency: Maximum number of pages fetched at the same time; if above 1 and the
+            resources are processed one after another without streaming, all the resources are
+            fetched at once before being processed.
+        output_format: Format of the outputs: 'bundle' for a transaction bundle per resource
+            ('<resource_name>.json'), or 'ndjson' for newline-delimited json, one resource per line,
+            as in the Fhir Bulk Data format ('<resource_name>.ndjson' along with a 'manifest.json').
+        compression: If not None, compression of the outputs, either 'gzip' or 'zstd'.
+        input_dir: If not None, path of a directory to read the resources from instead of fetching
+            them, with a bundle ('<resource_name>.json') or newline-delimited json
+            ('<resource_name>.ndjson') file per resource, possibly compressed with gzip ('.gz').
+        cache_dir: If not None, path of a directory where the fetched bundles are cached, so that
+            only the resources updated since the previous run are fetched again (only with
+            `all_pages`, and not in stream mode); the resources deleted, or updated so that they
+            no longer match the filters of the requests, remain in the cached bundles, so the
+            cache should be cleared from time to time. The kinds of sampling data inferred for the
+            paths whose kind isn't given in `synthetizer.metadata.PATHS_TO_SAMPLE` are cached
+            there as well, so that they are inferred only once.
+        model_dir: If not None, path of a directory to save the model of each resource in, from
+            which synthetic data can then be generated at any scale with
+            `synthetizer.generate.generation_pipeline`, without the input data (not in stream
+            mode).
+        metrics_path: If not None, path of a file to save the metrics of each stage in (see
+            `synthetizer.tools.instrumentation`): its duration with & without its nested stages,
+            counters (e.g. entries & bytes fetched) and peak RSS, for each resource & path. As the
+            entries are anonymized as they are written, the 'anonymize.*' stages are nested in the
+            'write' stage, whose own duration is the serialization.
+        metrics_format: Format of the metrics, among 'json' (a report of each stage), 'prometheus'
+            (a textfile for the node exporter) or 'spans' (the spans of each call of each stage,
+            as in OpenTelemetry).
+        profile_stages: Names of stages to profile with cProfile & tracemalloc, e.g. 'preprocess'
+            or 'anonymize.entries'; their peak memory is added to the metrics.
+        profile_dir: If not None, path of a directory to save the cProfile statistics of the
+            profiled stages in, to be read with `pstats`.
+        seed: If not None, seed of the random number generators, to reproduce the outputs
+            exactly, whatever the numbers of workers; each shard of each resource gets its own
+            generator, seeded from `seed`, the name of the resource & the index of the shard.
+
+    Returns:
+        Summary of the processing of each resource, with its name, number of entries & duration.
     """
-    n_resource_names = len(resource_names)
-    for i, resource_name in enumerate(resource_names):
+    if stream and model_dir is not None:
+        raise ValueError("Models can't be saved in stream mode.")
+    if replicas < 1:
+        raise ValueError("At least one replica must be generated.")
+    if workers > 1 and shard_workers > 1:
+        raise ValueError("Resources and their shards can't both be processed by several workers.")
+    if workers > 1 and reference_index:
+        raise ValueError("The reference index needs the resources to be processed one by one.")
+    if metrics_format not in METRICS_FORMATS:
+        raise ValueError(
+            f"Unknown metrics format '{metrics_format}', must be in {METRICS_FORMATS}."
+        )
 
-        t0 = time.time()
-        if verbose:
-            print(f"Resources {i + 1}/{n_resource_names}: '{resource_name}'...")
+    if metrics_path is not None or profile_stages:
+        instrumentation = Instrumentation(profile_stages=profile_stages, profile_dir=profile_dir)
+    else:
+        instrumentation = NullInstrumentation()
 
-        resource_bundle = fetch(
-            resource_name=resource_name,
-            all_pages=all_pages,
-            verbose=verbose,
+    if reference_index:
+        # The referenced resources are generated first, as the index is built along the way
+        resource_names = sorted(
+            resource_names,
+            key=lambda name: PUSH_ORDER.index(name) if name in PUSH_ORDER else len(PUSH_ORDER),
         )
 
-        resource_sampling_data = preprocess_sampling_data(
-            resource_name=resource_name,
-            resource_bundle=resource_bundle,
-            id_suffix=id_suffix,
-            verbose=verbose,
-        )
+    t0 = time.time()
+    kwargs: Dict[str, Any] = dict(
+        id_suffix=id_suffix,
+        all_pages=all_pages,
+        verbose=verbose,
+        output_dir=output_dir,
+        stream=stream,
+        page_size=page_size,
+        fetch_concurrency=fetch_concurrency,
+        output_format=output_format,
+        compression=compression,
+        input_dir=input_dir,
+        cache_dir=cache_dir,
+        model_dir=model_dir,
+        shard_workers=shard_workers,
+        replicas=replicas,
+        reference_index=ReferenceIndex() if reference_index else None,
+    )
 
-        resource_bundle = anonymize(
-            resource_name=resource_name,
-            resource_bundle=resource_bundle,
-            resource_sampling_data=resource_sampling_data,
-            id_suffix=id_suffix,
-            verbose=verbose,
-        )
+    with instrumented(instrumentation):
+        n_resource_names = len(resource_names)
+        # Each resource gets its own, independent random stream, which only depends on its name
+        seed_sequence = np.random.SeedSequence(seed)
+        seed_sequences = [
+            derive_seed_sequence(seed_sequence, resource_name) for resource_name in resource_names
+        ]
+        if model_dir is not None:
+            # The identifiers are pseudonymized with the same key in the models of all the
+            # resources, so that their references stay consistent; it's derived from the seed,
+            # so that seeded runs output the same models
+            pseudonym_seed_sequence = derive_seed_sequence(seed_sequence, "pseudonyms")
+            kwargs["pseudonym_key"] = pseudonym_seed_sequence.generate_state(4).tobytes()
+        summaries = []
+        if workers == 1:
+            resource_bundles: Dict[str, Dict[str, Any]] = {}
+            if (
+                fetch_concurrency > 1
+                and not stream
+                and input_dir is None
+                and (cache_dir is None or not all_pages)
+            ):
+                with stage("fetch_all"):
+                    resource_bundles = fetch_all(
+                        resource_names=resource_names,
+                        all_pages=all_pages,
+                        verbose=verbose,
+                        page_size=page_size,
+                        concurrency=fetch_concurrency,
+                    )
+
+            for i, (resource_name, resource_seed_sequence) in enumerate(
+                zip(resource_names, seed_sequences)
+            ):
+                if verbose:
+                    print(f"Resources {i + 1}/{n_resource_names}: '{resource_name}'...")
+
+                summaries.append(
+                    process_resource(
+                        resource_name=resource_name,
+                        resource_bundle=resource_bundles.pop(resource_name, None),
+                        seed_sequence=resource_seed_sequence,
+                        **kwargs,
+                    )
+                )
+        else:
+            func: Callable[..., Any] = process_resource
+            func_kwargs: Dict[str, Any] = {}
+            if not isinstance(instrumentation, NullInstrumentation):
+                # Each worker gathers its own metrics, which are then merged
+                func = run_instrumented
+                func_kwargs = dict(
+                    func=process_resource, profile_stages=profile_stages, profile_dir=profile_dir
+                )
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = [
+                    executor.submit(
+                        func,
+                        resource_name=resource_name,
+                        seed_sequence=resource_seed_sequence,
+                        **func_kwargs,
+                        **kwargs,
+                    )
+                    for resource_name, resource_seed_sequence in zip(resource_names, seed_sequences)
+                ]
+                for future in as_completed(futures):
+                    future.result()  # Raise the errors of the workers as they occur
+                    if verbose:
+                        print(f"Resources '{resource_names[futures.index(future)]}' done.")
+                results = [future.result() for future in futures]
+
+            if func is run_instrumented:
+                for _, report in results:
+                    instrumentation.merge(report)
+                results = [summary for summary, _ in results]
+            summaries = results
+
+        if output_format == "ndjson" and output_dir is not None:
+            write_manifest(
+                outputs=[output for summary in summaries for output in summary["output"]],
+                output_dir=output_dir,
+            )
+
+    if metrics_path is not None:
+        instrumentation.save(metrics_path, metrics_format=metrics_format)
+    instrumentation.save_profiles()
 
-        if output_dir is not None:
-            os.makedirs(output_dir, exist_ok=True)
-            with open(os.path.join(output_dir, f"{resource_name}.json"), "w") as f:
-                json.dump(resource_bundle, f, ensure_ascii=False)
+    print_summary(summaries, duration=time.time() - t0)
 
-        t1 = time.time()
-        if verbose:
-            print(f"Resources '{resource_name}' done in {round(t1-t0, 3)}s.\n")
+    return summaries
 
 
 if __name__ == "__main__":
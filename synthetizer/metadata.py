@@ -29,6 +29,24 @@ RESOURCE_NAMES = [
     "practitioner",
 ]
 
+# Order in which the resources are pushed to a Fhir server, so that every resource is pushed after
+# the resources it references
+PUSH_ORDER = [
+    "ehpads",
+    "services",
+    "chambres",
+    "patients_actifs",
+    "sejours",
+    "practitioner",
+    "animations",
+    "soins_planifies",
+    "vacances",
+    "soins",
+    "hospitalisations",
+    "activites_planifiees",
+    "consultations_specialisees",
+]
+
 REQUESTS = {
     # Requêter tous les ehpads
     "ehpads": "Organization?type=C0028688&",
@@ -59,70 +77,99 @@ REQUESTS = {
     "practitioner": "Practitioner?",
 }
 
-# Attributes to sample
-# {resource_name : [(path, spec, n_flatten), ...]}
+# Kinds of sampling data, which can be given explicitly for the attributes to sample: categorical
+# values, unique categorical values (drawn without replacement), datetimes like
+# '2016-11-21T14:45:00+02:00' or {"start": ...}, periods like {"start": ..., "end": ...} or
+# (start, end), and bounds periods of "soins_planifies", whose end can be infinite (`DT_INF`)
+CATEGORICAL = "categorical"
+UNIQUE = "unique"
+DATETIME = "datetime"
+PERIOD = "period"
+BOUNDS_PERIOD = "bounds_period"
+SAMPLER_KINDS = [CATEGORICAL, UNIQUE, DATETIME, PERIOD, BOUNDS_PERIOD]
+
+# Attributes to sample, with the kind of their sampling data; if the kind is omitted, it is
+# inferred from the values
+# {resource_name : [(path, spec, n_flatten[, kind]), ...]}
 PATHS_TO_SAMPLE = {
     "activites_planifiees": [
-        ("entry.{}.resource.status", ("entry", ["resource.status"]), 0),
-        ("entry.{}.resource.description", ("entry", ["resource.description"]), 0),
-        # ("entry.{}.resource.start", ("entry", ["resource.start"]), 0),
-        # ("entry.{}.resource.end", ("entry", ["resource.end"]), 0),
+        ("entry.{}.resource.status", ("entry", ["resource.status"]), 0, CATEGORICAL),
+        ("entry.{}.resource.description", ("entry", ["resource.description"]), 0, CATEGORICAL),
+        # ("entry.{}.resource.start", ("entry", ["resource.start"]), 0, DATETIME),
+        # ("entry.{}.resource.end", ("entry", ["resource.end"]), 0, DATETIME),
     ],
     "soins_planifies": [
-        ("entry.{}.resource.subject", ("entry", ["resource.subject"]), 0),
+        ("entry.{}.resource.subject", ("entry", ["resource.subject"]), 0, CATEGORICAL),
         (
             "entry.{}.resource.occurrenceTiming.repeat.boundsPeriod",
             ("entry", ["resource.occurrenceTiming.repeat.boundsPeriod"]),
             0,
+            BOUNDS_PERIOD,
         ),
     ],
     "hospitalisations": [
-        ("entry.{}.resource.status", ("entry", ["resource.status"]), 0),
-        ("entry.{}.resource.subject", ("entry", ["resource.subject"]), 0),
-        ("entry.{}.resource.period", ("entry", ["resource.period"]), 0),
+        ("entry.{}.resource.status", ("entry", ["resource.status"]), 0, CATEGORICAL),
+        ("entry.{}.resource.subject", ("entry", ["resource.subject"]), 0, CATEGORICAL),
+        ("entry.{}.resource.period", ("entry", ["resource.period"]), 0, PERIOD),
         (
             "entry.{}.resource.serviceProvider",
             ("entry", [Coalesce("resource.serviceProvider", default=None)]),
             0,
+            CATEGORICAL,
         ),
     ],
     "sejours": [
-        ("entry.{}.resource.status", ("entry", ["resource.status"]), 0),
-        ("entry.{}.resource.period", ("entry", ["resource.period"]), 0),
+        ("entry.{}.resource.status", ("entry", ["resource.status"]), 0, CATEGORICAL),
+        ("entry.{}.resource.period", ("entry", ["resource.period"]), 0, PERIOD),
         (
             "entry.{}.resource.serviceProvider",
             ("entry", [Coalesce("resource.serviceProvider", default=None)]),
             0,
+            CATEGORICAL,
         ),
-        ("entry.{}.resource.location", ("entry", ["resource.location"]), 1),
+        ("entry.{}.resource.location", ("entry", ["resource.location"]), 1, CATEGORICAL),
     ],
     "vacances": [
-        ("entry.{}.resource.status", ("entry", ["resource.status"]), 0),
-        ("entry.{}.resource.subject", ("entry", ["resource.subject"]), 0),
-        ("entry.{}.resource.period", ("entry", ["resource.period"]), 0),
+        ("entry.{}.resource.status", ("entry", ["resource.status"]), 0, CATEGORICAL),
+        ("entry.{}.resource.subject", ("entry", ["resource.subject"]), 0, CATEGORICAL),
+        ("entry.{}.resource.period", ("entry", ["resource.period"]), 0, PERIOD),
     ],
     "consultations_specialisees": [
-        ("entry.{}.resource.status", ("entry", ["resource.status"]), 0),
-        ("entry.{}.resource.type", ("entry", [Coalesce("resource.type", default=None)]), 1),
-        ("entry.{}.resource.subject", ("entry", ["resource.subject"]), 0),
-        ("entry.{}.resource.period", ("entry", ["resource.period"]), 0),
-        ("entry.{}.resource.priority", ("entry", ["resource.priority"]), 0),
-        ("entry.{}.resource.hospitalization", ("entry", ["resource.hospitalization"]), 0),
+        ("entry.{}.resource.status", ("entry", ["resource.status"]), 0, CATEGORICAL),
+        (
+            "entry.{}.resource.type",
+            ("entry", [Coalesce("resource.type", default=None)]),
+            1,
+            CATEGORICAL,
+        ),
+        ("entry.{}.resource.subject", ("entry", ["resource.subject"]), 0, CATEGORICAL),
+        ("entry.{}.resource.period", ("entry", ["resource.period"]), 0, PERIOD),
+        ("entry.{}.resource.priority", ("entry", ["resource.priority"]), 0, CATEGORICAL),
+        (
+            "entry.{}.resource.hospitalization",
+            ("entry", ["resource.hospitalization"]),
+            0,
+            CATEGORICAL,
+        ),
     ],
     # "consultations_pedicure": [
-    #     ("entry.{}.resource.status", ("entry", ["resource.status"]), 0),
-    #     ("entry.{}.resource.subject", ("entry", ["resource.subject"]), 0),
-    #     ("entry.{}.resource.period", ("entry", ["resource.period"]), 0),
+    #     ("entry.{}.resource.status", ("entry", ["resource.status"]), 0, CATEGORICAL),
+    #     ("entry.{}.resource.subject", ("entry", ["resource.subject"]), 0, CATEGORICAL),
+    #     ("entry.{}.resource.period", ("entry", ["resource.period"]), 0, PERIOD),
     # ],
     "practitioner": [
         (
             "entry.{}.resource.qualification",
             ("entry", [Coalesce("resource.qualification", default=None)]),
             1,
+            CATEGORICAL,
         )
     ],
 }
 
+# Resources of persons, whose names are sampled with `synthetizer.tools.names`
+PERSON_RESOURCE_NAMES = ["patients_actifs", "practitioner"]
+
 # Attributes that must be deleted
 # {resource_name : [spec, ...]}
 PATHS_TO_DELETE = {
@@ -177,7 +224,12 @@ PATHS_ID_REF = {
     "patients_actifs": [ID, URL, "entry.{}.resource.managingOrganization.reference"],
     "activites_planifiees": [ID, URL],
     "soins_planifies": [ID, URL, "entry.{}.resource.subject.reference"],
-    "hospitalisations": [ID, URL, "entry.{}.resource.serviceProvider.reference"],
+    "hospitalisations": [
+        ID,
+        URL,
+        "entry.{}.resource.subject.reference",
+        "entry.{}.resource.serviceProvider.reference",
+    ],
     "sejours": [
         ID,
         URL,
@@ -0,0 +1,309 @@
+import gzip
+import hashlib
+import hmac
+import os
+import pickle  # nosec
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+from glom import PathAccessError
+
+from synthetizer.anonymize import anonymize_entries
+from synthetizer.metadata import BOUNDS_PERIOD, DT_INF, PATHS_DEFAULT_VALUE, PERSON_RESOURCE_NAMES
+from synthetizer.preprocess import map_sampling_data_references
+from synthetizer.sampling_data import CategoricalSamplingData, SamplingData
+from synthetizer.sources import loads
+from synthetizer.tools.accessors import (
+    Key,
+    compile_resource_paths,
+    follow,
+    split_path,
+)
+from synthetizer.tools.utils import canonical_key
+from synthetizer.writers import dumps
+
+# Version of the format of the models, to refuse to load models saved in another format
+MODEL_VERSION = 5
+
+
+# Attributes of the input resources which are never kept in the templates, wherever they are: the
+# business identifiers, and the names displayed along the references
+DROPPED_KEYS = {"identifier", "display"}
+
+# Size of the pseudonyms of the identifiers, in hexadecimal characters
+PSEUDONYM_LENGTH = 16
+
+
+def pseudonymize(id_: str, key: bytes) -> str:
+    """Output the pseudonym of an identifier, as its HMAC with the secret `key`, so that the
+    identifiers are rewritten consistently across the models fitted with the same key.
+    """
+    return hmac.new(key, id_.encode("utf-8"), hashlib.sha256).hexdigest()[:PSEUDONYM_LENGTH]
+
+
+def pseudonymize_reference(reference: str, key: bytes, id_suffix: str = "") -> str:
+    """Rewrite the identifier of a reference like 'Patient/123' with its pseudonym; if the
+    reference ends with `id_suffix`, the suffix is kept, e.g. 'Patient/123-x' becomes
+    'Patient/<pseudonym of 123>-x'.
+    """
+    if id_suffix and reference.endswith(id_suffix):
+        reference, suffix = reference[: -len(id_suffix)], id_suffix
+    else:
+        suffix = ""
+    resource_type, _, id_ = reference.rpartition("/")
+    pseudonym = pseudonymize(id_, key)
+
+    return f"{resource_type}/{pseudonym}{suffix}" if resource_type else f"{pseudonym}{suffix}"
+
+
+def drop_keys(value: Any) -> Any:
+    """Remove in-place the attributes of `DROPPED_KEYS` from a json-like value, at any depth."""
+    if isinstance(value, dict):
+        for key in DROPPED_KEYS & value.keys():
+            del value[key]
+        for item in value.values():
+            drop_keys(item)
+    elif isinstance(value, list):
+        for item in value:
+            drop_keys(item)
+
+    return value
+
+
+def bounds_period_skeleton(bounds_period: Dict[str, str]) -> Dict[str, str]:
+    """Output the skeleton of a bounds period of "soins_planifies", which keeps only what its
+    sampling data needs: whether its end is infinite, equal to its start, or neither.
+    """
+    if bounds_period["end"] == DT_INF:
+        return {"start": "", "end": DT_INF}
+    elif bounds_period["end"] == bounds_period["start"]:
+        return {"start": "", "end": ""}
+
+    return {"start": "", "end": "-"}
+
+
+def make_templates(
+    resource_name: str,
+    entries: Iterable[dict],
+    resource_sampling_data: Dict[str, SamplingData],
+    key: bytes,
+) -> Dict[str, Any]:
+    """Make the templates of the entries to generate from the input entries, i.e. their skeletons,
+    without any value which is deleted, sampled, set to a default value or renamed when the
+    entries are anonymized, nor any business identifier or displayed name. The identifiers are
+    kept apart as pseudonyms, and the references outside of the sampled values are fitted as
+    categorical sampling data of pseudonyms; each distinct skeleton is kept once, with its count.
+
+    Args:
+        resource_name: Name of the resource.
+        entries: Input entries of the resource.
+        resource_sampling_data: Sampling data computed from the input entries.
+        key: Secret key of the pseudonyms.
+
+    Returns:
+        Serialized templates, to be deserialized when generating entries, along with their
+        counts, the pseudonyms of the identifiers of the entries, and the sampling data of the
+        references, by keys of the references.
+    """
+    paths: Dict[str, Any] = compile_resource_paths(resource_name)
+
+    # The sampled values and the default values are blanked rather than deleted, so that the
+    # setters find their parents when the entries are generated
+    blanked_keys = []
+    for path in paths["to_sample"]:
+        blank = (
+            bounds_period_skeleton if resource_sampling_data[path].kind == BOUNDS_PERIOD else None
+        )
+        blanked_keys.append((split_path(path), blank))
+    for path, _ in PATHS_DEFAULT_VALUE.get(resource_name, []):  # type: ignore
+        blanked_keys.append((split_path(path), None))
+    renamed_keys = []
+    if resource_name in PERSON_RESOURCE_NAMES:
+        renamed_keys.append("name")
+    if resource_name == "activites_planifiees":
+        renamed_keys += ["participant", "start", "end"]
+
+    template_indices: Dict[Any, int] = {}
+    templates: List[bytes] = []
+    counts: List[int] = []
+    ids: List[str] = []
+    references: Dict[Tuple[Key, ...], List[str]] = {}
+    for entry in entries:
+        skeleton = {"resource": loads(dumps(entry["resource"]))}
+        resource = skeleton["resource"]
+        for deleter in paths["to_delete"]:
+            deleter(skeleton)
+        for keys, blank in blanked_keys:
+            try:
+                parent = follow(skeleton, keys[:-1])
+                value = parent[keys[-1]]
+            except (PathAccessError, LookupError, TypeError):
+                continue
+            parent[keys[-1]] = blank(value) if blank is not None else None
+        for renamed_key in renamed_keys:
+            resource.pop(renamed_key, None)
+
+        ids.append(pseudonymize(resource["id"], key))
+        resource["id"] = ""
+        for keys in paths["references"]:
+            try:
+                reference = follow(skeleton, keys)
+            except PathAccessError:
+                continue
+            references.setdefault(tuple(keys), []).append(pseudonymize_reference(reference, key))
+            follow(skeleton, keys[:-1])[keys[-1]] = ""
+
+        drop_keys(skeleton)
+        skeleton_key = canonical_key(skeleton)
+        i = template_indices.get(skeleton_key)
+        if i is None:
+            template_indices[skeleton_key] = len(templates)
+            templates.append(dumps(skeleton))
+            counts.append(1)
+        else:
+            counts[i] += 1
+
+    return {
+        "templates": templates,
+        "template_counts": counts,
+        "ids": ids,
+        "references": {
+            keys: CategoricalSamplingData(values=reference_values)
+            for keys, reference_values in references.items()
+        },
+    }
+
+
+def fit_model(
+    resource_name: str,
+    entries: Iterable[dict],
+    resource_sampling_data: Dict[str, SamplingData],
+    id_suffix: str,
+    key: Optional[bytes] = None,
+) -> Dict[str, Any]:
+    """Gather what is needed to generate entries of the resource without the input data: the
+    sampling data, whose references are pseudonymized, and the templates of the entries (see
+    `make_templates`); it must be done before the input entries are anonymized in-place.
+
+    Args:
+        resource_name: Name of the resource.
+        entries: Input entries of the resource.
+        resource_sampling_data: Sampling data computed from the input entries.
+        id_suffix: Suffix appended to the identifiers in the sampling data.
+        key: Secret key of the pseudonyms of the identifiers, which must be the same for all the
+            resources, so that their references stay consistent; if None, a random one is used.
+
+    Returns:
+        Model of the resource.
+    """
+    if key is None:
+        key = os.urandom(16)
+
+    def pseudonymize_sampled_reference(reference: str) -> str:
+        return pseudonymize_reference(reference, key, id_suffix=id_suffix)  # type: ignore
+
+    return {
+        "version": MODEL_VERSION,
+        "resource_name": resource_name,
+        "id_suffix": id_suffix,
+        "sampling_data": map_sampling_data_references(
+            resource_name, resource_sampling_data, pseudonymize_sampled_reference
+        ),
+        **make_templates(resource_name, entries, resource_sampling_data, key),
+    }
+
+
+def get_model_path(model_dir: str, resource_name: str) -> str:
+    return os.path.join(model_dir, f"{resource_name}.pkl.gz")
+
+
+def save_model(model: Dict[str, Any], model_dir: str) -> str:
+    """Save a model in `model_dir`, in a file named after its resource.
+
+    Args:
+        model: Model to save, as output by `fit_model`.
+        model_dir: Path of the directory to save the model in.
+
+    Returns:
+        Path of the saved model.
+    """
+    os.makedirs(model_dir, exist_ok=True)
+    path = get_model_path(model_dir, model["resource_name"])
+    with gzip.open(path, "wb", compresslevel=6) as f:
+        pickle.dump(model, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    return path
+
+
+def load_model(model_dir: str, resource_name: str) -> Dict[str, Any]:
+    """Load the model of a resource saved with `save_model`; as it is unpickled, it must come from
+    a trusted source.
+
+    Args:
+        model_dir: Path of the directory where the model is saved.
+        resource_name: Name of the resource.
+
+    Returns:
+        Model of the resource.
+    """
+    with gzip.open(get_model_path(model_dir, resource_name), "rb") as f:
+        model = pickle.load(f)  # nosec
+
+    if model.get("version") != MODEL_VERSION:
+        raise ValueError(
+            f"Model of '{resource_name}' has version {model.get('version')}, expected "
+            f"{MODEL_VERSION}; it must be fitted again."
+        )
+
+    return model
+
+
+def generate_entries(
+    model: Dict[str, Any], n_entries: int, rng: Optional[np.random.Generator] = None
+) -> Iterator[Dict[str, Any]]:
+    """Generate synthetic entries from a model, without the input data. Each entry is made from a
+    template drawn according to the counts of the templates, gets the pseudonymized identifiers
+    one after the other, as many times as needed (each time they are used again, a suffix '-<k>'
+    is added to keep them unique), and gets its references drawn from their sampling data.
+
+    Args:
+        model: Model of the resource, as output by `fit_model` or `load_model`.
+        n_entries: Number of entries to generate.
+        rng: If not None, random number generator to draw all the samples with, so that the
+            generated entries can be reproduced by seeding it.
+
+    Returns:
+        Synthetic entries, ready to be put in a transaction bundle.
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+
+    templates, ids = model["templates"], model["ids"]
+    counts = np.array(model["template_counts"], dtype=float)
+    template_indices = rng.choice(len(templates), size=n_entries, p=counts / counts.sum())
+    reference_columns = {}
+    for keys, sampling_data in model["references"].items():
+        sampling_data.set_rng(rng)
+        reference_columns[keys] = sampling_data.to_values(sampling_data.sample_many(n_entries))
+
+    def iter_template_entries() -> Iterator[dict]:
+        for i, j in enumerate(template_indices):
+            entry = loads(templates[j])
+            k, id_index = divmod(i, len(ids))
+            entry["resource"]["id"] = f"{ids[id_index]}-{k}" if k else ids[id_index]
+            for keys, column in reference_columns.items():
+                try:
+                    follow(entry, keys)
+                except PathAccessError:
+                    continue
+                follow(entry, keys[:-1])[keys[-1]] = column[i]
+            yield entry
+
+    return anonymize_entries(
+        resource_name=model["resource_name"],
+        entries=iter_template_entries(),
+        resource_sampling_data=model["sampling_data"],
+        id_suffix=model["id_suffix"],
+        total=n_entries,
+        rng=rng,
+    )
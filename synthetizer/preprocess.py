@@ -1,8 +1,232 @@
-from typing import Dict
+from typing import Any, Callable, Dict, Iterable, List, Optional
 
-from .metadata import PATHS_TO_SAMPLE
-from .sampling_data import SamplingData, to_sampling_data
-from .tools.utils import glom_getter
+import numpy as np
+
+from .metadata import CATEGORICAL, PERIOD, UNIQUE
+from .sampling_data import CategoricalSamplingData, SamplingData, to_sampling_data
+from .tools.accessors import compile_resource_paths
+from .tools.frozen import replace_at
+from .tools.instrumentation import count, stage
+from .tools.utils import flatten
+
+# Names of the values gathered manually in the particular case of "activites_planifiees", along
+# with the kinds of their sampling data
+ACTIVITES_PLANIFIEES_NAMES = {
+    "practitioners": UNIQUE,  # all the practitioners that participate
+    "n_practitioners": CATEGORICAL,  # number of practitioners per activity
+    "patients": UNIQUE,  # all the patients that participate
+    "n_patients": CATEGORICAL,  # number of patients per activity
+    "starts_ends": PERIOD,  # starts and ends of appointments
+}
+
+
+def collect_values(
+    resource_name: str,
+    entries: List[dict],
+    id_suffix: str,
+    values: Optional[Dict[str, List[Any]]] = None,
+) -> Dict[str, List[Any]]:
+    """Collect from `entries` the values needed to compute the sampling data of the resource; this
+    can be done page by page, by passing the values collected so far. The entries are left
+    unchanged: the values which must be modified are modified copy-on-write.
+
+    The entries are walked once, filling the columns of all the paths to sample (and the
+    participants of "activites_planifiees") at the same time.
+
+    Args:
+        resource_name: Name of the resource.
+        entries: Entries of the resource, or of a page of the resource.
+        id_suffix: Suffix to append to the identifiers, if needed.
+        values: Values collected from the previous entries, which are extended in-place; if None,
+            start from scratch.
+
+    Returns:
+        Values collected so far, for each path to sample.
+    """
+    if values is None:
+        values = {}
+
+    paths = compile_resource_paths(resource_name)
+
+    # General case
+    columns = []
+    processed_paths = set()
+    for path, getter, n_flatten in paths["to_collect"]:
+        if path in processed_paths:
+            raise ValueError("Path has already been processed.")
+        processed_paths.add(path)
+
+        # The ids and refs inside the values get the suffix, as they will replace the original ones
+        columns.append(
+            (getter, n_flatten, paths["sampled_id_ref"][path], values.setdefault(path, []))
+        )
+
+    # Deal with the particular case of "activites_planifiees"
+    participants = resource_name == "activites_planifiees"
+    if participants:
+        for name in ACTIVITES_PLANIFIEES_NAMES:
+            if name in paths["to_sample"]:
+                raise ValueError("Name is already taken")
+            values.setdefault(name, [])
+        patients, practitioners = values["patients"], values["practitioners"]
+        n_patients, n_practitioners = values["n_patients"], values["n_practitioners"]
+        starts_ends = values["starts_ends"]
+
+    def add_suffix(ref: str) -> str:
+        return f"{ref}{id_suffix}"
+
+    with stage("preprocess.collect"):
+        for entry in entries:
+            for getter, n_flatten, id_ref_keys, column in columns:
+                value = getter(entry)
+                if n_flatten:
+                    entry_values = flatten(value, n_flatten)
+                    for keys in id_ref_keys:
+                        entry_values = [
+                            replace_at(value, keys, add_suffix) for value in entry_values
+                        ]
+                    column.extend(entry_values)
+                else:
+                    for keys in id_ref_keys:
+                        value = replace_at(value, keys, add_suffix)
+                    column.append(value)
+
+            # Gather manually participants and start/end for appointments
+            if participants:
+                n_pat, n_pract = 0, 0
+                for participant in entry["resource"]["participant"]:
+                    actor = dict(participant["actor"])
+                    actor.pop("identifier", None)
+                    if "reference" in actor:
+                        actor["reference"] += id_suffix
+                    participant = {**participant, "actor": actor}
+                    if actor["type"] == "Patient":
+                        patients.append(participant)
+                        n_pat += 1
+                    elif actor["type"] == "Practitioner":
+                        practitioners.append(participant)
+                        n_pract += 1
+                n_practitioners.append(n_pract)
+                n_patients.append(n_pat)
+
+                # Start / end
+                starts_ends.append((entry["resource"]["start"], entry["resource"]["end"]))
+        count("entries", len(entries))
+
+    return values
+
+
+def map_sampling_data_references(
+    resource_name: str,
+    resource_sampling_data: Dict[str, SamplingData],
+    func: Callable[[str], str],
+) -> Dict[str, SamplingData]:
+    """Output a copy of the sampling data of the resource in which the ids and refs inside the
+    values to sample are mapped with `func`; the fitted distributions are shared, not copied.
+
+    Args:
+        resource_name: Name of the resource.
+        resource_sampling_data: Sampling data of the resource.
+        func: Function mapping a ref to its new value, which must keep the refs distinct.
+
+    Returns:
+        Sampling data whose values have the mapped ids and refs.
+    """
+    paths = compile_resource_paths(resource_name)
+    keys_by_path = dict(paths["sampled_id_ref"])
+    if resource_name == "activites_planifiees":
+        keys_by_path.update(
+            patients=[["actor", "reference"]], practitioners=[["actor", "reference"]]
+        )
+
+    mapped_sampling_data = dict(resource_sampling_data)
+    for path, keys_list in keys_by_path.items():
+        if not keys_list or path not in resource_sampling_data:
+            continue
+
+        sampling_data = resource_sampling_data[path]
+        if not isinstance(sampling_data, CategoricalSamplingData):
+            raise ValueError(f"References of '{path}' can't be mapped in {type(sampling_data)}.")
+
+        def map_value(value: Any, keys_list: List[List[Any]] = keys_list) -> Any:
+            for keys in keys_list:
+                value = replace_at(value, keys, func)
+            return value
+
+        mapped_sampling_data[path] = sampling_data.map_values(map_value)
+
+    return mapped_sampling_data
+
+
+def suffix_sampling_data(
+    resource_name: str, resource_sampling_data: Dict[str, SamplingData], suffix: str
+) -> Dict[str, SamplingData]:
+    """Output a copy of the sampling data of the resource in which `suffix` is appended to the
+    ids and refs inside the values to sample, e.g. to generate a replica of the resource whose
+    identifiers get another suffix; the fitted distributions are shared, not copied.
+
+    Args:
+        resource_name: Name of the resource.
+        resource_sampling_data: Sampling data of the resource.
+        suffix: Suffix to append to the ids and refs of the values, after their current suffix.
+
+    Returns:
+        Sampling data whose values have the suffixed ids and refs.
+    """
+
+    def add_suffix(ref: str) -> str:
+        return f"{ref}{suffix}"
+
+    return map_sampling_data_references(resource_name, resource_sampling_data, add_suffix)
+
+
+def compute_sampling_data(
+    resource_name: str,
+    values: Dict[str, List[Any]],
+    verbose: bool = False,
+    rng: Optional[np.random.Generator] = None,
+    kinds: Optional[Dict[str, str]] = None,
+) -> Dict[str, SamplingData]:
+    """Compute the sampling data of the resource from the values collected by `collect_values`.
+
+    The kind of the sampling data of each path is the one given in the metadata; otherwise, it is
+    taken from `kinds`, or inferred from the values and added to `kinds`.
+
+    Args:
+        resource_name: Name of the resource.
+        values: Values collected for each path to sample.
+        verbose: If True, display information about the current step.
+        rng: Random number generator with which the sampling data draw their samples; if None,
+            each one uses a new one.
+        kinds: Kinds of the sampling data of the paths whose kind isn't given in the metadata, as
+            decided previously (e.g. by a previous run), which is updated in-place.
+
+    Returns:
+        All the sampling data needed for the resource.
+    """
+    resource_sampling_data: Dict[str, SamplingData] = {}
+
+    given_kinds = compile_resource_paths(resource_name)["kinds"]
+    if resource_name == "activites_planifiees":
+        given_kinds = {**given_kinds, **ACTIVITES_PLANIFIEES_NAMES}
+
+    for path, path_values in values.items():
+        with stage("preprocess.fit", path=path):
+            count("values", len(path_values))
+            kind = given_kinds.get(path)
+            if kind is None and kinds is not None:
+                kind = kinds.get(path)
+
+            sampling_data = to_sampling_data(values=path_values, kind=kind, rng=rng)
+            if kinds is not None and path not in given_kinds:
+                kinds[path] = sampling_data.kind  # type: ignore
+            resource_sampling_data[path] = sampling_data
+
+    if verbose:
+        for title, sampling_data in resource_sampling_data.items():
+            sampling_data.display_info(title=f"{resource_name} - {title}")
+
+    return resource_sampling_data
 
 
 def preprocess_sampling_data(
@@ -10,6 +234,8 @@ def preprocess_sampling_data(
     resource_bundle: dict,
     id_suffix: str,
     verbose: bool = False,
+    rng: Optional[np.random.Generator] = None,
+    kinds: Optional[Dict[str, str]] = None,
 ) -> Dict[str, SamplingData]:
     """Compute the relevant sampling data for the input resource bundle.
 
@@ -18,6 +244,10 @@ def preprocess_sampling_data(
         resource_bundle: Resource bundle to preprocess.
         id_suffix: Suffix to append to the identifiers, if needed.
         verbose: If True, display information about the current step.
+        rng: Random number generator with which the sampling data draw their samples; if None,
+            each one uses a new one.
+        kinds: Kinds of the sampling data decided previously, updated in-place (see
+            `compute_sampling_data`).
 
     Returns:
         All the sampling data needed for `resource_bundle`.
@@ -25,74 +255,53 @@ def preprocess_sampling_data(
     if verbose:
         print("Preprocessing...")
 
-    resource = {"entry": resource_bundle["entry"]}
-    n_entries = len(resource["entry"])
-    resource_sampling_data: Dict[str, SamplingData] = {}
+    values = collect_values(
+        resource_name=resource_name,
+        entries=resource_bundle["entry"],
+        id_suffix=id_suffix,
+    )
 
-    # General case
-    if resource_name in PATHS_TO_SAMPLE:
-        for path, spec, n_flatten in PATHS_TO_SAMPLE[resource_name]:
-            if path not in resource_sampling_data:
-                values = glom_getter(
-                    data=resource,
-                    spec=spec,
-                    n_flatten=n_flatten,
-                )
-
-                soins_planifies_bounds_period = (
-                    resource_name == "soins_planifies"
-                    and path == "entry.{}.resource.occurrenceTiming.repeat.boundsPeriod"
-                )
-
-                resource_sampling_data[path] = to_sampling_data(
-                    values=values, soins_planifies_bounds_period=soins_planifies_bounds_period
-                )
-            else:
-                raise ValueError("Path has already been processed.")
+    return compute_sampling_data(
+        resource_name=resource_name, values=values, verbose=verbose, rng=rng, kinds=kinds
+    )
 
-    # Deal with the particular case of "activites_planifiees"
-    if resource_name == "activites_planifiees":
-        for name in ["practitioners", "n_practitioners", "patients", "n_patients", "starts_ends"]:
-            if name in resource_sampling_data:
-                raise ValueError("Name is already taken")
 
-        # First, gather manually participants and start/end for appointments
-        practitioners = []  # all the practitioners that participate
-        n_practitioners = []  # number of practitioners per activity
-        patients = []  # all the patients that participate
-        n_patients = []  # number of patients per activity
-        starts_ends = []  # starts and ends of appointments
-
-        for entry in resource["entry"]:
-            n_pat, n_pract = 0, 0
-            participants = entry["resource"]["participant"]
-            for participant in participants:
-                participant["actor"].pop("identifier", None)
-                if "reference" in participant["actor"]:
-                    participant["actor"]["reference"] += id_suffix
-                if participant["actor"]["type"] == "Patient":
-                    patients.append(participant)
-                    n_pat += 1
-                elif participant["actor"]["type"] == "Practitioner":
-                    practitioners.append(participant)
-                    n_pract += 1
-            n_practitioners.append(n_pract)
-            n_patients.append(n_pat)
-
-            # Start / end
-            starts_ends.append((entry["resource"]["start"], entry["resource"]["end"]))
-
-        resource_sampling_data["practitioners"] = to_sampling_data(practitioners, unique=True)
-        resource_sampling_data["n_practitioners"] = to_sampling_data(n_practitioners)
-        resource_sampling_data["patients"] = to_sampling_data(patients, unique=True)
-        resource_sampling_data["n_patients"] = to_sampling_data(n_patients)
-        resource_sampling_data["starts_ends"] = to_sampling_data(starts_ends)
-
-    for _, sampling_data in resource_sampling_data.items():
-        sampling_data.compute_samples(size=n_entries)
+def preprocess_sampling_data_stream(
+    resource_name: str,
+    pages: Iterable[dict],
+    id_suffix: str,
+    verbose: bool = False,
+    rng: Optional[np.random.Generator] = None,
+    kinds: Optional[Dict[str, str]] = None,
+) -> Dict[str, SamplingData]:
+    """Compute the relevant sampling data for a resource whose bundle is streamed page by page, so
+    that only the values to sample are kept in memory, and not the full bundle.
 
+    Args:
+        resource_name: Name of the resource bundle to preprocess.
+        pages: Pages of the resource bundle, e.g. as output by `synthetizer.fetch.iter_pages`.
+        id_suffix: Suffix to append to the identifiers, if needed.
+        verbose: If True, display information about the current step.
+        rng: Random number generator with which the sampling data draw their samples; if None,
+            each one uses a new one.
+        kinds: Kinds of the sampling data decided previously, updated in-place (see
+            `compute_sampling_data`).
+
+    Returns:
+        All the sampling data needed for the resource.
+    """
     if verbose:
-        for title, sampling_data in resource_sampling_data.items():
-            sampling_data.display_info(title=f"{resource_name} - {title}")
+        print("Preprocessing...")
 
-    return resource_sampling_data
+    values: Dict[str, List[Any]] = {}
+    for page in pages:
+        collect_values(
+            resource_name=resource_name,
+            entries=page.get("entry", []),
+            id_suffix=id_suffix,
+            values=values,
+        )
+
+    return compute_sampling_data(
+        resource_name=resource_name, values=values, verbose=verbose, rng=rng, kinds=kinds
+    )
@@ -0,0 +1,211 @@
+import os
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from itertools import islice
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import requests  # type: ignore
+import typer
+
+from synthetizer.fetch import hapi_fhir_url, make_session
+from synthetizer.metadata import PUSH_ORDER
+from synthetizer.sources import find_resource_file, iter_entries
+from synthetizer.tools.paths import DATA_PATH
+from synthetizer.writers import dumps
+
+
+def to_transaction_entry(entry: dict) -> dict:
+    """Add to an entry read from newline-delimited json, which only holds its resource, the
+    request updating the resource, as in the transaction bundles.
+    """
+    resource = entry["resource"]
+    return {
+        **entry,
+        "request": {"method": "PUT", "url": f"{resource['resourceType']}/{resource['id']}"},
+    }
+
+
+def iter_transaction_chunks(entries: Iterable[dict], chunk_size: int) -> Iterator[dict]:
+    """Split entries, e.g. those of a transaction bundle output by
+    `synthetizer.anonymize.anonymize`, into transaction bundles of at most `chunk_size` entries,
+    as they come.
+
+    Args:
+        entries: Entries to split.
+        chunk_size: Maximum number of entries per transaction.
+
+    Returns:
+        Transaction bundles, each with a chunk of the entries.
+    """
+    entries = iter(entries)
+    chunk = list(islice(entries, chunk_size))
+    while chunk:
+        yield {
+            "entry": chunk,
+            "type": "transaction",
+            "resourceType": "Bundle",
+        }
+        chunk = list(islice(entries, chunk_size))
+
+
+def push_transaction(session: requests.Session, url: str, transaction: dict) -> int:
+    """Post a transaction bundle to a Fhir server, and raise an error if it failed.
+
+    Args:
+        session: Session to post the transaction with.
+        url: Base url of the Fhir server.
+        transaction: Transaction bundle to post.
+
+    Returns:
+        Number of entries pushed.
+    """
+    r = session.post(
+        url,
+        data=dumps(transaction),
+        headers={"Content-Type": "application/fhir+json"},
+    )
+    r.raise_for_status()
+
+    return len(transaction["entry"])
+
+
+def push_resource(
+    session: requests.Session,
+    url: str,
+    resource_name: str,
+    entries: Iterable[dict],
+    chunk_size: int = 1000,
+    concurrency: int = 4,
+    verbose: bool = False,
+) -> Dict[str, Any]:
+    """Push the entries of a resource to a Fhir server, as several transactions of at most
+    `chunk_size` entries, with at most `concurrency` transactions in flight; a failed transaction
+    doesn't stop the others. The transactions are made as the entries come, and at most 2 per
+    worker are held in memory, so that the entries can be streamed from their file.
+
+    Args:
+        session: Session to post the transactions with.
+        url: Base url of the Fhir server.
+        resource_name: Name of the resource to push.
+        entries: Entries of the resource to push.
+        chunk_size: Maximum number of entries per transaction.
+        concurrency: Maximum number of transactions posted at the same time.
+        verbose: If True, display information about the failed transactions.
+
+    Returns:
+        Report of the push of the resource, with its name, number of entries pushed & failed,
+        duration, and the errors which occurred.
+    """
+    t0 = time.time()
+    n_entries, n_failed, errors = 0, 0, []
+
+    transactions = iter_transaction_chunks(entries, chunk_size)
+    futures: Deque[Tuple[int, Future]] = deque()
+
+    def submit(transactions: Iterator[dict]):
+        for transaction in transactions:
+            future = executor.submit(push_transaction, session, url, transaction)
+            futures.append((len(transaction["entry"]), future))
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        submit(islice(transactions, 2 * concurrency))
+        while futures:
+            n_transaction_entries, future = futures.popleft()
+            try:
+                n_entries += future.result()
+            except requests.RequestException as error:
+                n_failed += n_transaction_entries
+                message = str(error)
+                if error.response is not None:
+                    message += f": {error.response.text[:500]}"
+                errors.append(message)
+                if verbose:
+                    print(f"Transaction of '{resource_name}' failed: {message}")
+            submit(islice(transactions, 1))
+
+    return {
+        "resource_name": resource_name,
+        "n_entries": n_entries,
+        "n_failed": n_failed,
+        "duration": time.time() - t0,
+        "errors": errors,
+    }
+
+
+def print_report(reports: List[Dict[str, Any]], duration: float):
+    """Print the report of the push of each resource, along with the total duration."""
+    print(f"{'Resource':<30}{'Entries':>10}{'Failed':>10}{'Duration (s)':>15}{'Entries/s':>12}")
+    for report in reports:
+        speed = report["n_entries"] / report["duration"] if report["duration"] else 0
+        print(
+            f"{report['resource_name']:<30}{report['n_entries']:>10}{report['n_failed']:>10}"
+            f"{report['duration']:>15.3f}{speed:>12.1f}"
+        )
+    n_entries = sum(report["n_entries"] for report in reports)
+    n_failed = sum(report["n_failed"] for report in reports)
+    speed = n_entries / duration if duration else 0
+    print(f"{'Total':<30}{n_entries:>10}{n_failed:>10}{duration:>15.3f}{speed:>12.1f}")
+
+
+def push_pipeline(
+    resource_names: List[str] = PUSH_ORDER,
+    input_dir: str = DATA_PATH,
+    url: Optional[str] = None,
+    chunk_size: int = 1000,
+    concurrency: int = 4,
+    verbose: bool = False,
+) -> List[Dict[str, Any]]:
+    """Push the resources saved by `synthetizer.main.anonymization_pipeline` to a Fhir server, one
+    resource after the other so that the referenced resources are pushed first, each resource
+    being pushed as several concurrent transactions.
+
+    Args:
+        resource_names: Names of the resources to push, in the order they are pushed.
+        input_dir: Path of the directory where the resources are saved, in any of the formats
+            written by `synthetizer.writers.write_resource`; they are read as they are pushed.
+        url: Base url of the Fhir server; if None, use the environment variable 'HAPI_FHIR_URL'.
+        chunk_size: Maximum number of entries per transaction.
+        concurrency: Maximum number of transactions posted at the same time.
+        verbose: If True, display information about the current step.
+
+    Returns:
+        Report of the push of each resource, with its name, number of entries pushed & failed,
+        duration, and the errors which occurred.
+    """
+    url = url if url is not None else hapi_fhir_url
+    if url is None:
+        raise ValueError("Missing environment variable for 'HAPI_FHIR_URL'.")
+
+    t0 = time.time()
+    reports = []
+    # Transactions only contain PUT requests, so posting them again is safe
+    with make_session(pool_size=concurrency, retry_methods=["POST"]) as session:
+        for resource_name in resource_names:
+            if verbose:
+                print(f"Pushing '{resource_name}'...")
+
+            path = find_resource_file(input_dir, resource_name)
+            entries = iter_entries(path)
+            if ".ndjson" in os.path.basename(path):
+                entries = map(to_transaction_entry, entries)
+
+            reports.append(
+                push_resource(
+                    session=session,
+                    url=url,
+                    resource_name=resource_name,
+                    entries=entries,
+                    chunk_size=chunk_size,
+                    concurrency=concurrency,
+                    verbose=verbose,
+                )
+            )
+
+    print_report(reports, duration=time.time() - t0)
+
+    return reports
+
+
+if __name__ == "__main__":
+    typer.run(push_pipeline)
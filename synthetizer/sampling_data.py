@@ -1,21 +1,70 @@
+import copy
 from abc import ABC, abstractmethod
-from datetime import datetime, timedelta
-from typing import Any, Dict, List, Tuple, Union
+from datetime import datetime, tzinfo
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 
-import matplotlib.pyplot as plt
 import numpy as np
-import scipy
-import scipy.stats
 
-from .metadata import DT_INF
-from .tools.utils import int_round
+from .metadata import (
+    BOUNDS_PERIOD,
+    CATEGORICAL,
+    DATETIME,
+    DT_INF,
+    PERIOD,
+    SAMPLER_KINDS,
+    UNIQUE,
+)
+from .tools.alias import AliasTable
+from .tools.buffer import SampleBuffer
+from .tools.datetimes import Dts, format_dts, parse_dts, to_dts
+from .tools.frozen import freeze
+from .tools.utils import deduplicate, int_round
+
+# Number of values on which the kind of sampling data of a column is inferred
+SAMPLER_KIND_PROBE_SIZE = 100
+
+
+def import_pyplot() -> Any:
+    """Import `matplotlib.pyplot` lazily, as it is only needed to display the sampling data, and
+    is an optional dependency (see the 'notebook' extra).
+    """
+    try:
+        import matplotlib.pyplot as plt
+    except ImportError as e:
+        raise ImportError(
+            "matplotlib is needed to display the sampling data, install it with "
+            "`pip install synthetizer[notebook]`."
+        ) from e
+
+    return plt
 
 
 class SamplingData(ABC):
-    """ABC for sampling data. Sampling data is data ready to be sampled, with the `sample`
-    method.
+    """ABC for sampling data. Sampling data is data ready to be sampled, either one value at a
+    time with the `sample` method, or a whole column at once with the `sample_many` method, whose
+    raw output is turned into the final values with `to_values`.
+
+    The samples are drawn with the random number generator `rng`, shared with the nested sampling
+    data, so that they can be reproduced by seeding it.
     """
 
+    # Kind of the sampling data, as given to `to_sampling_data` to build it, if any
+    kind: Optional[str] = None
+
+    def __init__(self, rng: Optional[np.random.Generator] = None):
+        self.rng = rng if rng is not None else np.random.default_rng()
+
+    def set_rng(self, rng: np.random.Generator):
+        """Draw the samples with `rng` from now on, dropping the samples already drawn, e.g. to
+        make the samples drawn from a loaded model reproducible.
+        """
+        self.rng = rng
+        for value in vars(self).values():
+            if isinstance(value, SamplingData):
+                value.set_rng(rng)
+            elif isinstance(value, SampleBuffer):
+                value.clear()
+
     @abstractmethod
     def compute_samples(self, *args, **kwargs):
         pass
@@ -24,6 +73,14 @@ class SamplingData(ABC):
     def sample(self, *args, **kwargs) -> Any:
         pass
 
+    @abstractmethod
+    def sample_many(self, size: int, *args, **kwargs) -> np.ndarray:
+        pass
+
+    def to_values(self, samples: np.ndarray) -> List[Any]:
+        """Convert the output of `sample_many` into a list of values, as output by `sample`."""
+        return samples.tolist()
+
     @abstractmethod
     def display_info(self, title: str):
         pass
@@ -31,26 +88,56 @@ class SamplingData(ABC):
 
 class CategoricalSamplingData(SamplingData):
     """Categorical sampling data is data that is not considered as continuous, and can therefore
-    be sampled with a simple `np.random.choice` call.
+    be sampled with a simple `rng.choice` call.
+
+    Only the distinct values are kept, along with their number of occurrences, from which their
+    indices are drawn in constant time with an alias table. The distinct values are frozen, so
+    that the sampled values can be shared between entries without being copied.
     """
 
-    def __init__(self, values: List[Any]):
-        self.values = values
-        self.samples: List[Any] = []
+    kind = CATEGORICAL
+
+    def __init__(self, values: List[Any], rng: Optional[np.random.Generator] = None):
+        super().__init__(rng=rng)
+        distinct_values, self.counts = deduplicate(values)
+        self.values = [freeze(value) for value in distinct_values]
+        if (self.counts == 1).all():
+            self.alias_table: Optional[AliasTable] = None  # Uniform draws
+        else:
+            self.alias_table = AliasTable(self.counts)
+        self.samples = SampleBuffer(draw=self.draw)  # Buffer of indices of `values`
+
+    def draw(self, size: int) -> np.ndarray:
+        """Draw `size` indices of `values`."""
+        if self.alias_table is None:
+            return self.rng.integers(0, len(self.values), size=size)
+        return self.alias_table.draw(size, rng=self.rng)
 
     def compute_samples(self, size: int = 100, *args, **kwargs):
-        samples = list(np.random.choice(self.values, size=size))
-        self.samples.extend(samples)
+        self.samples.extend(size)
 
     def sample(self, *args, **kwargs) -> Any:
-        try:
-            return self.samples.pop()
-        except IndexError:
-            self.compute_samples()
-            return self.samples.pop()
+        return self.values[int(self.samples.pop())]
+
+    def sample_many(self, size: int, *args, **kwargs) -> np.ndarray:
+        """Sample `size` indices of `values`."""
+        return self.samples.take(size)
+
+    def to_values(self, samples: np.ndarray) -> List[Any]:
+        return [self.values[i] for i in samples]
+
+    def map_values(self, func: Callable[[Any], Any]) -> "CategoricalSamplingData":
+        """Output a copy of the sampling data whose values are mapped with `func`, which must keep
+        them distinct, e.g. to add a suffix to their references; the probabilities are shared.
+        """
+        mapped = copy.copy(self)
+        mapped.values = [freeze(func(value)) for value in self.values]
+        mapped.samples = SampleBuffer(draw=mapped.draw)
+        return mapped
 
     def display_info(self, title: str):
-        plt.hist([str(value) for value in self.values])
+        plt = import_pyplot()
+        plt.hist([str(value) for value in self.values], weights=self.counts)
         plt.xticks([])
         plt.title(title)
         plt.show()
@@ -61,13 +148,27 @@ class UniqueCategoricalSamplingData(CategoricalSamplingData):
     is considered as unique and can therefore not be sampled with replacement.
     """
 
+    kind = UNIQUE
+
+    def __init__(self, values: List[Any], rng: Optional[np.random.Generator] = None):
+        SamplingData.__init__(self, rng=rng)
+        self.values = [freeze(value) for value in values]
+        self.counts = np.ones(len(values), dtype=int)
+        self.alias_table = None
+        self.samples = SampleBuffer(draw=self.draw)
+
     def compute_samples(self, *args, **kwargs):
         pass
 
     def sample(self, size: int, *args, **kwargs) -> Any:  # type: ignore
-        return list(np.random.choice(self.values, size=size, replace=False))
+        return self.to_values(self.sample_many(size))
+
+    def sample_many(self, size: int, *args, **kwargs) -> np.ndarray:
+        """Sample `size` distinct indices of `values`."""
+        return self.rng.choice(len(self.values), size=size, replace=False)
 
     def display_info(self, title: str):
+        plt = import_pyplot()
         plt.hist([str(value) for value in self.values])
         plt.xticks([])
         plt.title(title)
@@ -75,61 +176,84 @@ class UniqueCategoricalSamplingData(CategoricalSamplingData):
 
 
 class ContinuousSamplingData(SamplingData):
-    """Continuous sampling data is data that is sampled through a probability density function."""
+    """Continuous sampling data is data that is sampled through a probability density function.
+
+    The integers in [0, `max_value`) are drawn by inverting the cumulative distribution function:
+    when `max_value` is below `MAX_CDF_SIZE`, the discrete cumulative distribution is computed
+    once and searched for each draw; otherwise, the fitted distribution, truncated to the range,
+    is inverted directly so that the memory doesn't depend on `max_value`.
+
+    The values themselves are not kept, only their histogram, for display.
+    """
+
+    MAX_CDF_SIZE = 100000
+
+    def __init__(self, values: List[Any], rng: Optional[np.random.Generator] = None):
+        import scipy.stats  # Imported lazily, as it is slow to import
 
-    def __init__(self, values: List[Any]):
-        self.values = scipy.stats.trimboth(values, proportiontocut=0.03)  # Remove outliers
+        super().__init__(rng=rng)
+        trimmed_values = scipy.stats.trimboth(values, proportiontocut=0.03)  # Remove outliers
         self.min_value = min(values)
         self.max_value = max(values)
-        self.samples: List[Any] = []
+        self.samples = SampleBuffer(draw=self.draw)
 
         if self.min_value != self.max_value:  # General case
-            self.x = np.arange(0, self.max_value)
-            dist = scipy.stats.norm
-            params = dist.fit(self.values)
-            arg = params[:-2]
-            loc = params[-2]
-            scale = params[-1]
-
-            if arg:
-                pdf = dist.pdf(self.x, *arg, loc=loc, scale=scale)
+            self.histogram = np.histogram(trimmed_values, bins=50)
+            self.dist = scipy.stats.norm
+            self.params = self.dist.fit(trimmed_values)
+
+            if self.max_value <= self.MAX_CDF_SIZE:
+                cdf = np.cumsum(self.pdf(np.arange(0, self.max_value)))
+                self.cdf: Optional[np.ndarray] = cdf / cdf[-1]
             else:
-                pdf = dist.pdf(self.x, loc=loc, scale=scale)
-            self.pdf = pdf
+                # Bounds of the cumulative distribution, in which uniform draws are made
+                self.cdf = None
+                self.cdf_bounds = self.dist.cdf([-0.5, self.max_value - 0.5], *self.params)
         else:  # Case where there is only one value
-            self.x = None
-            self.pdf = None
+            self.histogram = np.histogram(trimmed_values)
+            self.params = None
+
+    def pdf(self, x: np.ndarray) -> np.ndarray:
+        """Probability density function of the fitted distribution."""
+        return self.dist.pdf(x, *self.params)
+
+    def draw(self, size: int) -> np.ndarray:
+        """Draw `size` integers from the probability density function."""
+        if self.params is None:  # Case where there is only one value
+            return np.full(size, self.min_value, dtype=int)
+
+        if self.cdf is not None:
+            return np.searchsorted(self.cdf, self.rng.random(size), side="right")
+        else:
+            low, high = self.cdf_bounds
+            uniforms = self.rng.uniform(low, high, size=size)
+            samples = np.rint(self.dist.ppf(uniforms, *self.params)).astype(int)
+            return np.clip(samples, 0, self.max_value - 1)
 
     def compute_samples(self, size: int = 100, *args, **kwargs):
-        if self.pdf is not None:  # General case
-            samples = list(np.random.choice(self.x, p=self.pdf / np.sum(self.pdf), size=size))
-        else:  # Case where there is only one value
-            samples = [self.values[0] for _ in range(size)]
-        self.samples.extend(samples)
+        self.samples.extend(size)
 
     def sample(self, *args, **kwargs) -> Any:
-        try:
-            sample = self.samples.pop()
-        except IndexError:
-            self.compute_samples()
-            sample = self.samples.pop()
+        return int(self.samples.pop())
 
-        return int(sample)
+    def sample_many(self, size: int, *args, **kwargs) -> np.ndarray:
+        return self.samples.take(size)
 
     def display_info(self, title: str):
-        if self.pdf is not None:  # General case
-            bins = 50
-
+        plt = import_pyplot()
+        counts, bins = self.histogram
+        if self.params is not None:  # General case
             fig, ax1 = plt.subplots()
             color1 = "tab:blue"
-            ax1.hist(self.values, bins=bins, color=color1)
+            ax1.hist(bins[:-1], bins=bins.tolist(), weights=counts, color=color1)
             ax1.set_ylabel("count", color=color1)
             ax1.tick_params(axis="y", labelcolor=color1)
             ax1.set_ylim(bottom=0)
 
             ax2 = ax1.twinx()
             color2 = "tab:red"
-            ax2.plot(self.pdf, color=color2)
+            x = np.linspace(0, self.max_value - 1, num=min(self.max_value, 1000))
+            ax2.plot(x, self.pdf(x), color=color2)
             ax2.set_ylabel("pdf", color=color2)
             ax2.tick_params(axis="y", labelcolor=color2)
             ax2.set_ylim(bottom=0)
@@ -139,7 +263,7 @@ class ContinuousSamplingData(SamplingData):
         else:  # Case where there is only one value
             fig, ax1 = plt.subplots()
             color1 = "tab:blue"
-            ax1.hist(self.values, color=color1)
+            ax1.hist(bins[:-1], bins=bins.tolist(), weights=counts, color=color1)
             ax1.set_ylabel("count", color=color1)
             ax1.tick_params(axis="y", labelcolor=color1)
             ax1.set_ylim(bottom=0)
@@ -154,43 +278,56 @@ class DtSamplingData(SamplingData):
     one for the time of the day & the other one for the date.
     """
 
-    def __init__(self, dts: List[datetime], mode: str):
+    kind = DATETIME
+
+    def __init__(
+        self,
+        dts: Union[List[datetime], Dts],
+        mode: str,
+        rng: Optional[np.random.Generator] = None,
+    ):
+        super().__init__(rng=rng)
+        if not isinstance(dts, Dts):
+            dts = to_dts(dts)
         self.mode = mode
-        self.tz_info = dts[0].tzinfo  # Assume all the dates have the same timezone
-        dates = [dt.date() for dt in dts]
-        self.min_date = min(dates)
-        days = [(date - self.min_date).days for date in dates]
-        self.days_sampling_data = ContinuousSamplingData(days)
+        self.tz_info = dts.tz_info  # Assume all the dates have the same timezone
+        self.unit = dts.unit  # Dates are output as dates, datetimes as datetimes
+        dates = dts.local.astype("datetime64[D]")
+        min_date = dates.min()
+        self.min_date = min_date.astype(object)
+        days = (dates - min_date).astype(int).tolist()
+        self.days_sampling_data = ContinuousSamplingData(days, rng=self.rng)
 
-        minutes = [dt.time().hour * 60 + dt.time().minute for dt in dts]
-        self.minutes_sampling_data = ContinuousSamplingData(minutes)
+        minutes = ((dts.local - dates) // np.timedelta64(1, "m")).astype(int).tolist()
+        self.minutes_sampling_data = ContinuousSamplingData(minutes, rng=self.rng)
 
     def compute_samples(self, size: int = 100, *args, **kwargs):
         self.days_sampling_data.compute_samples(size=size)
         self.minutes_sampling_data.compute_samples(size=size)
 
-    def sample_dt(self) -> datetime:
-        day = self.days_sampling_data.sample()
-        minute = self.minutes_sampling_data.sample()
-        minute = int_round(minute, n=5)  # Round to 5 minutes
-
-        min_dt = datetime(
-            year=self.min_date.year,
-            month=self.min_date.month,
-            day=self.min_date.day,
-            tzinfo=self.tz_info,
+    def sample(self, *args, **kwargs) -> Union[str, Dict[str, str]]:
+        # Output has format '2016-12-05T14:40:00+02:00' or {"start": '2016-12-05T14:40:00+02:00'}
+        return self.to_values(self.sample_many(1))[0]
+
+    def sample_many(self, size: int, *args, **kwargs) -> np.ndarray:
+        """Sample `size` datetimes, as a `datetime64` array of local times in `tz_info`."""
+        days = self.days_sampling_data.sample_many(size)
+        minutes = self.minutes_sampling_data.sample_many(size)
+        minutes = int_round(minutes, n=5)  # Round to 5 minutes
+
+        return (
+            np.datetime64(self.min_date, "m")
+            + days.astype("timedelta64[D]")
+            + minutes.astype("timedelta64[m]")
         )
-        dt = min_dt + timedelta(days=day, minutes=minute)
-        return dt
 
-    def sample(self, *args, **kwargs) -> Union[str, Dict[str, str]]:
-        dt = self.sample_dt()
-        dt_str = dt.isoformat()
+    def to_values(self, samples: np.ndarray) -> List[Any]:
+        dt_strs = format_dts(samples, tz_info=self.tz_info, unit=self.unit).tolist()
 
         if self.mode == "str":
-            return dt_str  # Output has format '2016-12-05T14:40:00+02:00'
+            return dt_strs
         elif self.mode == "dict":
-            return {"start": dt_str}  # Output has format {"start": '2016-12-05T14:40:00+02:00'}
+            return [{"start": dt_str} for dt_str in dt_strs]
         else:
             raise ValueError("Invalid mode provided.")
 
@@ -205,32 +342,51 @@ class DtDurationSamplingData(SamplingData):
     distinct continuous sampling data: one for the start date & the other one for the duration.
     """
 
-    def __init__(self, dt_pairs: List[Tuple[datetime, datetime]], mode: str):
+    kind = PERIOD
+
+    def __init__(
+        self,
+        dt_pairs: Union[List[Tuple[datetime, Union[str, datetime]]], Tuple[Dts, Dts]],
+        mode: str,
+        rng: Optional[np.random.Generator] = None,
+    ):
+        super().__init__(rng=rng)
         self.mode = mode
-        start_dts = [dt_pair[0] for dt_pair in dt_pairs]
-        self.start_dts_sampling_data = DtSamplingData(start_dts, mode="str")
+        start_dts, end_dts = to_dt_pairs(dt_pairs)
+        self.start_dts_sampling_data = DtSamplingData(start_dts, mode="str", rng=self.rng)
 
-        second_durations = [(dt_pair[1] - dt_pair[0]).total_seconds() for dt_pair in dt_pairs]
-        minute_durations = [round(duration / 60) for duration in second_durations]
-        self.durations_sampling_data = ContinuousSamplingData(minute_durations)
+        second_durations = (end_dts.instants - start_dts.instants).astype(int)
+        minute_durations = np.round(second_durations / 60).astype(int).tolist()
+        self.durations_sampling_data = ContinuousSamplingData(minute_durations, rng=self.rng)
 
     def compute_samples(self, size: int = 100, *args, **kwargs):
         self.start_dts_sampling_data.compute_samples(size=size)
         self.durations_sampling_data.compute_samples(size=size)
 
     def sample(self, *args, **kwargs) -> Union[Tuple[str, str], Dict[str, str]]:
-        start_dt = self.start_dts_sampling_data.sample_dt()
-        duration = -1
-        while duration < 0:
-            duration = self.durations_sampling_data.sample()
-            duration = int_round(duration, n=5)  # Round to 5 minutes
+        return self.to_values(self.sample_many(1))[0]
 
-        end_dt = start_dt + timedelta(minutes=duration)
+    def sample_many(self, size: int, *args, **kwargs) -> np.ndarray:
+        """Sample `size` (start, end) pairs, as a `datetime64` array of shape (size, 2)."""
+        start_dts = self.start_dts_sampling_data.sample_many(size)
+        durations = self.durations_sampling_data.sample_many(size)
+        negatives = durations < 0
+        while negatives.any():
+            durations[negatives] = self.durations_sampling_data.sample_many(negatives.sum())
+            negatives = durations < 0
+        durations = int_round(durations, n=5)  # Round to 5 minutes
+
+        return np.stack([start_dts, start_dts + durations.astype("timedelta64[m]")], axis=1)
+
+    def to_values(self, samples: np.ndarray) -> List[Any]:
+        tz_info, unit = self.start_dts_sampling_data.tz_info, self.start_dts_sampling_data.unit
+        start_strs = format_dts(samples[:, 0], tz_info=tz_info, unit=unit).tolist()
+        end_strs = format_dts(samples[:, 1], tz_info=tz_info, unit=unit).tolist()
 
         if self.mode == "tuple":
-            return start_dt.isoformat(), end_dt.isoformat()
+            return list(zip(start_strs, end_strs))
         elif self.mode == "dict":
-            return {"start": start_dt.isoformat(), "end": end_dt.isoformat()}
+            return [{"start": start, "end": end} for start, end in zip(start_strs, end_strs)]
         else:
             raise ValueError("Invalid mode provided.")
 
@@ -242,18 +398,25 @@ class DtDurationSamplingData(SamplingData):
 class SpecialDtDurationSamplingData(SamplingData):
     """Special datetime sampling data in the particular case of the "soins_planifies" resource."""
 
-    def __init__(self, dt_pairs: List[Tuple[datetime, Union[str, datetime]]]):
-        start_dts = []
-        start_end_dts = []
-        for start, end in dt_pairs:
-            if end == DT_INF or start == end:
-                start_dts.append(start)
-            else:
-                start_end_dts.append((start, end))
+    kind = BOUNDS_PERIOD
 
-        self.start_dts_sampling_data = DtSamplingData(start_dts, mode="str")
+    def __init__(
+        self,
+        dt_pairs: Union[List[Tuple[datetime, Union[str, datetime]]], Tuple[Dts, Dts]],
+        rng: Optional[np.random.Generator] = None,
+    ):
+        super().__init__(rng=rng)
+        start_dts, end_dts = to_dt_pairs(dt_pairs)  # Infinite ends are NaT
+
+        # Only the start is sampled when the end is infinite or equal to the start
+        start_only = np.isnat(end_dts.local) | (start_dts.instants == end_dts.instants)
+        self.start_dts_sampling_data = DtSamplingData(
+            start_dts.subset(start_only), mode="str", rng=self.rng
+        )
         self.start_end_dts_sampling_data = DtDurationSamplingData(
-            dt_pairs=start_end_dts, mode="dict"  # type: ignore
+            dt_pairs=(start_dts.subset(~start_only), end_dts.subset(~start_only)),
+            mode="dict",
+            rng=self.rng,
         )
 
     def compute_samples(self, size: int = 100, *args, **kwargs):
@@ -262,83 +425,215 @@ class SpecialDtDurationSamplingData(SamplingData):
 
     def sample(self, *args, **kwargs) -> Union[Tuple[str, str], Dict[str, str]]:
         # In the case where the end date is infinite or equal to the start date, we only sample a
-        # start date
-        if kwargs["end"] == DT_INF:
-            start_dt = self.start_dts_sampling_data.sample_dt()
-            return {"start": start_dt.isoformat(), "end": DT_INF}
-        elif kwargs["start"] == kwargs["end"]:
-            start_dt = self.start_dts_sampling_data.sample_dt()
-            return {"start": start_dt.isoformat(), "end": start_dt.isoformat()}
-        # Otherwise, we sample a duration
-        else:
-            return self.start_end_dts_sampling_data.sample()
+        # start date; otherwise, we sample a duration
+        samples = self.sample_many(1, starts=[kwargs["start"]], ends=[kwargs["end"]])
+        return self.to_values(samples)[0]
+
+    def sample_many(  # type: ignore
+        self, size: int, starts: List[str], ends: List[str], *args, **kwargs
+    ) -> np.ndarray:
+        """Sample `size` (start, end) pairs, as a `datetime64` array of shape (size, 2), given the
+        original `starts` and `ends` of the periods; infinite ends are sampled as `NaT`.
+        """
+        ends_inf = np.array([end == DT_INF for end in ends], dtype=bool)
+        ends_start = (
+            np.array([start == end for start, end in zip(starts, ends)], dtype=bool) & ~ends_inf
+        )
+        durations = ~(ends_inf | ends_start)
+
+        samples = np.empty((size, 2), dtype="datetime64[m]")
+        start_dts = self.start_dts_sampling_data.sample_many(size - durations.sum())
+        samples[~durations, 0] = start_dts
+        samples[~durations, 1] = np.where(ends_inf[~durations], np.datetime64("NaT"), start_dts)
+        samples[durations] = self.start_end_dts_sampling_data.sample_many(durations.sum())
+
+        return samples
+
+    def to_values(self, samples: np.ndarray) -> List[Any]:
+        tz_info, unit = self.start_dts_sampling_data.tz_info, self.start_dts_sampling_data.unit
+        start_strs = format_dts(samples[:, 0], tz_info=tz_info, unit=unit).tolist()
+        end_strs = format_dts(samples[:, 1], tz_info=tz_info, unit=unit).tolist()
+
+        return [
+            {"start": start, "end": end if not np.isnat(end_dt) else DT_INF}
+            for start, end, end_dt in zip(start_strs, end_strs, samples[:, 1])
+        ]
 
     def display_info(self, title: str):
         self.start_dts_sampling_data.display_info(title=f"{title} - start dates only")
         self.start_end_dts_sampling_data.display_info(title=f"{title} - start and end dates")
 
 
-def to_sampling_data(
-    values: list, unique: bool = False, soins_planifies_bounds_period: bool = False
-) -> SamplingData:
-    """Put the input data in the relevant SamplingData sub-class."""
-    if all([isinstance(value, str) for value in values]):
-        try:
-            # Values has a format like '2016-11-21T14:45:00+02:00'
-            dts = [datetime.fromisoformat(value) for value in values]
-            return DtSamplingData(dts=dts, mode="str")
-        except ValueError:
-            pass
+def to_end_dts(ends: list, convert: Callable[[list], Dts], tz_info: Optional[tzinfo]) -> Dts:
+    """Convert the ends of periods into `Dts` with `convert` (`to_dts` or `parse_dts`), the
+    infinite ends (`DT_INF`) becoming NaT.
+    """
+    finite = np.array([end != DT_INF for end in ends], dtype=bool)
+    end_dts = Dts(
+        np.full(len(ends), np.datetime64("NaT"), dtype="datetime64[s]"),
+        np.zeros(len(ends), dtype=int),
+        tz_info,
+    )
+    if finite.any():
+        finite_end_dts = convert([end for end in ends if end != DT_INF])
+        end_dts.local[finite] = finite_end_dts.local
+        end_dts.offsets[finite] = finite_end_dts.offsets
+
+    return end_dts
+
+
+def to_dt_pairs(
+    dt_pairs: Union[List[Tuple[datetime, Union[str, datetime]]], Tuple[Dts, Dts]],
+) -> Tuple[Dts, Dts]:
+    """Turn a list of (start, end) datetimes into the `Dts` of the starts & of the ends, unless
+    they are already; infinite ends (`DT_INF`) are turned into NaT.
+    """
+    if isinstance(dt_pairs, tuple):
+        return dt_pairs
 
-    elif all([isinstance(value, tuple) for value in values]):
-        try:
-            # Values has a format like ('2016-11-21T14:45:00+02:00', '2016-11-21T15:45:00+02:00')
-            dt_pairs = [
-                (datetime.fromisoformat(start_dt), datetime.fromisoformat(end_dt))
-                for start_dt, end_dt in values
-            ]
-            return DtDurationSamplingData(dt_pairs=dt_pairs, mode="tuple")
-        except ValueError:
-            pass
-
-    elif all(
-        [
-            (isinstance(value, dict) and "start" in value and "end" in value and len(value) == 2)
-            for value in values
-        ]
+    start_dts = to_dts([start for start, _ in dt_pairs])
+    return start_dts, to_end_dts([end for _, end in dt_pairs], to_dts, start_dts.tz_info)
+
+
+def parse_dt_pairs(starts: List[str], ends: List[str]) -> Tuple[Dts, Dts]:
+    """Parse in bulk the ISO strings of (start, end) pairs into the `Dts` of the starts & of the
+    ends; infinite ends (`DT_INF`) are parsed as NaT.
+    """
+    start_dts = parse_dts(starts)
+    return start_dts, to_end_dts(ends, parse_dts, start_dts.tz_info)
+
+
+def probe(values: list, size: int) -> list:
+    """Pick at most `size` values of `values` at random, with a generator of fixed seed so that
+    the same values are picked at each run, and without consuming the draws of the samplers.
+    """
+    if len(values) <= size:
+        return values
+
+    return [values[i] for i in np.random.default_rng(0).integers(len(values), size=size)]
+
+
+def are_dts(dt_strs: list) -> bool:
+    """Output whether the values of `dt_strs` are all ISO dates or datetimes."""
+    if not all(isinstance(dt_str, str) for dt_str in dt_strs):
+        return False
+    try:
+        parse_dts(dt_strs)
+    except ValueError:
+        return False
+
+    return True
+
+
+def infer_sampler_kind(values: list, unique: bool = False) -> str:
+    """Infer the kind of sampling data of `values` (see `synthetizer.metadata.SAMPLER_KINDS`) from
+    a probe of `SAMPLER_KIND_PROBE_SIZE` of them, so that the inference doesn't depend on the size
+    of the column; the bounds periods of "soins_planifies" can't be told apart from the periods.
+    """
+    values = probe(values, size=SAMPLER_KIND_PROBE_SIZE)
+    if values and all(isinstance(value, str) for value in values):
+        # Values has a format like '2016-11-21T14:45:00+02:00'
+        if are_dts(values):
+            return DATETIME
+
+    elif values and all(isinstance(value, tuple) for value in values):
+        # Values has a format like ('2016-11-21T14:45:00+02:00', '2016-11-21T15:45:00+02:00')
+        if are_dts([start_dt for start_dt, _ in values]):
+            return PERIOD
+
+    elif values and all(
+        isinstance(value, dict) and "start" in value and "end" in value and len(value) == 2
+        for value in values
     ):
-        if not soins_planifies_bounds_period:
-            try:
-                # Values has a format like
-                # {"start": '2016-11-21T14:45:00+02:00', "end": '2016-11-21T15:45:00+02:00'}
-                dt_pairs = [
-                    (datetime.fromisoformat(value["start"]), datetime.fromisoformat(value["end"]))
-                    for value in values
-                ]
-                return DtDurationSamplingData(dt_pairs=dt_pairs, mode="dict")
-            except ValueError:
-                pass
-        else:
-            # Special case of "soins_planifies" boundsPeriod
-            dt_pairs = []
-            for value in values:
-                start = value["start"] if value["start"][-1] != "Z" else value["start"][:-1]
-                end = value["end"] if value["end"][-1] != "Z" else value["end"][:-1]
-                dt_end = datetime.fromisoformat(end) if end != DT_INF else end
-                dt_pairs.append((datetime.fromisoformat(start), dt_end))
-            return SpecialDtDurationSamplingData(dt_pairs=dt_pairs)  # type: ignore
-
-    elif all(
-        [(isinstance(value, dict) and "start" in value and len(value) == 1) for value in values]
+        # Values has a format like
+        # {"start": '2016-11-21T14:45:00+02:00', "end": '2016-11-21T15:45:00+02:00'}
+        if are_dts([value["start"] for value in values]):
+            return PERIOD
+
+    elif values and all(
+        isinstance(value, dict) and "start" in value and len(value) == 1 for value in values
     ):
+        # Values has a format like {"start": '2016-11-21T14:45:00+02:00'}
+        if are_dts([value["start"] for value in values]):
+            return DATETIME
+
+    return UNIQUE if unique else CATEGORICAL
+
+
+def to_sampling_data(
+    values: list,
+    unique: bool = False,
+    kind: Optional[str] = None,
+    rng: Optional[np.random.Generator] = None,
+) -> SamplingData:
+    """Put the input data in the SamplingData sub-class of the given `kind` (see
+    `synthetizer.metadata.SAMPLER_KINDS`), which draws its samples with `rng` (a new, randomly
+    seeded generator if None).
+
+    If `kind` is None, it is inferred from a probe of the values with `infer_sampler_kind`. If the
+    values turn out not to be datetimes or periods as expected, e.g. because some of them have no
+    end, they are sampled as categorical values, unique ones if `unique`.
+
+    Raises:
+        ValueError: If `kind` isn't a valid kind of sampling data.
+    """
+    if kind is None:
+        kind = infer_sampler_kind(values, unique=unique)
+    elif kind not in SAMPLER_KINDS:
+        raise ValueError(f"Invalid sampler kind '{kind}'.")
+
+    if values and kind in {DATETIME, PERIOD, BOUNDS_PERIOD}:
         try:
-            # Values has a format like {"start": '2016-11-21T14:45:00+02:00'}
-            dts = [datetime.fromisoformat(value["start"]) for value in values]
-            return DtSamplingData(dts=dts, mode="dict")
-        except ValueError:
-            pass
+            return to_dt_sampling_data(values, kind=kind, rng=rng)
+        except (ValueError, TypeError, KeyError):
+            kind = UNIQUE if unique else CATEGORICAL
+
+    if kind == UNIQUE:
+        return UniqueCategoricalSamplingData(values=values, rng=rng)
+    else:
+        return CategoricalSamplingData(values=values, rng=rng)
+
 
-    if not unique:
-        return CategoricalSamplingData(values=values)
+def to_dt_sampling_data(
+    values: list, kind: str, rng: Optional[np.random.Generator] = None
+) -> SamplingData:
+    """Parse the datetimes or periods of `values` in bulk, into sampling data of the given kind;
+    their format (strings or dicts, tuples or dicts) is given by the first value. Periods whose
+    first value has no end, like {"start": '2016-11-21T14:45:00+02:00'}, are sampled as datetimes.
+
+    Raises:
+        ValueError, TypeError, KeyError: If some values aren't datetimes or periods, or don't all
+            have the format of the first value.
+    """
+    if kind == PERIOD and isinstance(values[0], dict) and "end" not in values[0]:
+        kind = DATETIME
+
+    if kind == DATETIME:
+        if isinstance(values[0], dict):
+            if not all(len(value) == 1 for value in values):
+                raise ValueError("Some datetimes have other attributes than their start.")
+            # Values has a format like {"start": '2016-11-21T14:45:00+02:00'}
+            dts = parse_dts([value["start"] for value in values])
+            return DtSamplingData(dts=dts, mode="dict", rng=rng)
+        # Values has a format like '2016-11-21T14:45:00+02:00'
+        return DtSamplingData(dts=parse_dts(values), mode="str", rng=rng)
+
+    if isinstance(values[0], tuple):
+        # Values has a format like ('2016-11-21T14:45:00+02:00', '2016-11-21T15:45:00+02:00')
+        starts, ends = [start for start, _ in values], [end for _, end in values]
+        mode = "tuple"
     else:
-        return UniqueCategoricalSamplingData(values=values)
+        # Values has a format like
+        # {"start": '2016-11-21T14:45:00+02:00', "end": '2016-11-21T15:45:00+02:00'}
+        if not all(len(value) == 2 for value in values):
+            raise ValueError("Some periods have other attributes than their start & end.")
+        starts, ends = [value["start"] for value in values], [value["end"] for value in values]
+        mode = "dict"
+
+    if kind == BOUNDS_PERIOD:
+        # Particular case of "soins_planifies" boundsPeriod, whose datetimes are in UTC, e.g.
+        # '2016-11-21T14:45:00Z', and whose end can be infinite
+        return SpecialDtDurationSamplingData(dt_pairs=parse_dt_pairs(starts, ends), rng=rng)
+
+    dt_pairs = (parse_dts(starts), parse_dts(ends))
+    return DtDurationSamplingData(dt_pairs=dt_pairs, mode=mode, rng=rng)
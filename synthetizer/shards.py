@@ -0,0 +1,276 @@
+import multiprocessing
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from itertools import islice
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from synthetizer.anonymize import anonymize_entries
+from synthetizer.preprocess import suffix_sampling_data
+from synthetizer.sources import loads
+from synthetizer.tools.instrumentation import count, stage
+from synthetizer.tools.progress import make_progress
+from synthetizer.tools.references import ReferenceIndex
+from synthetizer.tools.utils import derive_seed_sequence
+from synthetizer.writers import dumps
+
+# Number of entries of a shard; it is fixed, so that the samples drawn for each entry only depend
+# on the seed, and not on the number of workers
+SHARD_SIZE = 10000
+
+# Context shared by the workers anonymizing the shards of a resource: with the 'fork' start method,
+# it is inherited from the parent process copy-on-write, along with the entries if they are in a
+# list, so that only the indices of the shards are sent to the workers
+shard_context: Dict[str, Any] = {}
+
+# Task of anonymizing a shard for a replica: (shard index, replica index, entries of the shard, or
+# None if the workers take them from the entries of the context)
+Task = Tuple[int, int, Optional[List[dict]]]
+
+
+def get_replica_suffix(id_suffix: str, replica_index: int) -> str:
+    """Output the suffix of the identifiers of a replica: the first replica keeps `id_suffix`, and
+    the k-th following one gets `f"{id_suffix}-{k}"`.
+    """
+    return f"{id_suffix}-{replica_index}" if replica_index else id_suffix
+
+
+def make_replicas(
+    resource_name: str,
+    resource_sampling_data: dict,
+    id_suffix: str,
+    seed_sequence: np.random.SeedSequence,
+    n_replicas: int,
+) -> List[Dict[str, Any]]:
+    """Make the context of each replica of a resource: its id suffix, its sampling data, whose
+    references are rewritten with its suffix but which share their fitted distributions with the
+    input sampling data, and its seed sequence, derived from `seed_sequence` & its index.
+    """
+    replicas = [
+        {
+            "id_suffix": id_suffix,
+            "resource_sampling_data": resource_sampling_data,
+            "seed_sequence": seed_sequence,
+        }
+    ]
+    for replica_index in range(1, n_replicas):
+        replica_suffix = get_replica_suffix("", replica_index)
+        replicas.append(
+            {
+                "id_suffix": get_replica_suffix(id_suffix, replica_index),
+                # The sampled references already have `id_suffix`, which is extended
+                "resource_sampling_data": suffix_sampling_data(
+                    resource_name, resource_sampling_data, suffix=replica_suffix
+                ),
+                "seed_sequence": derive_seed_sequence(seed_sequence, "replica", replica_index),
+            }
+        )
+
+    return replicas
+
+
+def init_shard_worker(context: Dict[str, Any]):
+    """Initialize a worker with the context, when it can't be inherited (without 'fork')."""
+    shard_context.update(context)
+
+
+def anonymize_shard(
+    context: Dict[str, Any], shard_index: int, entries: List[dict], replica_index: int = 0
+) -> List[dict]:
+    """Anonymize a shard of the entries of a resource for one of its replicas, drawing its samples
+    with a random number generator of its own, seeded from the seed sequence of the replica & the
+    index of the shard. If there are several replicas, the entries are copied first, as they are
+    anonymized in-place.
+
+    Args:
+        context: Resource name, shard size, replicas, as output by `make_replicas`, and the
+            reference index, if any.
+        shard_index: Index of the shard.
+        entries: Entries of the shard.
+        replica_index: Index of the replica.
+
+    Returns:
+        Anonymous entries of the shard.
+    """
+    replica = context["replicas"][replica_index]
+    if len(context["replicas"]) > 1:
+        entries = [loads(dumps(entry)) for entry in entries]
+
+    seed_sequence = derive_seed_sequence(replica["seed_sequence"], "shard", shard_index)
+    return list(
+        anonymize_entries(
+            resource_name=context["resource_name"],
+            entries=entries,
+            resource_sampling_data=replica["resource_sampling_data"],
+            id_suffix=replica["id_suffix"],
+            chunk_size=context["shard_size"],
+            rng=np.random.default_rng(seed_sequence),
+            show_progress=False,
+            reference_index=context.get("reference_index"),
+        )
+    )
+
+
+def anonymize_worker_shard(
+    shard_index: int, replica_index: int = 0, entries: Optional[List[dict]] = None
+) -> List[dict]:
+    """Anonymize a shard within a worker, with the context of the worker; if `entries` is None,
+    the entries of the shard are taken from those of the context.
+    """
+    if entries is None:
+        start = shard_index * shard_context["shard_size"]
+        entries = shard_context["entries"][start : start + shard_context["shard_size"]]
+    return anonymize_shard(shard_context, shard_index, entries, replica_index)  # type: ignore
+
+
+def iter_tasks(
+    entries: Iterable[dict], shard_size: int, n_replicas: int
+) -> Iterator[Tuple[int, int, List[dict]]]:
+    """Iterate over the tasks of anonymizing each shard of `entries` for each replica, the
+    replicas of a shard following each other.
+    """
+    entries = iter(entries)
+    shard_index = 0
+    shard = list(islice(entries, shard_size))
+    while shard:
+        for replica_index in range(n_replicas):
+            yield shard_index, replica_index, shard
+        shard_index += 1
+        shard = list(islice(entries, shard_size))
+
+
+def anonymize_sharded(
+    resource_name: str,
+    entries: Iterable[dict],
+    resource_sampling_data: dict,
+    id_suffix: str,
+    seed_sequence: Optional[np.random.SeedSequence] = None,
+    workers: int = 1,
+    shard_size: int = SHARD_SIZE,
+    total: Optional[int] = None,
+    replicas: int = 1,
+    reference_index: Optional[ReferenceIndex] = None,
+) -> Iterator[Dict[str, Any]]:
+    """Generate synthetic entries like `synthetizer.anonymize.anonymize_entries`, by shards of
+    `shard_size` entries, anonymized concurrently by `workers` processes, and output in order.
+
+    The sampling data are shipped once to each worker: they are inherited copy-on-write from the
+    current process with the 'fork' start method (along with the entries if they are in a list),
+    and pickled once per worker otherwise. Each shard draws its samples with its own random number
+    generator, seeded from `seed_sequence` & its index, so that the output only depends on the
+    seed, and not on the number of workers.
+
+    With several `replicas`, each shard is anonymized once per replica, with the id suffix given
+    by `get_replica_suffix`, the references of the sampled values being rewritten consistently;
+    the distributions are fitted once, and all the replicas are generated by the same workers.
+
+    With a `reference_index`, the dangling references are redrawn from the resources indexed so
+    far (see `synthetizer.anonymize.anonymize_entries`); the generated resources are added to the
+    index once all of them have been output, so that the output doesn't depend on the workers.
+
+    Args:
+        resource_name: Name of the input resource.
+        entries: Entries of the input resource.
+        resource_sampling_data: Sampling data corresponding to the resource.
+        id_suffix: Suffix to append to the identifiers, to make sure they are unique.
+        seed_sequence: Seed sequence from which the generators of the shards are seeded; if None,
+            they are seeded randomly.
+        workers: Number of processes anonymizing the shards; if 1, the shards are anonymized one
+            after another in the current process.
+        shard_size: Number of entries per shard.
+        total: Total number of entries, if known, to display the progress.
+        replicas: Number of synthetic replicas of the entries to generate.
+        reference_index: If not None, index of the resources generated so far, which the
+            generated resources are added to.
+
+    Returns:
+        Anonymous entries, ready to be put in a transaction bundle: the replicas of the first
+        shard, then those of the second shard, and so on.
+    """
+    context = {
+        "resource_name": resource_name,
+        "shard_size": shard_size,
+        "replicas": make_replicas(
+            resource_name=resource_name,
+            resource_sampling_data=resource_sampling_data,
+            id_suffix=id_suffix,
+            seed_sequence=seed_sequence if seed_sequence is not None else np.random.SeedSequence(),
+            n_replicas=replicas,
+        ),
+    }
+    if reference_index is not None:
+        context["reference_index"] = reference_index
+    # Ids of the generated resources by resource type & replica, added to the index at the end
+    generated_ids: Dict[Tuple[str, int], List[str]] = {}
+
+    def output(shard: List[dict], replica_index: int) -> List[dict]:
+        if reference_index is not None:
+            for entry in shard:
+                key = (entry["resource"]["resourceType"], replica_index)
+                generated_ids.setdefault(key, []).append(entry["resource"]["id"])
+        progress.update(len(shard))
+        return shard
+
+    def index_generated_ids():
+        for (resource_type, replica_index), ids in generated_ids.items():
+            namespace = context["replicas"][replica_index]["id_suffix"]
+            reference_index.add(resource_type, ids, namespace=namespace)  # type: ignore
+
+    progress = make_progress(
+        total=total * replicas if total is not None else None, desc=resource_name
+    )
+
+    if workers == 1:
+        for shard_index, replica_index, shard in iter_tasks(entries, shard_size, replicas):
+            anonymous_shard = anonymize_shard(context, shard_index, shard, replica_index)
+            yield from output(anonymous_shard, replica_index)
+        index_generated_ids()
+        progress.close()
+        return
+
+    fork = "fork" in multiprocessing.get_all_start_methods()
+    if fork:
+        shard_context.update(context)
+        executor = ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("fork")
+        )
+    else:
+        executor = ProcessPoolExecutor(
+            max_workers=workers, initializer=init_shard_worker, initargs=(context,)
+        )
+
+    if fork and isinstance(entries, list):
+        # The workers take the entries of the shards from their copy of the context
+        shard_context["entries"] = entries
+        n_shards = -(-len(entries) // shard_size)
+        tasks: Iterator[Task] = (
+            (shard_index, replica_index, None)
+            for shard_index in range(n_shards)
+            for replica_index in range(replicas)
+        )
+    else:
+        tasks = iter_tasks(entries, shard_size, replicas)
+
+    # At most 2 shards per worker are in flight, so that the anonymized shards which are waiting
+    # to be output don't pile up in memory
+    futures: Deque[Tuple[int, Future]] = deque()
+    try:
+        for task in islice(tasks, 2 * workers):
+            futures.append((task[1], executor.submit(anonymize_worker_shard, *task)))
+
+        while futures:
+            replica_index, future = futures.popleft()
+            with stage("anonymize.shard"):
+                shard = future.result()
+                count("entries", len(shard))
+            for task in islice(tasks, 1):
+                futures.append((task[1], executor.submit(anonymize_worker_shard, *task)))
+            yield from output(shard, replica_index)
+        index_generated_ids()
+    finally:
+        for _, future in futures:
+            future.cancel()
+        executor.shutdown()
+        shard_context.clear()
+        progress.close()
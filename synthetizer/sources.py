@@ -0,0 +1,272 @@
+import codecs
+import gc
+import gzip
+import io
+import json
+import mmap
+import os
+from contextlib import contextmanager
+from itertools import islice
+from typing import IO, Any, Dict, Iterator
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None  # type: ignore
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None  # type: ignore
+
+# Extensions of the files a resource can be read from, by order of preference
+INPUT_EXTENSIONS = [".json", ".ndjson", ".json.gz", ".ndjson.gz", ".json.zst", ".ndjson.zst"]
+
+WHITESPACES = " \t\n\r"
+
+# Number of entries per page when a resource is read page by page
+DEFAULT_PAGE_SIZE = 1000
+
+
+def loads(data: bytes) -> Any:
+    """Deserialize UTF-8 encoded json, using `orjson` if installed as it is far quicker, and the
+    standard `json` module otherwise.
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def find_resource_file(input_dir: str, resource_name: str) -> str:
+    """Find the file of `input_dir` holding the resource, either a bundle ('<resource_name>.json')
+    or newline-delimited json ('<resource_name>.ndjson'), possibly compressed with gzip or zstd.
+
+    Args:
+        input_dir: Path of the directory holding the resources, one file per resource.
+        resource_name: Name of the resource, as in `synthetizer.metadata.RESOURCE_NAMES`.
+
+    Returns:
+        Path of the file holding the resource.
+    """
+    for extension in INPUT_EXTENSIONS:
+        path = os.path.join(input_dir, resource_name + extension)
+        if os.path.isfile(path):
+            return path
+
+    raise FileNotFoundError(
+        f"No file for the resource '{resource_name}' in '{input_dir}', expected one of "
+        f"{[resource_name + extension for extension in INPUT_EXTENSIONS]}."
+    )
+
+
+@contextmanager
+def open_input(path: str) -> Iterator[IO[bytes]]:
+    """Open a file to read from; it is memory-mapped if it isn't compressed (nor empty), so that
+    it is read from the page cache rather than through the reads of a buffered file.
+    """
+    if path.endswith(".gz"):
+        with gzip.open(path, "rb") as f:
+            yield f  # type: ignore
+        return
+    elif path.endswith(".zst"):
+        if zstandard is None:
+            raise ImportError("The package 'zstandard' is needed to read zstd compressed files.")
+        with open(path, "rb") as f:
+            # Buffered, so that the lines of newline-delimited json can be read
+            yield io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(f))
+        return
+
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield f
+            return
+
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if hasattr(mm, "madvise"):
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+            yield mm  # type: ignore
+
+
+def iter_bundle_entries(file: IO[bytes], block_size: int = 1 << 20) -> Iterator[Dict[str, Any]]:
+    """Parse incrementally the entries of a bundle, reading `file` block by block, so that only
+    the entry being parsed is held in memory, and not the full bundle. Each block is decoded to a
+    string, and parsed by the pure-Python decoder of `json`: it is far slower than `load_file`,
+    which parses the whole file at once.
+
+    Args:
+        file: Binary file holding the bundle.
+        block_size: Number of bytes read at once.
+
+    Returns:
+        Entries of the bundle.
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer, pos, eof = "", 0, False
+
+    def fill() -> bool:
+        """Read the next block in the buffer, dropping what has already been parsed."""
+        nonlocal buffer, pos, eof
+        if eof:
+            return False
+        block = file.read(block_size)
+        eof = not block
+        buffer = buffer[pos:] + text_decoder.decode(block, final=eof)
+        pos = 0
+        return True
+
+    def peek() -> str:
+        """Skip the whitespaces and output the next character, without consuming it."""
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos] in WHITESPACES:
+                pos += 1
+            if pos < len(buffer):
+                return buffer[pos]
+            if not fill():
+                raise ValueError("Unexpected end of the bundle.")
+
+    def consume(expected: str) -> str:
+        """Consume the next character, which must be in `expected`."""
+        nonlocal pos
+        char = peek()
+        if char not in expected:
+            raise ValueError(f"Expected one of '{expected}' in the bundle, got '{char}'.")
+        pos += 1
+        return char
+
+    def decode() -> Any:
+        """Decode the next json value."""
+        nonlocal pos
+        peek()
+        while True:
+            try:
+                value, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if not fill():
+                    raise
+                continue
+            # A value ending with the buffer may be truncated, e.g. a number
+            if end == len(buffer) and fill():
+                continue
+            pos = end
+            return value
+
+    consume("{")
+    if peek() == "}":
+        return
+
+    while True:
+        key = decode()
+        consume(":")
+        if key == "entry":
+            consume("[")
+            if peek() == "]":
+                pos += 1
+            else:
+                while True:
+                    yield decode()
+                    if consume(",]") == "]":
+                        break
+        else:
+            decode()
+
+        if consume(",}") == "}":
+            return
+
+
+@contextmanager
+def gc_paused() -> Iterator[None]:
+    """Pause the cyclic garbage collector, which otherwise runs over and over while the millions of
+    objects of a large bundle are created, though json can't hold any reference cycle.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def load_file(file: IO[bytes]) -> Any:
+    """Deserialize a whole json file at once; a memory-mapped file is parsed in place by `orjson`,
+    without being read in a buffer of its own first.
+    """
+    with gc_paused():
+        if isinstance(file, mmap.mmap) and orjson is not None:
+            with memoryview(file) as data:
+                return orjson.loads(data)
+
+        return loads(file.read())
+
+
+def iter_ndjson_entries(file: IO[bytes]) -> Iterator[Dict[str, Any]]:
+    """Parse newline-delimited json, one resource per line, line by line.
+
+    Args:
+        file: Binary file holding the resources.
+
+    Returns:
+        Entries holding each resource.
+    """
+    for line in iter(file.readline, b""):
+        if line.strip():
+            yield {"resource": loads(line)}
+
+
+def iter_entries(path: str) -> Iterator[Dict[str, Any]]:
+    """Parse incrementally the entries of a file, either a bundle or newline-delimited json."""
+    with open_input(path) as f:
+        if ".ndjson" in os.path.basename(path):
+            yield from iter_ndjson_entries(f)
+        else:
+            yield from iter_bundle_entries(f)
+
+
+def iter_file_pages(
+    input_dir: str, resource_name: str, page_size: int = DEFAULT_PAGE_SIZE
+) -> Iterator[Dict[str, Any]]:
+    """Read the resource from its file in `input_dir` page by page, yielding pages like those of
+    `synthetizer.fetch.iter_pages`, so that the full bundle is never held in memory.
+
+    Args:
+        input_dir: Path of the directory holding the resources, one file per resource.
+        resource_name: Name of the resource to read.
+        page_size: Number of entries per page.
+
+    Returns:
+        Pages of the resource bundle.
+    """
+    entries = iter_entries(find_resource_file(input_dir, resource_name))
+    while True:
+        page_entries = list(islice(entries, page_size))
+        if not page_entries:
+            return
+        yield {"resourceType": "Bundle", "entry": page_entries}
+
+
+def load(input_dir: str, resource_name: str, verbose: bool = False) -> Dict[str, Any]:
+    """Read the resource from its file in `input_dir` and output it in a bundle format, like
+    `synthetizer.fetch.fetch`; a bundle is parsed at once, as it's held in memory anyway (see
+    `iter_file_pages` to read a resource page by page instead).
+
+    Args:
+        input_dir: Path of the directory holding the resources, one file per resource.
+        resource_name: Name of the resource to read.
+        verbose: If True, display information about the current step.
+
+    Returns:
+        Resource bundle.
+    """
+    path = find_resource_file(input_dir, resource_name)
+    if verbose:
+        print(f"Loading '{path}'...")
+
+    if ".ndjson" in os.path.basename(path):
+        entries = list(iter_entries(path))
+    else:
+        with open_input(path) as f:
+            entries = load_file(f).get("entry", [])
+
+    return {"resourceType": "Bundle", "entry": entries}
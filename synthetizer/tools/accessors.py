@@ -0,0 +1,210 @@
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+from glom import Coalesce, Path, PathAccessError, glom
+
+from ..metadata import (
+    ID,
+    PATHS_DEFAULT_VALUE,
+    PATHS_ID_REF,
+    PATHS_TO_DELETE,
+    PATHS_TO_SAMPLE,
+    SAMPLER_KINDS,
+    URL,
+)
+
+Key = Union[str, int]
+Getter = Callable[[dict], Any]
+Setter = Callable[[dict, Any], None]
+Deleter = Callable[[dict], None]
+
+
+def split_path(path: str) -> List[Key]:
+    """Split a metadata path like 'entry.{}.resource.location.0.location.reference' into the keys
+    to follow from the entry, i.e. ['resource', 'location', 0, 'location', 'reference'].
+    """
+    parts = path.split(".")
+    if parts[:2] != ["entry", "{}"] or len(parts) < 3:
+        raise ValueError(f"Path '{path}' is not relative to an entry.")
+
+    return [int(part) if part.isdigit() else part for part in parts[2:]]
+
+
+def follow(target: Any, keys: List[Key]) -> Any:
+    """Follow `keys` from `target`, raising a `PathAccessError` like glom does if one is missing."""
+    for i, key in enumerate(keys):
+        try:
+            target = target[key]
+        except (LookupError, TypeError) as exc:
+            raise PathAccessError(exc, Path(*keys), i)
+    return target
+
+
+def compile_getter(path: str) -> Getter:
+    """Compile `path` once into a function getting its value from an entry."""
+    keys = split_path(path)
+
+    def getter(entry: dict) -> Any:
+        return follow(entry, keys)
+
+    return getter
+
+
+def compile_spec(spec: Any) -> Getter:
+    """Compile the glom `spec` of an attribute to sample, like `("entry", ["resource.status"])`,
+    into a function getting the attribute from a single entry. The specs mapping each entry to a
+    path, possibly within a `Coalesce` defaulting to None, are followed directly; other specs are
+    applied with glom to each entry.
+    """
+    if not (
+        isinstance(spec, tuple)
+        and len(spec) == 2
+        and spec[0] == "entry"
+        and isinstance(spec[1], list)
+        and len(spec[1]) == 1
+    ):
+        raise ValueError(f"Spec {spec} doesn't map each entry to an attribute.")
+    entry_spec = spec[1][0]
+
+    if isinstance(entry_spec, str):
+        keys = [int(part) if part.isdigit() else part for part in entry_spec.split(".")]
+
+        def getter(entry: dict) -> Any:
+            return follow(entry, keys)
+
+        return getter
+
+    if (
+        isinstance(entry_spec, Coalesce)
+        and len(entry_spec.subspecs) == 1
+        and isinstance(entry_spec.subspecs[0], str)
+        and entry_spec.default is None
+    ):
+        keys = [int(part) if part.isdigit() else part for part in entry_spec.subspecs[0].split(".")]
+
+        def coalesce_getter(entry: dict) -> Any:
+            try:
+                return follow(entry, keys)
+            except PathAccessError:
+                return None
+
+        return coalesce_getter
+
+    def glom_getter(entry: dict) -> Any:
+        return glom(entry, entry_spec)
+
+    return glom_getter
+
+
+def compile_setter(path: str) -> Setter:
+    """Compile `path` once into a function setting its value in an entry; all the parents of the
+    attribute must already exist.
+    """
+    keys = split_path(path)
+    parent_keys, last_key = keys[:-1], keys[-1]
+
+    def setter(entry: dict, value: Any):
+        follow(entry, parent_keys)[last_key] = value
+
+    return setter
+
+
+def compile_deleter(path: str) -> Deleter:
+    """Compile `path` once into a function deleting its attribute from an entry; missing
+    attributes are ignored.
+    """
+    keys = split_path(path)
+    parent_keys, last_key = keys[:-1], keys[-1]
+
+    def deleter(entry: dict):
+        try:
+            parent = follow(entry, parent_keys)
+            del parent[last_key]
+        except (PathAccessError, LookupError, TypeError):
+            pass
+
+    return deleter
+
+
+def get_paths_to_sample(resource_name: str) -> List[Tuple[str, Any, int, Optional[str]]]:
+    """Output the (path, spec, n_flatten, kind) of the attributes to sample of `resource_name`,
+    the kind of their sampling data being None when it isn't given in `PATHS_TO_SAMPLE`.
+    """
+    paths_to_sample = []
+    for path, spec, n_flatten, *kind in PATHS_TO_SAMPLE.get(resource_name, []):
+        if kind and kind[0] not in SAMPLER_KINDS:
+            raise ValueError(f"Invalid sampler kind '{kind[0]}' for path '{path}'.")
+        paths_to_sample.append((path, spec, n_flatten, kind[0] if kind else None))
+
+    return paths_to_sample
+
+
+@lru_cache(maxsize=None)
+def compile_resource_paths(resource_name: str) -> Dict[str, Any]:
+    """Compile once the paths of the metadata tables relative to `resource_name` into accessors
+    working directly on an entry, so that no path has to be formatted or parsed per entry.
+
+    The ids and refs which are inside an attribute to sample are not compiled with the other ones,
+    as they are overwritten by the sampled values: instead, their keys relative to the sampled
+    values are output, so that the suffix can be added to the sampled values themselves.
+
+    Args:
+        resource_name: Name of the resource.
+
+    Returns:
+        Compiled accessors, with the same keys as the metadata tables:
+            - "id_ref": list of (getter, setter),
+            - "sampled_id_ref": {path: list of keys relative to the sampled values},
+            - "to_delete": list of deleters,
+            - "to_sample": {path: (getter, setter, n_flatten)},
+            - "to_collect": list of (path, getter compiled from the glom spec, n_flatten),
+            - "kinds": {path: kind of the sampling data} for the paths whose kind is given,
+            - "default_value": list of (setter, default_value),
+            - "references": list of keys of the references to other resources.
+    """
+    to_sample = {}
+    to_collect: List[Tuple[str, Getter, int]] = []
+    kinds: Dict[str, str] = {}
+    paths_to_sample = get_paths_to_sample(resource_name)
+    for path, spec, n_flatten, kind in paths_to_sample:
+        to_collect.append((path, compile_spec(spec), n_flatten))
+        if kind is not None:
+            kinds[path] = kind
+    for path, _, _, _ in paths_to_sample:
+        n_flattens = set(
+            n_flatten for path_temp, _, n_flatten, _ in paths_to_sample if path == path_temp
+        )
+        if len(n_flattens) != 1:
+            raise ValueError("Not able to retrieve a unique `n_flatten`.")
+        to_sample[path] = (compile_getter(path), compile_setter(path), n_flattens.pop())
+
+    id_ref = []
+    sampled_id_ref: Dict[str, List[List[Key]]] = {path: [] for path in to_sample}
+    for id_path in PATHS_ID_REF.get(resource_name, []):
+        id_keys = split_path(id_path)
+        for path, (_, _, n_flatten) in to_sample.items():
+            keys = split_path(path)
+            if id_keys[: len(keys)] == keys:
+                # Skip the list indices removed when the sampled values are flattened
+                sampled_id_ref[path].append(id_keys[len(keys) + n_flatten :])
+                break
+        else:
+            id_ref.append((compile_getter(id_path), compile_setter(id_path)))
+
+    return {
+        "id_ref": id_ref,
+        "sampled_id_ref": sampled_id_ref,
+        "to_delete": [compile_deleter(path) for path in PATHS_TO_DELETE.get(resource_name, [])],
+        "to_sample": to_sample,
+        "to_collect": to_collect,
+        "kinds": kinds,
+        "default_value": [
+            (compile_setter(path), default_value)
+            for path, default_value in PATHS_DEFAULT_VALUE.get(resource_name, [])  # type: ignore
+        ],
+        "references": [
+            split_path(path)
+            for path in PATHS_ID_REF.get(resource_name, [])
+            if path not in {ID, URL}
+        ],
+    }
@@ -0,0 +1,40 @@
+import numpy as np
+
+
+class AliasTable:
+    """Alias table of a discrete distribution (Walker's alias method), to draw indices with the
+    given `weights` in constant time per draw, whatever the number of indices.
+
+    Each index `i` holds the probability `prob[i]` to keep `i`, and otherwise an alias index to
+    output instead, so that a draw is a uniform index followed by a biased coin flip.
+    """
+
+    def __init__(self, weights: np.ndarray):
+        n = len(weights)
+        prob = np.asarray(weights, dtype=float) * n / np.sum(weights)
+        alias = np.arange(n)
+
+        small = [i for i in range(n) if prob[i] < 1.0]
+        large = [i for i in range(n) if prob[i] >= 1.0]
+        while small and large:
+            i, j = small.pop(), large.pop()
+            alias[i] = j
+            prob[j] -= 1.0 - prob[i]
+            if prob[j] < 1.0:
+                small.append(j)
+            else:
+                large.append(j)
+
+        # The remaining indices are only left with rounding errors
+        prob[small + large] = 1.0
+
+        self.prob = prob
+        self.alias = alias
+
+    def __len__(self) -> int:
+        return len(self.prob)
+
+    def draw(self, size: int, rng: np.random.Generator) -> np.ndarray:
+        """Draw `size` indices with `rng`."""
+        indices = rng.integers(0, len(self.prob), size=size)
+        return np.where(rng.random(size) < self.prob[indices], indices, self.alias[indices])
@@ -0,0 +1,82 @@
+from typing import Callable, Optional
+
+import numpy as np
+
+
+class SampleBuffer:
+    """Preallocated, array-backed buffer of samples, consumed with an integer cursor.
+
+    Samples are drawn in chunks with `draw` and kept as a native NumPy array until they are
+    consumed. When the buffer runs out, it is refilled with a chunk whose size doubles at each
+    refill, from `min_refill_size` up to `max_refill_size`, so that the number of draws stays
+    logarithmic in the number of consumed samples.
+    """
+
+    def __init__(
+        self,
+        draw: Callable[[int], np.ndarray],
+        min_refill_size: int = 100,
+        max_refill_size: int = 65536,
+    ):
+        self.draw = draw
+        self.refill_size = min_refill_size
+        self.max_refill_size = max_refill_size
+        self.samples: Optional[np.ndarray] = None
+        self.cursor = 0  # Index of the next sample to consume
+        self.end = 0  # Index after the last available sample
+
+    def __getstate__(self) -> dict:
+        """Drop the available samples when pickled, as new ones can be drawn."""
+        state = self.__dict__.copy()
+        state.update(samples=None, cursor=0, end=0)
+        return state
+
+    def clear(self):
+        """Drop the available samples."""
+        self.samples = None
+        self.cursor = 0
+        self.end = 0
+
+    def __len__(self) -> int:
+        return self.end - self.cursor
+
+    def extend(self, size: int):
+        """Draw `size` new samples and append them to the available ones."""
+        new_samples = self.draw(size)
+        n_available = len(self)
+
+        if self.samples is None or n_available + size > len(self.samples):
+            samples = np.empty(max(n_available + size, self.refill_size), new_samples.dtype)
+            if self.samples is not None:
+                samples[:n_available] = self.samples[self.cursor : self.end]
+            self.samples = samples
+        else:
+            # Move the remaining samples back to the start of the preallocated array
+            self.samples[:n_available] = self.samples[self.cursor : self.end]
+
+        self.samples[n_available : n_available + size] = new_samples
+        self.cursor = 0
+        self.end = n_available + size
+
+    def refill(self):
+        """Refill the buffer with a chunk of adaptive size."""
+        self.extend(self.refill_size)
+        self.refill_size = min(2 * self.refill_size, self.max_refill_size)
+
+    def pop(self) -> np.generic:
+        """Consume a single sample."""
+        if self.cursor == self.end:
+            self.refill()
+
+        sample = self.samples[self.cursor]  # type: ignore
+        self.cursor += 1
+        return sample
+
+    def take(self, size: int) -> np.ndarray:
+        """Consume `size` samples at once, as a new array."""
+        if len(self) < size or self.samples is None:  # Even none, to get the dtype of the samples
+            self.extend(size - len(self))
+
+        samples = self.samples[self.cursor : self.cursor + size].copy()  # type: ignore
+        self.cursor += size
+        return samples
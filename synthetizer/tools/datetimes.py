@@ -0,0 +1,143 @@
+from datetime import datetime, timezone, tzinfo
+from typing import NamedTuple, Optional, Sequence
+
+import numpy as np
+
+# Lengths of the ISO strings parsed in bulk: dates ('2016-12-05'), naive datetimes
+# ('2016-12-05T14:40:00'), UTC datetimes ('2016-12-05T14:40:00Z') & datetimes with an offset
+# ('2016-12-05T14:40:00+02:00')
+DATE_LENGTH = 10
+DT_LENGTH = 19
+UTC_DT_LENGTH = 20
+OFFSET_DT_LENGTH = 25
+
+
+class Dts(NamedTuple):
+    """Datetimes parsed in bulk: their local times as `datetime64[s]`, their offsets from UTC in
+    seconds, the timezone of the first one, and the unit to format them with: 'D' if they are all
+    dates, 's' otherwise.
+    """
+
+    local: np.ndarray
+    offsets: np.ndarray
+    tz_info: Optional[tzinfo]
+    unit: str = "s"
+
+    @property
+    def instants(self) -> np.ndarray:
+        """UTC times of the datetimes, to compute durations between datetimes."""
+        return self.local - self.offsets.astype("timedelta64[s]")
+
+    def subset(self, mask: np.ndarray) -> "Dts":
+        """Keep only the datetimes selected by the boolean `mask`."""
+        return Dts(self.local[mask], self.offsets[mask], self.tz_info, self.unit)
+
+
+def offset_seconds(dt: datetime) -> int:
+    """Output the offset of `dt` from UTC in seconds, 0 if it is naive."""
+    offset = dt.utcoffset()
+    return int(offset.total_seconds()) if offset is not None else 0
+
+
+def parse_dt(dt_str: str) -> datetime:
+    """Parse an ISO date or datetime one by one with `datetime.fromisoformat`, which doesn't
+    accept the designator 'Z' before Python 3.11.
+    """
+    return datetime.fromisoformat(dt_str.replace("Z", "+00:00"))
+
+
+def to_dts(dts: Sequence[datetime]) -> Dts:
+    """Turn a list of datetimes, either all naive or all aware, into `Dts`."""
+    local = np.array([dt.replace(tzinfo=None) for dt in dts], dtype="datetime64[us]")
+    offsets = np.array([offset_seconds(dt) for dt in dts], dtype=int)
+    return Dts(local.astype("datetime64[s]"), offsets, dts[0].tzinfo if len(dts) else None)
+
+
+def parse_designator(designator: str) -> Optional[tzinfo]:
+    """Parse the timezone designator of an ISO datetime: '' (naive), 'Z' or an offset like
+    '+02:00'.
+    """
+    if not designator:
+        return None
+    if designator == "Z":
+        return timezone.utc
+    return datetime.fromisoformat(f"2000-01-01T00:00:00{designator}").tzinfo
+
+
+def chars_to_strs(chars: np.ndarray) -> np.ndarray:
+    """Join the columns of an array of characters of shape (n, width) into n strings."""
+    return np.ascontiguousarray(chars).view(f"U{chars.shape[1]}").ravel()
+
+
+def parse_dts(dt_strs: Sequence[str]) -> Dts:
+    """Parse in bulk ISO strings of dates & datetimes, like `datetime.fromisoformat` does one by
+    one, along with the UTC designator 'Z'.
+
+    The strings are turned into an array of characters once: their shapes are checked, their
+    local times are parsed by numpy in a single call, and their timezone designators (none, 'Z' or
+    an offset like '+02:00') are parsed once per distinct designator. Strings of other shapes
+    (e.g. with fractions of seconds) are parsed one by one with `datetime.fromisoformat`.
+
+    Raises:
+        ValueError: If a string isn't an ISO date or datetime.
+    """
+    strs = np.array(dt_strs, dtype=str)
+    n, width = len(strs), strs.dtype.itemsize // 4
+    if strs.ndim != 1 or not n or not DATE_LENGTH <= width <= OFFSET_DT_LENGTH:
+        return to_dts([parse_dt(dt_str) for dt_str in dt_strs])
+
+    chars = strs.view("U1").reshape(n, width)
+    lengths = np.char.str_len(strs)
+    valid = (chars[:, 4] == "-") & (chars[:, 7] == "-")
+    if width > DATE_LENGTH:
+        valid &= (lengths == DATE_LENGTH) | (chars[:, DATE_LENGTH] == "T")
+        valid &= np.isin(lengths, [DATE_LENGTH, DT_LENGTH, UTC_DT_LENGTH, OFFSET_DT_LENGTH])
+    else:
+        valid &= lengths == DATE_LENGTH
+    if width > DT_LENGTH:
+        valid &= (lengths != UTC_DT_LENGTH) | (chars[:, DT_LENGTH] == "Z")
+    if width == OFFSET_DT_LENGTH:
+        valid &= (lengths != OFFSET_DT_LENGTH) | (
+            np.isin(chars[:, DT_LENGTH], ["+", "-"]) & (chars[:, 22] == ":")
+        )
+    if not valid.all():
+        return to_dts([parse_dt(dt_str) for dt_str in dt_strs])
+
+    local = chars_to_strs(chars[:, :DT_LENGTH]).astype("datetime64[s]")
+    unit = "D" if (lengths == DATE_LENGTH).all() else "s"
+    if width <= DT_LENGTH:
+        return Dts(local, np.zeros(n, dtype=int), None, unit)
+
+    designators = chars_to_strs(chars[:, DT_LENGTH:])
+    if (designators == designators[0]).all():
+        tz_info = parse_designator(designators[0])
+        offset = offset_seconds(datetime(2000, 1, 1, tzinfo=tz_info))
+        return Dts(local, np.full(n, offset), tz_info, unit)
+
+    distinct_designators, inverse = np.unique(designators, return_inverse=True)
+    offsets = np.array(
+        [
+            offset_seconds(datetime(2000, 1, 1, tzinfo=parse_designator(designator)))
+            for designator in distinct_designators
+        ]
+    )
+    return Dts(local, offsets[inverse], parse_designator(designators[0]), unit)
+
+
+def format_designator(tz_info: tzinfo) -> str:
+    """Format the fixed offset of `tz_info`, e.g. '+02:00', as `datetime.isoformat` does."""
+    return datetime(2000, 1, 1, tzinfo=tz_info).isoformat()[DT_LENGTH:]
+
+
+def format_dts(dts: np.ndarray, tz_info: Optional[tzinfo], unit: str = "s") -> np.ndarray:
+    """Format in bulk an array of `datetime64` local times in `tz_info` into ISO strings, e.g.
+    '2016-12-05T14:40:00+02:00' as `datetime.isoformat` does, '2016-12-05T14:40:00Z' in UTC, or
+    '2016-12-05' if `unit` is 'D'.
+    """
+    dt_strs = np.datetime_as_string(dts, unit=unit)  # type: ignore
+    if tz_info is None or unit == "D":
+        return dt_strs
+
+    # Designator of the timezone, e.g. 'Z' or '+02:00' as formatted by `isoformat`
+    designator = "Z" if tz_info == timezone.utc else format_designator(tz_info)
+    return np.char.add(dt_strs, designator)
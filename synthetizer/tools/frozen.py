@@ -0,0 +1,88 @@
+from typing import Any, Callable, List, Sequence, Union
+
+Key = Union[str, int]
+
+
+class FrozenDict(dict):
+    """Immutable dict, which can be shared safely between several entries. As a subclass of dict,
+    it is serialized like any dict, without being copied first.
+    """
+
+    __slots__ = ()
+
+    def _immutable(self, *args, **kwargs):
+        raise TypeError(f"'{type(self).__name__}' object is immutable")
+
+    __setitem__ = __delitem__ = __ior__ = _immutable  # type: ignore
+    clear = pop = popitem = setdefault = update = _immutable  # type: ignore
+
+    def __reduce__(self):
+        return FrozenDict, (dict(self),)
+
+
+class FrozenList(list):
+    """Immutable list, which can be shared safely between several entries. As a subclass of list,
+    it is serialized like any list, without being copied first.
+    """
+
+    __slots__ = ()
+
+    def _immutable(self, *args, **kwargs):
+        raise TypeError(f"'{type(self).__name__}' object is immutable")
+
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _immutable  # type: ignore
+    append = extend = insert = pop = remove = clear = sort = reverse = _immutable  # type: ignore
+
+    def __reduce__(self):
+        return FrozenList, (list(self),)
+
+
+def freeze(value: Any) -> Any:
+    """Output an immutable version of a json-like value, made of `FrozenDict`s & `FrozenList`s;
+    values which are already frozen are not copied.
+    """
+    if isinstance(value, (FrozenDict, FrozenList)):
+        return value
+    elif isinstance(value, dict):
+        return FrozenDict((key, freeze(item)) for key, item in value.items())
+    elif isinstance(value, list):
+        return FrozenList(freeze(item) for item in value)
+    elif isinstance(value, tuple):
+        return tuple(freeze(item) for item in value)
+
+    return value
+
+
+def thaw(value: Any) -> Any:
+    """Output a mutable deep copy of a json-like value, possibly frozen."""
+    if isinstance(value, dict):
+        return {key: thaw(item) for key, item in value.items()}
+    elif isinstance(value, list):
+        return [thaw(item) for item in value]
+    elif isinstance(value, tuple):
+        return tuple(thaw(item) for item in value)
+
+    return value
+
+
+def replace_at(value: Any, keys: Sequence[Key], replace: Callable[[Any], Any]) -> Any:
+    """Copy-on-write replacement of the item at `keys` in `value` by `replace(item)`: `value` is
+    left unchanged, and only the containers along `keys` are copied, the others being shared. If
+    there is no item at `keys`, `value` itself is output.
+    """
+    if not keys:
+        return replace(value)
+
+    key = keys[0]
+    try:
+        item = value[key]
+    except (LookupError, TypeError):
+        return value
+
+    new_item = replace_at(item, keys[1:], replace)
+    if isinstance(value, dict):
+        return {**value, key: new_item}
+
+    items: List[Any] = list(value)
+    items[key] = new_item  # type: ignore
+    return items if isinstance(value, list) else tuple(items)
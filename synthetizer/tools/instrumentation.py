@@ -0,0 +1,313 @@
+import cProfile
+import json
+import os
+import re
+import resource
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+# Formats in which the metrics can be saved: a json report, a Prometheus textfile, or the spans in
+# the json format of OpenTelemetry
+METRICS_FORMATS = ["json", "prometheus", "spans"]
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Instrumentation:
+    """Instrumentation of the stages of the pipeline, e.g. fetching a page or sampling a path.
+
+    Each stage is identified by its name and labels (e.g. the resource and path it processes), and
+    the labels of a stage are inherited by the stages nested in it. For each stage, the number of
+    calls, the cumulated duration (with and without the nested stages), the peak RSS and counters
+    (e.g. the number of entries or bytes processed) are gathered, along with a span for each call,
+    as in OpenTelemetry.
+
+    The stages listed in `profile_stages` are also profiled with cProfile & tracemalloc, to get
+    the functions they spend time in (saved in `profile_dir`) and the peak memory they allocate;
+    stages nested in a profiled stage aren't profiled separately.
+    """
+
+    def __init__(
+        self,
+        profile_stages: Optional[List[str]] = None,
+        profile_dir: Optional[str] = None,
+        record_spans: bool = True,
+    ):
+        self.profile_stages = set(profile_stages or [])
+        self.profile_dir = profile_dir
+        self.record_spans = record_spans
+        self.trace_id = os.urandom(16).hex()
+
+        self.stages: Dict[Tuple[str, Labels], Dict[str, Any]] = {}
+        self.spans: List[Dict[str, Any]] = []
+        self.profiles: Dict[str, cProfile.Profile] = {}
+        self.profiling = False
+        self.lock = threading.Lock()
+        self.local = threading.local()  # Stack of the current stages, in each thread
+
+    def get_stack(self) -> List[Dict[str, Any]]:
+        if not hasattr(self.local, "stack"):
+            self.local.stack = []
+        return self.local.stack
+
+    def get_stage(self, name: str, labels: Labels) -> Dict[str, Any]:
+        key = (name, labels)
+        if key not in self.stages:
+            self.stages[key] = {
+                "stage": name,
+                "labels": dict(labels),
+                "calls": 0,
+                "duration": 0.0,
+                "self_duration": 0.0,
+                "max_rss": 0,
+                "counters": {},
+            }
+        return self.stages[key]
+
+    @contextmanager
+    def stage(self, name: str, **labels: Any) -> Iterator[None]:
+        """Instrument the stage run within the context.
+
+        Args:
+            name: Name of the stage, e.g. 'anonymize.sample'.
+            labels: Labels of the stage, e.g. the path it processes, which are added to those of
+                the enclosing stage.
+        """
+        stack = self.get_stack()
+        parent = stack[-1] if stack else None
+        all_labels = {**(parent["labels"] if parent else {}), **labels}
+        current: Dict[str, Any] = {
+            "name": name,
+            "labels": all_labels,
+            "span_id": os.urandom(8).hex(),
+            "nested_duration": 0.0,
+            "counters": {},
+        }
+
+        profile = None
+        with self.lock:
+            if name in self.profile_stages and not self.profiling:
+                self.profiling = True
+                profile = self.profiles.setdefault(name, cProfile.Profile())
+        if profile is not None:
+            tracing = tracemalloc.is_tracing()
+            if not tracing:
+                tracemalloc.start()
+            profile.enable()
+
+        stack.append(current)
+        start_time = time.time_ns()
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - t0
+            end_time = time.time_ns()
+            stack.pop()
+
+            peak_memory = None
+            if profile is not None:
+                profile.disable()
+                peak_memory = tracemalloc.get_traced_memory()[1]
+                if not tracing:
+                    tracemalloc.stop()
+
+            if parent is not None:
+                parent["nested_duration"] += duration
+
+            with self.lock:
+                if profile is not None:
+                    self.profiling = False
+                stage = self.get_stage(
+                    name, tuple(sorted((k, str(v)) for k, v in all_labels.items()))
+                )
+                stage["calls"] += 1
+                stage["duration"] += duration
+                stage["self_duration"] += duration - current["nested_duration"]
+                stage["max_rss"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+                for counter, value in current["counters"].items():
+                    stage["counters"][counter] = stage["counters"].get(counter, 0) + value
+                if peak_memory is not None:
+                    stage["peak_memory"] = max(stage.get("peak_memory", 0), peak_memory)
+
+                if self.record_spans:
+                    self.spans.append(
+                        {
+                            "trace_id": self.trace_id,
+                            "span_id": current["span_id"],
+                            "parent_span_id": parent["span_id"] if parent else None,
+                            "name": name,
+                            "start_time_unix_nano": start_time,
+                            "end_time_unix_nano": end_time,
+                            "attributes": {**all_labels, **current["counters"]},
+                        }
+                    )
+
+    def count(self, counter: str, value: float = 1):
+        """Increment a counter of the current stage, e.g. the number of entries it processed."""
+        stack = self.get_stack()
+        if stack:
+            counters = stack[-1]["counters"]
+            counters[counter] = counters.get(counter, 0) + value
+
+    def report(self) -> Dict[str, Any]:
+        """Output the metrics gathered for each stage, along with the spans."""
+        with self.lock:
+            return {
+                "stages": [
+                    dict(stage, counters=dict(stage["counters"])) for stage in self.stages.values()
+                ],
+                "spans": list(self.spans),
+            }
+
+    def merge(self, report: Dict[str, Any]):
+        """Merge in-place the report of another instrumentation, e.g. of another process."""
+        with self.lock:
+            for other in report["stages"]:
+                labels = tuple(sorted(other["labels"].items()))
+                stage = self.get_stage(other["stage"], labels)
+                for key in ["calls", "duration", "self_duration"]:
+                    stage[key] += other[key]
+                for key in ["max_rss", "peak_memory"]:
+                    if key in other:
+                        stage[key] = max(stage.get(key, 0), other[key])
+                for counter, value in other["counters"].items():
+                    stage["counters"][counter] = stage["counters"].get(counter, 0) + value
+            self.spans.extend(report["spans"])
+
+    def save_profiles(self) -> List[str]:
+        """Save the cProfile statistics of each profiled stage in `profile_dir`, to be read with
+        `pstats`, in a file named after the stage & the process.
+
+        Returns:
+            Paths of the saved statistics.
+        """
+        if self.profile_dir is None or not self.profiles:
+            return []
+
+        os.makedirs(self.profile_dir, exist_ok=True)
+        paths = []
+        for name, profile in self.profiles.items():
+            path = os.path.join(self.profile_dir, f"{name}.{os.getpid()}.prof")
+            profile.dump_stats(path)
+            paths.append(path)
+
+        return paths
+
+    def save(self, path: str, metrics_format: str = "json"):
+        """Save the metrics in `path`, in one of the `METRICS_FORMATS`."""
+        if metrics_format not in METRICS_FORMATS:
+            raise ValueError(
+                f"Unknown metrics format '{metrics_format}', expected one of {METRICS_FORMATS}."
+            )
+
+        report = self.report()
+        if metrics_format == "prometheus":
+            content = to_prometheus(report)
+        elif metrics_format == "spans":
+            content = json.dumps(report["spans"], indent=2)
+        else:
+            content = json.dumps(report["stages"], indent=2)
+
+        with open(path, "w") as f:
+            f.write(content)
+
+
+class NullInstrumentation(Instrumentation):
+    """Instrumentation which doesn't gather anything, used by default so that the instrumentation
+    costs nothing when it isn't needed.
+    """
+
+    def stage(self, name: str, **labels: Any):  # type: ignore
+        return nullcontext()
+
+    def count(self, counter: str, value: float = 1):
+        pass
+
+
+def format_labels(labels: Dict[str, Any]) -> str:
+    """Format labels as in the Prometheus exposition format, e.g. '{stage="fetch.page"}'."""
+    escaped = {
+        key: str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        for key, value in labels.items()
+    }
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped.items()) + "}"
+
+
+def to_prometheus(report: Dict[str, Any]) -> str:
+    """Format the metrics of a report as a Prometheus textfile, e.g. for the textfile collector of
+    the node exporter.
+    """
+    metrics: Dict[str, List[str]] = {}
+
+    def add(metric: str, labels: Dict[str, Any], value: float):
+        metrics.setdefault(metric, []).append(f"{metric}{format_labels(labels)} {value}")
+
+    for stage in report["stages"]:
+        labels = {"stage": stage["stage"], **stage["labels"]}
+        add("synthetizer_stage_calls_total", labels, stage["calls"])
+        add("synthetizer_stage_duration_seconds_total", labels, stage["duration"])
+        add("synthetizer_stage_self_duration_seconds_total", labels, stage["self_duration"])
+        add("synthetizer_stage_max_rss_bytes", labels, stage["max_rss"])
+        if "peak_memory" in stage:
+            add("synthetizer_stage_peak_memory_bytes", labels, stage["peak_memory"])
+        for counter, value in stage["counters"].items():
+            add(f"synthetizer_{re.sub('[^a-zA-Z0-9_]', '_', counter)}_total", labels, value)
+
+    lines = []
+    for metric, samples in metrics.items():
+        metric_type = "gauge" if metric.endswith("_bytes") else "counter"
+        lines.append(f"# TYPE {metric} {metric_type}")
+        lines.extend(samples)
+
+    return "\n".join(lines) + "\n"
+
+
+# Instrumentation used by the stages of the pipeline, which gathers nothing by default
+current_instrumentation: Instrumentation = NullInstrumentation()
+
+
+def get_instrumentation() -> Instrumentation:
+    return current_instrumentation
+
+
+@contextmanager
+def instrumented(instrumentation: Instrumentation) -> Iterator[Instrumentation]:
+    """Use `instrumentation` for the stages run within the context."""
+    global current_instrumentation
+    previous = current_instrumentation
+    current_instrumentation = instrumentation
+    try:
+        yield instrumentation
+    finally:
+        current_instrumentation = previous
+
+
+def stage(name: str, **labels: Any):
+    """Instrument a stage with the current instrumentation, see `Instrumentation.stage`."""
+    return current_instrumentation.stage(name, **labels)
+
+
+def count(counter: str, value: float = 1):
+    """Increment a counter of the current stage, see `Instrumentation.count`."""
+    current_instrumentation.count(counter, value)
+
+
+def run_instrumented(
+    func: Callable[..., Any],
+    profile_stages: Optional[List[str]],
+    profile_dir: Optional[str],
+    **kwargs,
+) -> Tuple[Any, Dict[str, Any]]:
+    """Run `func` with a new instrumentation, e.g. in another process, and output its result along
+    with the report of the instrumentation, to be merged in the main one.
+    """
+    instrumentation = Instrumentation(profile_stages=profile_stages, profile_dir=profile_dir)
+    with instrumented(instrumentation):
+        result = func(**kwargs)
+    instrumentation.save_profiles()
+
+    return result, instrumentation.report()
@@ -0,0 +1,108 @@
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+# Numbers of given names of a person, and their weights
+N_GIVEN_NAMES = [1, 2, 3]
+N_GIVEN_NAMES_WEIGHTS = [7, 2, 1]
+
+FEMALE_PREFIXES = ["Melle", "Mme"]
+MALE_PREFIX = "M."
+
+
+def to_pool(
+    names: Union[Sequence[str], Dict[str, float]],
+) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """Turn a list of names of Faker, possibly weighted, into an array of names along with their
+    probabilities, which are None if the names are uniformly distributed.
+    """
+    if isinstance(names, dict):
+        weights = np.array(list(names.values()), dtype=float)
+        return np.array(list(names), dtype=object), weights / weights.sum()
+
+    return np.array(names, dtype=object), None
+
+
+def draw(
+    pool: Tuple[np.ndarray, Optional[np.ndarray]], size: Any, rng: np.random.Generator
+) -> np.ndarray:
+    """Draw names from a pool, as output by `to_pool`, with `rng`."""
+    names, probabilities = pool
+    if probabilities is None:
+        return names[rng.integers(len(names), size=size)]
+    return names[rng.choice(len(names), size=size, p=probabilities)]
+
+
+class NameGenerator:
+    """Generator of person names, drawn in bulk from the name lists of a Faker locale, which are
+    loaded once. As with Faker, the family & given names are drawn according to their weights if
+    the lists are weighted, and uniformly otherwise.
+
+    A person is a woman or a man with even odds; they have 1, 2 or 3 given names with weights
+    7:2:1, and their prefix is 'Melle' or 'Mme' for a woman, and 'M.' for a man.
+    """
+
+    def __init__(self, locale: str = "fr_FR"):
+        from faker import Faker  # Imported lazily, as it is only needed for persons
+
+        provider = Faker(locale).provider("faker.providers.person")
+        self.family_names = to_pool(
+            {name.upper(): weight for name, weight in provider.last_names.items()}
+            if isinstance(provider.last_names, dict)
+            else [name.upper() for name in provider.last_names]
+        )
+        self.female_given_names = to_pool(provider.first_names_female)
+        self.male_given_names = to_pool(provider.first_names_male)
+        self.n_given_names_probabilities = np.array(N_GIVEN_NAMES_WEIGHTS) / sum(
+            N_GIVEN_NAMES_WEIGHTS
+        )
+
+    def generate(
+        self, size: int, rng: Optional[np.random.Generator] = None
+    ) -> List[Dict[str, Any]]:
+        """Generate the names of `size` persons at once.
+
+        Args:
+            size: Number of persons.
+            rng: Random number generator to draw the names with; if None, use a new one.
+
+        Returns:
+            Name of each person, as a Fhir HumanName with a text, a family name & given names.
+        """
+        if rng is None:
+            rng = np.random.default_rng()
+
+        is_female = rng.integers(2, size=size).astype(bool)
+        n_given_names = rng.choice(
+            N_GIVEN_NAMES, size=size, p=self.n_given_names_probabilities
+        ).tolist()
+        families = draw(self.family_names, size=size, rng=rng).tolist()
+
+        # As many given names as possible are drawn for each person, and the first ones are kept
+        shape = (size, max(N_GIVEN_NAMES))
+        given_names = np.where(
+            is_female[:, np.newaxis],
+            draw(self.female_given_names, size=shape, rng=rng),
+            draw(self.male_given_names, size=shape, rng=rng),
+        ).tolist()
+        prefixes = np.where(
+            is_female,
+            np.array(FEMALE_PREFIXES, dtype=object)[rng.integers(2, size=size)],
+            MALE_PREFIX,
+        ).tolist()
+
+        names = []
+        for prefix, family, given, n in zip(prefixes, families, given_names, n_given_names):
+            given = given[:n]
+            names.append(
+                {"text": f"{prefix} {family} {', '.join(given)}", "family": family, "given": given}
+            )
+
+        return names
+
+
+@lru_cache(maxsize=None)
+def get_name_generator(locale: str = "fr_FR") -> NameGenerator:
+    """Output the name generator of a locale, created once."""
+    return NameGenerator(locale)
@@ -0,0 +1,117 @@
+import os
+import sys
+import time
+from typing import IO, Any, Optional
+
+# Modes of display of the progress: 'auto' uses a notebook widget within notebooks and a throttled
+# terminal line otherwise, 'off' displays nothing (e.g. in containers whose logs are collected)
+PROGRESS_MODES = ["auto", "notebook", "terminal", "off"]
+
+progress_mode = os.getenv("SYNTHETIZER_PROGRESS", "auto")
+
+
+class TerminalProgress:
+    """Progress of a task, displayed in a terminal at most every `min_interval` seconds, on a
+    single line rewritten in place if the output is interactive, and on successive lines otherwise
+    (e.g. in logs), in which case the interval is `log_interval` seconds.
+    """
+
+    def __init__(
+        self,
+        total: Optional[int] = None,
+        desc: str = "",
+        file: Optional[IO[str]] = None,
+        min_interval: float = 0.5,
+        log_interval: float = 10.0,
+    ):
+        self.total = total
+        self.desc = desc
+        self.file = file if file is not None else sys.stderr
+        self.interactive = hasattr(self.file, "isatty") and self.file.isatty()
+        self.min_interval = min_interval if self.interactive else log_interval
+        self.n = 0
+        self.start_time = time.perf_counter()
+        self.last_display_time = self.start_time
+        self.closed = False
+
+    def format(self) -> str:
+        elapsed = time.perf_counter() - self.start_time
+        rate = self.n / elapsed if elapsed else 0.0
+        if self.total:
+            progress = f"{self.n}/{self.total} ({100 * self.n / self.total:.0f}%)"
+        else:
+            progress = str(self.n)
+        return f"{self.desc}: {progress} in {elapsed:.1f}s, {rate:.0f}/s"
+
+    def display(self):
+        if self.interactive:
+            self.file.write(f"\r{self.format()}")
+        else:
+            self.file.write(f"{self.format()}\n")
+        self.file.flush()
+        self.last_display_time = time.perf_counter()
+
+    def update(self, n: int = 1):
+        """Increment the progress by `n`, and display it if it hasn't been for a while."""
+        self.n += n
+        if time.perf_counter() - self.last_display_time >= self.min_interval:
+            self.display()
+
+    def close(self):
+        """Display the final progress."""
+        if self.closed:
+            return
+        self.closed = True
+        self.display()
+        if self.interactive:
+            self.file.write("\n")
+
+
+class NullProgress:
+    """Progress which displays nothing."""
+
+    def update(self, n: int = 1):
+        pass
+
+    def close(self):
+        pass
+
+
+def in_notebook() -> bool:
+    """Output whether the code runs within a Jupyter notebook, without importing IPython."""
+    if "IPython" not in sys.modules:
+        return False
+    shell = sys.modules["IPython"].get_ipython()
+    return shell is not None and type(shell).__name__ == "ZMQInteractiveShell"
+
+
+def make_progress(total: Optional[int] = None, desc: str = "", mode: Optional[str] = None) -> Any:
+    """Make the display of the progress of a task, according to the progress mode, which is read
+    from the environment variable `SYNTHETIZER_PROGRESS` by default. The notebook widget of `tqdm`
+    is imported only when needed, as it is an optional dependency.
+
+    Args:
+        total: Total number of items to process, if known.
+        desc: Description of the task.
+        mode: Mode of display, among `PROGRESS_MODES`; if None, use the default one.
+
+    Returns:
+        Progress, with an `update` method to increment it, and a `close` method.
+    """
+    mode = mode if mode is not None else progress_mode
+    if mode not in PROGRESS_MODES:
+        raise ValueError(f"Unknown progress mode '{mode}', must be in {PROGRESS_MODES}.")
+
+    if mode == "off":
+        return NullProgress()
+
+    if mode == "notebook" or (mode == "auto" and in_notebook()):
+        try:
+            from tqdm.notebook import tqdm
+        except ImportError:
+            if mode == "notebook":
+                raise
+        else:
+            return tqdm(total=total, desc=desc)
+
+    return TerminalProgress(total=total, desc=desc)
@@ -0,0 +1,64 @@
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+# Key of the references of a resource type within a namespace, i.e. an id suffix, so that the
+# references of a replica point at the resources of the same replica
+IndexKey = Tuple[str, str]
+
+
+class ReferenceIndex:
+    """In-memory index of the references of the generated resources, e.g. 'Patient/123-x', by
+    resource type & namespace (the id suffix of the resources). Membership is checked in constant
+    time with a set, and references are drawn uniformly in constant time from a list.
+    """
+
+    references: Dict[IndexKey, List[str]]
+    reference_sets: Dict[IndexKey, Set[str]]
+
+    def __init__(self):
+        self.references = {}
+        self.reference_sets = {}
+
+    def add(self, resource_type: str, ids: Iterable[str], namespace: str = ""):
+        """Add the references of resources of type `resource_type` with identifiers `ids`."""
+        key = (resource_type, namespace)
+        references = self.references.setdefault(key, [])
+        reference_set = self.reference_sets.setdefault(key, set())
+        for id_ in ids:
+            reference = f"{resource_type}/{id_}"
+            if reference not in reference_set:
+                reference_set.add(reference)
+                references.append(reference)
+
+    def covers(self, resource_type: str, namespace: str = "") -> bool:
+        """Output whether resources of type `resource_type` have been generated in `namespace`."""
+        return bool(self.references.get((resource_type, namespace)))
+
+    def contains(self, reference: str, namespace: str = "") -> bool:
+        """Output whether `reference`, e.g. 'Patient/123-x', points at a generated resource."""
+        resource_type = reference.split("/", 1)[0]
+        return reference in self.reference_sets.get((resource_type, namespace), ())
+
+    def draw(
+        self,
+        resource_type: str,
+        size: int,
+        namespace: str = "",
+        rng: Optional[np.random.Generator] = None,
+    ) -> List[str]:
+        """Draw uniformly `size` references of generated resources of type `resource_type`.
+
+        Raises:
+            ValueError: If no resource of this type has been generated in `namespace`.
+        """
+        references = self.references.get((resource_type, namespace))
+        if not references:
+            raise ValueError(f"No resource of type '{resource_type}' has been generated.")
+        if rng is None:
+            rng = np.random.default_rng()
+
+        return [references[i] for i in rng.integers(len(references), size=size)]
+
+    def __len__(self) -> int:
+        return sum(len(references) for references in self.references.values())
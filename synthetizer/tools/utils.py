@@ -1,18 +1,75 @@
-from typing import Any
+import zlib
+from typing import Any, Dict, List, Tuple, Union
 
-from glom import glom
+import numpy as np
 
 
-def glom_getter(data: Any, spec: Any, n_flatten: int) -> Any:
-    """Use glom to access a resource or attribute in the input `data` and flatten it, if needed."""
-    glm = glom(data, spec)
-
+def flatten(value: Any, n_flatten: int) -> List[Any]:
+    """Flatten `n_flatten` times the lists nested in `value`, skipping the empty or None ones."""
+    values = [value]
     for _ in range(n_flatten):
-        glm = [x for y in glm if y for x in y]
+        values = [item for items in values if items for item in items]
+
+    return values
+
+
+def canonical_key(value: Any) -> Any:
+    """Output a hashable key of a json-like value, equal for equal values whatever the order of the
+    keys of their dicts, and distinct for values of distinct types (e.g. `1` and `True`).
+    """
+    if isinstance(value, dict):
+        return (dict, tuple(sorted((key, canonical_key(item)) for key, item in value.items())))
+    elif isinstance(value, list):
+        return (list, tuple(canonical_key(item) for item in value))
+    elif isinstance(value, tuple):
+        return (tuple, tuple(canonical_key(item) for item in value))
+
+    return (type(value), value)
+
+
+def derive_seed_sequence(
+    seed_sequence: np.random.SeedSequence, *keys: Union[int, str]
+) -> np.random.SeedSequence:
+    """Derive from `seed_sequence` the independent seed sequence identified by `keys`, e.g. a
+    resource name & a shard index. Unlike `SeedSequence.spawn`, the derived sequence only depends
+    on its keys, and not on the order nor the number of the sequences derived, so that the streams
+    of random numbers don't depend on how the work is split between processes.
+    """
+    spawn_key = tuple(
+        key if isinstance(key, int) else zlib.crc32(key.encode("utf-8")) for key in keys
+    )
+    return np.random.SeedSequence(
+        entropy=seed_sequence.entropy,
+        spawn_key=tuple(seed_sequence.spawn_key) + spawn_key,
+        pool_size=seed_sequence.pool_size,
+    )
+
+
+def deduplicate(values: List[Any]) -> Tuple[List[Any], np.ndarray]:
+    """Output the distinct values of `values`, in order of first occurrence, along with their
+    numbers of occurrences; values are compared through their `canonical_key`.
+    """
+    indices: Dict[Any, int] = {}
+    distinct_values: List[Any] = []
+    counts = []
+    for value in values:
+        key = canonical_key(value)
+        i = indices.get(key)
+        if i is None:
+            indices[key] = len(distinct_values)
+            distinct_values.append(value)
+            counts.append(1)
+        else:
+            counts[i] += 1
+
+    return distinct_values, np.array(counts, dtype=int)
 
-    return glm
 
+def int_round(x: Any, n: int) -> Any:
+    """Return the multiple of `n` the closest to the integer `x`; `x` can also be an array of
+    integers.
+    """
+    if isinstance(x, np.ndarray):
+        return n * np.round(x / n).astype(x.dtype)
 
-def int_round(x: int, n: int) -> int:
-    """Return the multiple of `n` the closest to the integer `x`."""
     return n * round(x / n)
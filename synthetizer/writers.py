@@ -0,0 +1,175 @@
+import gzip
+import json
+import os
+from datetime import datetime, timezone
+from typing import IO, Any, Dict, Iterable, List, Optional
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None  # type: ignore
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None  # type: ignore
+
+# Formats in which a resource can be written
+OUTPUT_FORMATS = ["bundle", "ndjson"]
+
+# Extension of the files, for each available compression
+COMPRESSIONS = {None: "", "gzip": ".gz", "zstd": ".zst"}
+
+
+def dumps(obj: Any) -> bytes:
+    """Serialize `obj` into UTF-8 encoded json, using `orjson` if installed as it is far quicker,
+    and the standard `json` module otherwise.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
+
+def open_output(path: str, compression: Optional[str] = None) -> IO[bytes]:
+    """Open a binary file to write in, compressed on the fly if `compression` is not None.
+
+    Args:
+        path: Path of the file, without the extension of the compression.
+        compression: Compression of the file, among `COMPRESSIONS`.
+
+    Returns:
+        Binary file to write in.
+    """
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"Unknown compression '{compression}', must be in {list(COMPRESSIONS)}.")
+
+    path += COMPRESSIONS[compression]
+    if compression == "gzip":
+        return gzip.open(path, "wb", compresslevel=6)  # type: ignore
+    elif compression == "zstd":
+        if zstandard is None:
+            raise ImportError("The package 'zstandard' is needed for the 'zstd' compression.")
+        return zstandard.ZstdCompressor().stream_writer(open(path, "wb"))
+
+    return open(path, "wb")
+
+
+def write_bundle(entries: Iterable[dict], file: IO[bytes]) -> int:
+    """Write a transaction bundle in `file`, serializing the entries one by one as they come with
+    `dumps`, so that the full bundle is never held in memory. The output is the same json as the
+    bundle output by `synthetizer.anonymize.anonymize`.
+
+    Args:
+        entries: Entries of the bundle, e.g. as output by `synthetizer.anonymize.anonymize_entries`.
+        file: Binary file to write the bundle in.
+
+    Returns:
+        Number of entries written.
+    """
+    n_entries = 0
+    file.write(b'{"entry": [')
+    for entry in entries:
+        if n_entries:
+            file.write(b", ")
+        file.write(dumps(entry))
+        n_entries += 1
+    file.write(b'], "type": "transaction", "resourceType": "Bundle"}')
+
+    return n_entries
+
+
+def write_ndjson(entries: Iterable[dict], file: IO[bytes]) -> Dict[str, int]:
+    """Write the resources of the entries in `file` as newline-delimited json, one resource per
+    line as expected by the Fhir Bulk Data format, serializing them one by one as they come.
+
+    Args:
+        entries: Entries whose resources to write, e.g. as output by
+            `synthetizer.anonymize.anonymize_entries`.
+        file: Binary file to write the resources in.
+
+    Returns:
+        Number of resources written, for each resource type.
+    """
+    counts: Dict[str, int] = {}
+    for entry in entries:
+        resource = entry["resource"]
+        file.write(dumps(resource) + b"\n")
+        counts[resource["resourceType"]] = counts.get(resource["resourceType"], 0) + 1
+
+    return counts
+
+
+def write_resource(
+    resource_name: str,
+    entries: Iterable[dict],
+    output_dir: Optional[str],
+    output_format: str = "bundle",
+    compression: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Write the entries of a resource in a file of `output_dir`, named after the resource, as
+    they come.
+
+    Args:
+        resource_name: Name of the resource.
+        entries: Entries of the resource, e.g. as output by
+            `synthetizer.anonymize.anonymize_entries`.
+        output_dir: Path of the directory to write the file in; if None, don't write it.
+        output_format: Format of the file, among `OUTPUT_FORMATS`: a transaction bundle
+            ('<resource_name>.json'), or newline-delimited json ('<resource_name>.ndjson').
+        compression: Compression of the file, among `COMPRESSIONS`.
+
+    Returns:
+        Number of entries written, along with the description of the file written, per resource
+        type, as in the manifest of the Fhir Bulk Data format.
+    """
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format '{output_format}', must be in {OUTPUT_FORMATS}.")
+
+    if output_dir is None:
+        return {"n_entries": sum(1 for _ in entries), "output": []}
+
+    os.makedirs(output_dir, exist_ok=True)
+    extension = "json" if output_format == "bundle" else "ndjson"
+    path = os.path.join(output_dir, f"{resource_name}.{extension}")
+    url = os.path.basename(path) + COMPRESSIONS[compression]
+
+    with open_output(path, compression=compression) as f:
+        if output_format == "bundle":
+            n_entries = write_bundle(entries, f)
+            return {"n_entries": n_entries, "output": [{"type": "Bundle", "url": url}]}
+
+        counts = write_ndjson(entries, f)
+
+    return {
+        "n_entries": sum(counts.values()),
+        "output": [
+            {"type": resource_type, "url": url, "count": count}
+            for resource_type, count in counts.items()
+        ],
+    }
+
+
+def write_manifest(outputs: List[Dict[str, Any]], output_dir: str) -> str:
+    """Write the manifest of the files written by `write_resource` in the newline-delimited json
+    format, as in the Fhir Bulk Data format, so that they can be loaded by bulk importers.
+
+    Args:
+        outputs: Descriptions of the files, as output by `write_resource`.
+        output_dir: Path of the directory where the files are written.
+
+    Returns:
+        Path of the manifest.
+    """
+    manifest = {
+        "transactionTime": datetime.now(timezone.utc).isoformat(),
+        "request": "synthetizer",
+        "requiresAccessToken": False,
+        "output": outputs,
+        "error": [],
+    }
+
+    path = os.path.join(output_dir, "manifest.json")
+    with open(path, "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    return path
@@ -0,0 +1,79 @@
+import os
+import time
+
+from synthetizer.cache import BundleCache, SamplerKindCache, fetch_cached
+
+
+def make_bundle(ids):
+    return {"entry": [{"resource": {"resourceType": "Patient", "id": id_}} for id_ in ids]}
+
+
+def test_fetch_cached(mocker, tmp_path):
+    fetch = mocker.patch("synthetizer.cache.fetch", return_value=make_bundle(["1", "2"]))
+    cache = BundleCache(str(tmp_path))
+
+    resource_bundle = fetch_cached("patients_actifs", all_pages=True, cache=cache)
+    assert len(resource_bundle["entry"]) == 2
+    assert fetch.call_args[1]["last_updated"] is None
+
+    # Only the updated resources are fetched, and merged in the cached bundle
+    updated_bundle = make_bundle(["2", "3"])
+    updated_bundle["entry"][0]["resource"]["active"] = False
+    fetch.return_value = updated_bundle
+
+    resource_bundle = fetch_cached("patients_actifs", all_pages=True, cache=cache)
+    assert [entry["resource"]["id"] for entry in resource_bundle["entry"]] == ["1", "2", "3"]
+    assert resource_bundle["entry"][1]["resource"]["active"] is False
+    assert fetch.call_args[1]["last_updated"] is not None
+
+    fetch.return_value = {"resourceType": "Bundle", "total": 0}
+    resource_bundle = fetch_cached("patients_actifs", all_pages=True, cache=cache)
+    assert len(resource_bundle["entry"]) == 3
+
+
+def test_fetch_cached_first_page(mocker, tmp_path):
+    fetch = mocker.patch("synthetizer.cache.fetch", return_value=make_bundle(["1", "2"]))
+    cache = BundleCache(str(tmp_path))
+
+    # The first page is fetched again each time, without going through the cache
+    for _ in range(2):
+        resource_bundle = fetch_cached("patients_actifs", cache=cache)
+        assert len(resource_bundle["entry"]) == 2
+        assert "last_updated" not in fetch.call_args[1]
+    assert not os.listdir(tmp_path)
+
+
+def test_bundle_cache_key(tmp_path):
+    cache = BundleCache(str(tmp_path))
+    key = cache.key("patients_actifs", all_pages=False)
+
+    assert cache.key("patients_actifs", all_pages=False, page_size=50) != key
+    assert cache.key("patients_actifs", all_pages=True) != key
+
+
+def test_bundle_cache_eviction(tmp_path):
+    cache = BundleCache(str(tmp_path))
+    for i, resource_name in enumerate(["ehpads", "services", "chambres"]):
+        key = cache.key(resource_name, all_pages=True)
+        cache.put(key, {"last_updated": "", "bundle": make_bundle(range(100))})
+        os.utime(cache.path(key), (time.time() - 10 + i, time.time() - 10 + i))
+
+    # Using "ehpads" makes "services" the least recently used
+    assert cache.get(cache.key("ehpads", all_pages=True)) is not None
+    cache.max_size = 2 * os.path.getsize(cache.path(cache.key("ehpads", all_pages=True)))
+    cache.evict()
+
+    assert cache.get(cache.key("services", all_pages=True)) is None
+    assert cache.get(cache.key("ehpads", all_pages=True)) is not None
+    assert cache.get(cache.key("chambres", all_pages=True)) is not None
+
+
+def test_sampler_kind_cache(tmp_path):
+    cache = SamplerKindCache(str(tmp_path))
+    assert cache.get("sejours") == {}
+
+    cache.put("sejours", {"entry.{}.resource.status": "categorical"})
+    assert SamplerKindCache(str(tmp_path)).get("sejours") == {
+        "entry.{}.resource.status": "categorical"
+    }
+    assert cache.get("hospitalisations") == {}
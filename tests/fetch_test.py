@@ -0,0 +1,108 @@
+import importlib
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+from synthetizer.fetch import fetch_all, get_page_urls
+
+# The module itself, as `synthetizer.fetch` is shadowed by the function of the same name
+fetch = importlib.import_module("synthetizer.fetch")
+
+N_ENTRIES = 45
+DEFAULT_COUNT = 10
+
+
+class StubFhirHandler(BaseHTTPRequestHandler):
+    """Stub of a Hapi Fhir server, which exposes its pages with `_getpages` & `_getpagesoffset`,
+    and fails the first request for each url with a 503 error.
+    """
+
+    failed_urls: set = set()
+
+    def do_GET(self):
+        if self.path not in self.failed_urls:
+            self.failed_urls.add(self.path)
+            self.send_response(503)
+            self.end_headers()
+            return
+
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        count = int(query.get("_count", [DEFAULT_COUNT])[0])
+        offset = int(query.get("_getpagesoffset", [0])[0])
+
+        page = {
+            "resourceType": "Bundle",
+            "total": N_ENTRIES,
+            "link": [{"relation": "self", "url": self.path}],
+            "entry": [
+                {"resource": {"resourceType": "Patient", "id": str(i)}}
+                for i in range(offset, min(offset + count, N_ENTRIES))
+            ],
+        }
+        if offset + count < N_ENTRIES:
+            next_url = (
+                f"http://{self.headers['Host']}/?_getpages=stub&_getpagesoffset={offset + count}"
+                f"&_count={count}&_bundletype=searchset"
+            )
+            page["link"].append({"relation": "next", "url": next_url})
+
+        body = json.dumps(page).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/fhir+json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server(monkeypatch):
+    """Run a stub Fhir server in a thread & point the fetch module to it."""
+    StubFhirHandler.failed_urls = set()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubFhirHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    monkeypatch.setattr(fetch, "hapi_fhir_url", f"http://127.0.0.1:{server.server_port}")
+    monkeypatch.setattr(fetch, "hapi_fhir_user", None)
+
+    yield server
+
+    server.shutdown()
+    server.server_close()
+
+
+def test_get_page_urls():
+    next_url = "http://hapi/fhir?_getpages=abc&_getpagesoffset=20&_count=20&_bundletype=searchset"
+    page_urls = get_page_urls(next_url, total=65)
+    assert [parse_qs(urlsplit(url).query)["_getpagesoffset"] for url in page_urls] == [
+        ["20"],
+        ["40"],
+        ["60"],
+    ]
+    assert get_page_urls("http://hapi/fhir?page=2", total=65) is None
+
+
+@pytest.mark.parametrize("concurrency", [1, 4])
+def test_fetch(stub_server, concurrency: int):
+    resource_bundle = fetch.fetch(
+        "patients_actifs", all_pages=True, page_size=DEFAULT_COUNT, concurrency=concurrency
+    )
+    ids = [entry["resource"]["id"] for entry in resource_bundle["entry"]]
+    assert ids == [str(i) for i in range(N_ENTRIES)]
+
+    resource_bundle = fetch.fetch("patients_actifs", concurrency=concurrency)
+    assert len(resource_bundle["entry"]) == DEFAULT_COUNT
+
+
+def test_fetch_all(stub_server):
+    resource_bundles = fetch_all(["patients_actifs", "practitioner"], all_pages=True, page_size=20)
+    assert list(resource_bundles) == ["patients_actifs", "practitioner"]
+    for resource_bundle in resource_bundles.values():
+        assert len(resource_bundle["entry"]) == N_ENTRIES
@@ -0,0 +1,30 @@
+import pytest
+
+from synthetizer.tools.frozen import FrozenDict, FrozenList, freeze, replace_at, thaw
+
+
+def test_freeze():
+    value = {"a": [{"b": 1}], "c": (2, [3])}
+    frozen_value = freeze(value)
+
+    assert frozen_value == value
+    assert isinstance(frozen_value, FrozenDict) and isinstance(frozen_value["a"], FrozenList)
+    with pytest.raises(TypeError):
+        frozen_value["a"][0]["b"] = 2
+    with pytest.raises(TypeError):
+        frozen_value["a"].append(None)
+    assert freeze(frozen_value) is frozen_value
+
+    thawed_value = thaw(frozen_value)
+    thawed_value["a"][0]["b"] = 2
+    assert type(thawed_value["a"]) is list and frozen_value["a"][0]["b"] == 1
+
+
+def test_replace_at():
+    value = {"location": [{"location": {"reference": "Location/1"}}], "status": {"x": 1}}
+    new_value = replace_at(value, ["location", 0, "location", "reference"], lambda ref: ref + "-x")
+
+    assert new_value["location"][0]["location"]["reference"] == "Location/1-x"
+    assert value["location"][0]["location"]["reference"] == "Location/1"
+    assert new_value["status"] is value["status"]
+    assert replace_at(value, ["subject", "reference"], lambda ref: ref + "-x") is value
@@ -0,0 +1,74 @@
+import copy
+import json
+import os
+
+from synthetizer import anonymization_pipeline
+from synthetizer.tools.instrumentation import (
+    Instrumentation,
+    NullInstrumentation,
+    count,
+    get_instrumentation,
+    instrumented,
+    stage,
+    to_prometheus,
+)
+
+
+def test_instrumentation():
+    instrumentation = Instrumentation(profile_stages=["inner"])
+    with instrumented(instrumentation):
+        with stage("outer", resource="patients_actifs"):
+            for _ in range(2):
+                with stage("inner", path="birthDate"):
+                    count("entries", 10)
+    assert isinstance(get_instrumentation(), NullInstrumentation)
+
+    report = instrumentation.report()
+    stages = {stage["stage"]: stage for stage in report["stages"]}
+    assert stages["outer"]["calls"] == 1
+    assert stages["inner"]["calls"] == 2
+    # The labels are inherited by the nested stages
+    assert stages["inner"]["labels"] == {"resource": "patients_actifs", "path": "birthDate"}
+    assert stages["inner"]["counters"] == {"entries": 20}
+    assert stages["outer"]["self_duration"] <= stages["outer"]["duration"]
+    assert "peak_memory" in stages["inner"] and "peak_memory" not in stages["outer"]
+
+    spans = {span["span_id"]: span for span in report["spans"]}
+    outer = next(span for span in spans.values() if span["name"] == "outer")
+    assert all(
+        span["parent_span_id"] == outer["span_id"]
+        for span in spans.values()
+        if span["name"] == "inner"
+    )
+
+    prometheus = to_prometheus(report)
+    assert (
+        'synthetizer_entries_total{stage="inner",path="birthDate",resource="patients_actifs"} 20'
+        in prometheus
+    )
+
+    # The reports of other processes are merged
+    instrumentation.merge(report)
+    stages = {stage["stage"]: stage for stage in instrumentation.report()["stages"]}
+    assert stages["inner"]["calls"] == 4
+
+
+def test_anonymization_pipeline_metrics(mocker, patients_actifs_example: dict, test_data_path):
+    mocker.patch("synthetizer.main.fetch", return_value=copy.deepcopy(patients_actifs_example))
+
+    metrics_path = os.path.join(test_data_path, "metrics.json")
+    anonymization_pipeline(
+        resource_names=["patients_actifs"],
+        output_dir=test_data_path,
+        metrics_path=metrics_path,
+    )
+
+    with open(metrics_path, "r") as file:
+        stages = json.load(file)
+    names = {stage["stage"] for stage in stages}
+    assert {"resource", "fetch", "preprocess", "anonymize.entries", "write"} <= names
+    assert all(stage["labels"]["resource"] == "patients_actifs" for stage in stages)
+
+    n_entries = len(patients_actifs_example["entry"])
+    entries = [stage for stage in stages if stage["stage"] == "anonymize.entries"]
+    assert sum(stage["counters"]["entries"] for stage in entries) == n_entries
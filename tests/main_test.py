@@ -1,3 +1,8 @@
+import copy
+import gzip
+import json
+import os
+
 from synthetizer import anonymization_pipeline
 
 
@@ -11,3 +16,64 @@ def test_anonymization_pipeline(mocker, patients_actifs_example: dict, test_data
         resource_names=["patients_actifs"],
         output_dir=test_data_path,
     )
+
+
+def test_anonymization_pipeline_stream(mocker, patients_actifs_example: dict, test_data_path):
+    # Mock the function `iter_pages` in synthetizer.main, as a single page which is fetched again
+    # for each pass
+    mocker.patch(
+        "synthetizer.main.iter_pages",
+        side_effect=lambda **kwargs: iter([copy.deepcopy(patients_actifs_example)]),
+    )
+
+    anonymization_pipeline(
+        resource_names=["patients_actifs"],
+        output_dir=test_data_path,
+        stream=True,
+    )
+
+    with open(os.path.join(test_data_path, "patients_actifs.json"), "r") as file:
+        resource_bundle = json.load(file)
+    assert resource_bundle["resourceType"] == "Bundle"
+    assert len(resource_bundle["entry"]) == len(patients_actifs_example["entry"])
+
+
+def test_anonymization_pipeline_ndjson(mocker, patients_actifs_example: dict, test_data_path):
+    mocker.patch("synthetizer.main.fetch", return_value=copy.deepcopy(patients_actifs_example))
+
+    output_dir = os.path.join(test_data_path, "ndjson")
+    anonymization_pipeline(
+        resource_names=["patients_actifs"],
+        output_dir=output_dir,
+        output_format="ndjson",
+        compression="gzip",
+    )
+
+    with gzip.open(os.path.join(output_dir, "patients_actifs.ndjson.gz"), "rt") as file:
+        resources = [json.loads(line) for line in file]
+    assert len(resources) == len(patients_actifs_example["entry"])
+    assert all(resource["resourceType"] == "Patient" for resource in resources)
+
+    with open(os.path.join(output_dir, "manifest.json"), "r") as file:
+        manifest = json.load(file)
+    assert manifest["output"] == [
+        {"type": "Patient", "url": "patients_actifs.ndjson.gz", "count": len(resources)}
+    ]
+
+
+def test_anonymization_pipeline_seed(mocker, patients_actifs_example: dict, test_data_path):
+    outputs = []
+    for i in range(2):
+        # Each run gets its own copy, as the pipeline modifies the fetched bundle in-place
+        mocker.patch("synthetizer.main.load", return_value=copy.deepcopy(patients_actifs_example))
+        output_dir = os.path.join(test_data_path, f"seed_{i}")
+        anonymization_pipeline(
+            resource_names=["patients_actifs"],
+            output_dir=output_dir,
+            input_dir=test_data_path,
+            seed=0,
+        )
+        with open(os.path.join(output_dir, "patients_actifs.json"), "r") as file:
+            outputs.append(file.read())
+
+    assert outputs[0] == outputs[1]
@@ -0,0 +1,50 @@
+import copy
+import gzip
+import json
+import os
+
+from synthetizer import anonymization_pipeline
+from synthetizer.generate import generation_pipeline
+from synthetizer.models import generate_entries, load_model
+
+
+def test_generation_pipeline(mocker, patients_actifs_example: dict, test_data_path: str):
+    mocker.patch("synthetizer.main.fetch", return_value=copy.deepcopy(patients_actifs_example))
+    model_dir = os.path.join(test_data_path, "models")
+    anonymization_pipeline(
+        resource_names=["patients_actifs"], output_dir=None, id_suffix="-x", model_dir=model_dir
+    )
+
+    model = load_model(model_dir, "patients_actifs")
+    n_ids = len(model["ids"])
+    assert n_ids == len(patients_actifs_example["entry"])
+    assert sum(model["template_counts"]) == n_ids
+    assert len(model["templates"]) <= n_ids
+
+    entries = list(generate_entries(model, n_entries=2 * n_ids + 1))
+    ids = [entry["resource"]["id"] for entry in entries]
+    assert len(set(ids)) == len(ids)
+    assert ids[n_ids] == f"{ids[0][:-2]}-1-x"
+    assert all(entry["resource"]["name"][0]["family"] != "LASTNAME" for entry in entries)
+
+    output_dir = os.path.join(test_data_path, "generated")
+    summaries = generation_pipeline(
+        resource_names=["patients_actifs"], model_dir=model_dir, scale=3, output_dir=output_dir
+    )
+    assert summaries[0]["n_entries"] == 3 * n_ids
+    with open(os.path.join(output_dir, "patients_actifs.json"), "r") as file:
+        assert len(json.load(file)["entry"]) == 3 * n_ids
+
+
+def test_model_without_source_data(mocker, patients_actifs_example: dict, test_data_path: str):
+    mocker.patch("synthetizer.main.fetch", return_value=copy.deepcopy(patients_actifs_example))
+    model_dir = os.path.join(test_data_path, "models")
+    anonymization_pipeline(
+        resource_names=["patients_actifs"], output_dir=None, id_suffix="-x", model_dir=model_dir
+    )
+
+    with gzip.open(os.path.join(model_dir, "patients_actifs.pkl.gz"), "rb") as file:
+        saved_model = file.read()
+    # Names, identifiers, business identifiers & references of the source entries
+    for source_value in ["LASTNAME", "first name", "23456", "56789", "67890", "cde"]:
+        assert source_value.encode() not in saved_model
@@ -0,0 +1,22 @@
+import numpy as np
+
+from synthetizer.tools.names import MALE_PREFIX, get_name_generator
+
+
+def test_name_generator():
+    name_generator = get_name_generator()
+    female_given_names = set(name_generator.female_given_names[0])
+    male_given_names = set(name_generator.male_given_names[0])
+
+    names = name_generator.generate(10000, rng=np.random.default_rng(0))
+    assert len(names) == 10000
+
+    n_given_names = np.bincount([len(name["given"]) for name in names], minlength=4)[1:]
+    assert np.allclose(n_given_names / len(names), [0.7, 0.2, 0.1], atol=0.02)
+
+    for name in names:
+        prefix = name["text"].split(" ")[0]
+        given_names = male_given_names if prefix == MALE_PREFIX else female_given_names
+        assert set(name["given"]) <= given_names
+        assert name["family"].isupper()
+        assert name["text"] == f"{prefix} {name['family']} {', '.join(name['given'])}"
@@ -0,0 +1,60 @@
+from synthetizer.metadata import DATETIME
+from synthetizer.preprocess import collect_values, compute_sampling_data
+from synthetizer.sampling_data import CategoricalSamplingData, DtSamplingData
+
+
+def test_collect_values():
+    entries = [
+        {
+            "resource": {
+                "resourceType": "Encounter",
+                "status": "finished",
+                "period": {"start": "2016-11-21T14:45:00+02:00"},
+                "serviceProvider": {"reference": "Organization/1"},
+                "location": [{"location": {"reference": "Location/1"}}],
+            }
+        },
+        {
+            "resource": {
+                "resourceType": "Encounter",
+                "status": "in-progress",
+                "period": {"start": "2016-11-22T14:45:00+02:00"},
+                "location": [
+                    {"location": {"reference": "Location/2"}},
+                    {"location": {"reference": "Location/3"}},
+                ],
+            }
+        },
+    ]
+    values = collect_values(resource_name="sejours", entries=entries[:1], id_suffix="-1")
+    values = collect_values(
+        resource_name="sejours", entries=entries[1:], id_suffix="-1", values=values
+    )
+
+    assert values["entry.{}.resource.status"] == ["finished", "in-progress"]
+    # Missing attributes within a `Coalesce` default to None
+    assert values["entry.{}.resource.serviceProvider"] == [{"reference": "Organization/1-1"}, None]
+    # Lists are flattened, and the refs they contain get the suffix
+    assert values["entry.{}.resource.location"] == [
+        {"location": {"reference": f"Location/{i}-1"}} for i in range(1, 4)
+    ]
+    assert entries[1]["resource"]["location"][0]["location"]["reference"] == "Location/2"
+
+
+def test_compute_sampling_data_kinds():
+    dt_str = "2016-11-21T14:45:00+02:00"
+    values = {
+        "entry.{}.resource.status": ["finished"] * 10,
+        "entry.{}.resource.period": [{"start": dt_str}] * 10,
+        "entry.{}.resource.extension": [dt_str] * 10,  # Path whose kind isn't given
+    }
+    # The kinds decided previously are used for the paths whose kind isn't given
+    kinds = {"entry.{}.resource.status": DATETIME, "entry.{}.resource.period": "categorical"}
+    resource_sampling_data = compute_sampling_data("sejours", values, kinds=kinds)
+
+    assert isinstance(resource_sampling_data["entry.{}.resource.status"], CategoricalSamplingData)
+    assert isinstance(resource_sampling_data["entry.{}.resource.period"], DtSamplingData)
+    assert isinstance(resource_sampling_data["entry.{}.resource.extension"], DtSamplingData)
+    assert kinds["entry.{}.resource.extension"] == DATETIME
+    # The kinds given in the metadata aren't cached
+    assert kinds["entry.{}.resource.status"] == DATETIME
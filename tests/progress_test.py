@@ -0,0 +1,26 @@
+import io
+
+import pytest
+
+from synthetizer.tools.progress import NullProgress, TerminalProgress, make_progress
+
+
+def test_terminal_progress():
+    file = io.StringIO()  # Not interactive, so the progress is displayed on successive lines
+    progress = TerminalProgress(total=100, desc="patients_actifs", file=file, log_interval=3600)
+    for _ in range(10):
+        progress.update(10)
+    assert file.getvalue() == ""  # Throttled
+
+    progress.close()
+    progress.close()
+    lines = file.getvalue().splitlines()
+    assert len(lines) == 1
+    assert lines[0].startswith("patients_actifs: 100/100 (100%)")
+
+
+def test_make_progress():
+    assert isinstance(make_progress(total=10, mode="off"), NullProgress)
+    assert isinstance(make_progress(total=10, mode="terminal"), TerminalProgress)
+    with pytest.raises(ValueError):
+        make_progress(total=10, mode="widget")
@@ -0,0 +1,104 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from synthetizer.push import iter_transaction_chunks, push_pipeline
+from synthetizer.writers import write_resource
+
+
+class StubFhirHandler(BaseHTTPRequestHandler):
+    """Stub of a Fhir server, which records the transactions posted to it, and rejects those
+    with an entry without id.
+    """
+
+    transactions: list = []
+
+    def do_POST(self):
+        transaction = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.transactions.append(transaction)
+
+        status = 200
+        if any("id" not in entry["resource"] for entry in transaction["entry"]):
+            status = 400
+        self.send_response(status)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"{}")
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server():
+    """Run a stub Fhir server in a thread & output its url."""
+    StubFhirHandler.transactions = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubFhirHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    yield f"http://127.0.0.1:{server.server_port}"
+
+    server.shutdown()
+    server.server_close()
+
+
+def test_iter_transaction_chunks(patients_actifs_example: dict):
+    n_entries = len(patients_actifs_example["entry"])
+    chunks = list(iter_transaction_chunks(patients_actifs_example["entry"], chunk_size=3))
+
+    assert len(chunks) == (n_entries + 2) // 3
+    assert all(chunk["type"] == "transaction" for chunk in chunks)
+    assert [entry for chunk in chunks for entry in chunk["entry"]] == (
+        patients_actifs_example["entry"]
+    )
+
+
+def test_push_pipeline(stub_server: str, tmp_path, patients_actifs_example: dict):
+    entries = patients_actifs_example["entry"]
+    with open(tmp_path / "patients_actifs.json", "w") as f:
+        json.dump(patients_actifs_example, f)
+    with open(tmp_path / "ehpads.json", "w") as f:
+        json.dump({"entry": [{"resource": {"resourceType": "Organization"}}]}, f)
+
+    reports = push_pipeline(
+        resource_names=["ehpads", "patients_actifs"],
+        input_dir=str(tmp_path),
+        url=stub_server,
+        chunk_size=2,
+        concurrency=2,
+    )
+
+    assert [report["resource_name"] for report in reports] == ["ehpads", "patients_actifs"]
+    assert reports[0]["n_failed"] == 1 and len(reports[0]["errors"]) == 1
+    assert reports[1]["n_entries"] == len(entries) and reports[1]["n_failed"] == 0
+    # The resources are pushed one after the other
+    assert StubFhirHandler.transactions[0]["entry"][0]["resource"]["resourceType"] == "Organization"
+
+
+def test_push_pipeline_ndjson(stub_server: str, tmp_path, patients_actifs_example: dict):
+    entries = patients_actifs_example["entry"]
+    write_resource(
+        "patients_actifs",
+        entries,
+        output_dir=str(tmp_path),
+        output_format="ndjson",
+        compression="gzip",
+    )
+
+    reports = push_pipeline(
+        resource_names=["patients_actifs"], input_dir=str(tmp_path), url=stub_server, chunk_size=2
+    )
+
+    assert reports[0]["n_entries"] == len(entries) and reports[0]["n_failed"] == 0
+    # The requests dropped from newline-delimited json are made again; the transactions are
+    # pushed concurrently, so they may reach the server in any order
+    requests = [
+        entry["request"]
+        for transaction in StubFhirHandler.transactions
+        for entry in transaction["entry"]
+    ]
+    for entry in entries:
+        assert {"method": "PUT", "url": f"Patient/{entry['resource']['id']}"} in requests
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from synthetizer.anonymize import anonymize_entries
+from synthetizer.preprocess import preprocess_sampling_data
+from synthetizer.tools.references import ReferenceIndex
+
+
+def test_reference_index():
+    reference_index = ReferenceIndex()
+    reference_index.add("Patient", ["1-x", "2-x", "1-x"], namespace="-x")
+
+    assert len(reference_index) == 2
+    assert reference_index.covers("Patient", namespace="-x")
+    assert not reference_index.covers("Patient") and not reference_index.covers("Practitioner")
+    assert reference_index.contains("Patient/1-x", namespace="-x")
+    assert not reference_index.contains("Patient/3-x", namespace="-x")
+    assert set(reference_index.draw("Patient", 100, namespace="-x")) == {
+        "Patient/1-x",
+        "Patient/2-x",
+    }
+    with pytest.raises(ValueError):
+        reference_index.draw("Practitioner", 1)
+
+
+def test_anonymize_entries_reference_index():
+    entries = [
+        {
+            "resource": {
+                "resourceType": "Encounter",
+                "id": str(i),
+                "status": "planned",
+                "subject": {"reference": f"Patient/{i}", "type": "Patient"},
+                "period": {"start": f"2016-11-{i + 1:02d}T14:45:00+02:00"},
+            }
+        }
+        for i in range(10)
+    ]
+    resource_bundle = {"entry": entries}
+    resource_sampling_data = preprocess_sampling_data(
+        resource_name="vacances", resource_bundle=resource_bundle, id_suffix=""
+    )
+    # Only some of the patients have been generated
+    reference_index = ReferenceIndex()
+    reference_index.add("Patient", ["0", "1"])
+
+    anonymous_entries = list(
+        anonymize_entries(
+            resource_name="vacances",
+            entries=entries,
+            resource_sampling_data=resource_sampling_data,
+            id_suffix="",
+            rng=np.random.default_rng(0),
+            reference_index=reference_index,
+        )
+    )
+
+    subjects = [entry["resource"]["subject"] for entry in anonymous_entries]
+    assert {subject["reference"] for subject in subjects} <= {"Patient/0", "Patient/1"}
+    assert all(subject["type"] == "Patient" for subject in subjects)
+    # The shared sampled values are left unchanged
+    subject_sampling_data = resource_sampling_data["entry.{}.resource.subject"]
+    assert {value["reference"] for value in subject_sampling_data.values} == {
+        f"Patient/{i}" for i in range(10)
+    }
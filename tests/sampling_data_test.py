@@ -0,0 +1,226 @@
+import json
+import pickle
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pytest
+
+from synthetizer.metadata import BOUNDS_PERIOD, CATEGORICAL, DATETIME, DT_INF, PERIOD, UNIQUE
+from synthetizer.sampling_data import (
+    CategoricalSamplingData,
+    ContinuousSamplingData,
+    DtDurationSamplingData,
+    DtSamplingData,
+    SpecialDtDurationSamplingData,
+    UniqueCategoricalSamplingData,
+    infer_sampler_kind,
+    to_sampling_data,
+)
+from synthetizer.tools.alias import AliasTable
+from synthetizer.tools.buffer import SampleBuffer
+from synthetizer.tools.datetimes import format_dts, parse_dts
+
+DTS = [
+    datetime.fromisoformat(f"2016-11-{day:02d}T{hour:02d}:45:00+02:00")
+    for day, hour in zip(range(1, 29), range(0, 24))
+]
+
+
+def test_categorical_sample_many():
+    sampling_data = CategoricalSamplingData(values=["a", "b", {"reference": "Patient/1"}])
+    samples = sampling_data.sample_many(100)
+
+    assert samples.shape == (100,)
+    values = sampling_data.to_values(samples)
+    assert all(value in sampling_data.values for value in values)
+
+
+def test_continuous_sample_many():
+    sampling_data = ContinuousSamplingData(values=list(range(50)) * 2)
+    samples = sampling_data.sample_many(1000)
+
+    assert samples.dtype.kind == "i"
+    assert ((samples >= 0) & (samples < 50)).all()
+
+
+def test_continuous_sample_many_large_range():
+    values = list(range(0, 10 * ContinuousSamplingData.MAX_CDF_SIZE, 1000))
+    sampling_data = ContinuousSamplingData(values=values)
+    samples = sampling_data.sample_many(1000)
+
+    assert sampling_data.cdf is None
+    assert ((samples >= 0) & (samples < sampling_data.max_value)).all()
+
+
+def test_dt_sample_many():
+    sampling_data = DtSamplingData(dts=DTS, mode="str")
+    values = sampling_data.to_values(sampling_data.sample_many(100))
+
+    assert len(values) == 100
+    for value in values:
+        dt = datetime.fromisoformat(value)
+        assert dt.tzinfo == DTS[0].tzinfo
+        assert dt.minute % 5 == 0
+        assert dt.isoformat() == value
+
+
+def test_dt_duration_sample_many():
+    dt_pairs = [(dt, dt + timedelta(minutes=30 * i)) for i, dt in enumerate(DTS)]
+    sampling_data = DtDurationSamplingData(dt_pairs=dt_pairs, mode="dict")
+    values = sampling_data.to_values(sampling_data.sample_many(100))
+
+    for value in values:
+        assert datetime.fromisoformat(value["start"]) <= datetime.fromisoformat(value["end"])
+
+
+def test_special_dt_duration_sample_many():
+    dt_pairs = [(dt, DT_INF) for dt in DTS] + [
+        (dt, dt + timedelta(minutes=30 * i)) for i, dt in enumerate(DTS, start=1)
+    ]
+    sampling_data = SpecialDtDurationSamplingData(dt_pairs=dt_pairs)
+    starts = ["2016-11-01", "2016-11-01", "2016-11-01"]
+    ends = [DT_INF, "2016-11-01", "2016-11-02"]
+    values = sampling_data.to_values(sampling_data.sample_many(3, starts=starts, ends=ends))
+
+    assert values[0]["end"] == DT_INF
+    assert values[1]["start"] == values[1]["end"]
+    assert np.datetime64(values[2]["start"][:19]) <= np.datetime64(values[2]["end"][:19])
+
+
+def test_sample_buffer():
+    buffer = SampleBuffer(draw=lambda size: np.arange(size), min_refill_size=4)
+
+    assert [buffer.pop() for _ in range(6)] == [0, 1, 2, 3, 0, 1]  # Refills of 4 then 8 samples
+    assert len(buffer) == 6
+    assert buffer.take(10).tolist() == [2, 3, 4, 5, 6, 7, 0, 1, 2, 3]
+    assert buffer.samples.dtype == np.arange(1).dtype
+
+
+def test_categorical_deduplication():
+    sampling_data = CategoricalSamplingData(
+        values=["a", "b", "a", {"x": [1], "y": 2}, {"y": 2, "x": [1]}, 1, True]
+    )
+
+    assert sampling_data.values == ["a", "b", {"x": [1], "y": 2}, 1, True]
+    assert sampling_data.counts.tolist() == [2, 1, 2, 1, 1]
+    samples = sampling_data.sample_many(1000)
+    assert ((samples >= 0) & (samples < 5)).all()
+
+
+def test_sampling_data_pickle():
+    sampling_data = DtDurationSamplingData(
+        dt_pairs=[(dt, dt + timedelta(minutes=30 * i)) for i, dt in enumerate(DTS)], mode="dict"
+    )
+    sampling_data.sample_many(100)
+
+    loaded_sampling_data = pickle.loads(pickle.dumps(sampling_data))
+    assert loaded_sampling_data.start_dts_sampling_data.days_sampling_data.samples.samples is None
+    assert len(loaded_sampling_data.to_values(loaded_sampling_data.sample_many(100))) == 100
+
+
+def test_alias_table():
+    weights = np.array([1, 0, 5, 2, 2])
+    alias_table = AliasTable(weights)
+    samples = alias_table.draw(100000, rng=np.random.default_rng(0))
+
+    frequencies = np.bincount(samples, minlength=len(weights)) / len(samples)
+    assert np.allclose(frequencies, weights / weights.sum(), atol=0.01)
+    assert frequencies[1] == 0
+
+
+def test_categorical_frozen_values():
+    sampling_data = CategoricalSamplingData(values=[{"reference": "Patient/1"}] * 3)
+    values = sampling_data.to_values(sampling_data.sample_many(2))
+
+    assert values[0] is values[1]
+    with pytest.raises(TypeError):
+        values[0]["reference"] += "-x"
+    assert values[0] == sampling_data.values[0] == {"reference": "Patient/1"}
+    assert json.dumps(values) == '[{"reference": "Patient/1"}, {"reference": "Patient/1"}]'
+    assert pickle.loads(pickle.dumps(values)) == values
+
+
+def test_parse_dts():
+    dt_strs = ["2016-11-21T14:45:00+02:00", "2016-11-21T15:45:30+01:00", "2016-11-21T16:00:00"]
+    for strs in [dt_strs[:2], dt_strs]:
+        dts = parse_dts(strs)
+        expected = [datetime.fromisoformat(dt_str) for dt_str in strs]
+
+        assert dts.local.tolist() == [dt.replace(tzinfo=None) for dt in expected]
+        assert dts.tz_info == expected[0].tzinfo
+    assert (dts.instants[1] - dts.instants[0]).astype(int) == 2 * 3600 + 30
+
+    with pytest.raises(ValueError):
+        parse_dts(["active"])
+
+
+def test_parse_format_dts():
+    dts = parse_dts(["2016-11-21T14:45:00Z", "2016-11-22T08:00:00Z"])
+    assert dts.tz_info == timezone.utc
+    assert format_dts(dts.local, tz_info=dts.tz_info).tolist() == [
+        "2016-11-21T14:45:00Z",
+        "2016-11-22T08:00:00Z",
+    ]
+
+    dts = parse_dts(["2016-11-21", "2016-11-22"])
+    assert dts.unit == "D"
+    assert format_dts(dts.local, tz_info=dts.tz_info, unit=dts.unit).tolist() == [
+        "2016-11-21",
+        "2016-11-22",
+    ]
+
+    # Strings of other shapes are parsed one by one
+    dts = parse_dts(["2016-11-21T14:45:00.500+02:00"])
+    assert format_dts(dts.local, tz_info=dts.tz_info).tolist() == ["2016-11-21T14:45:00+02:00"]
+    dts = parse_dts(["2016-11-21T14:45:00.500Z"])
+    assert dts.tz_info == timezone.utc
+    assert format_dts(dts.local, tz_info=dts.tz_info).tolist() == ["2016-11-21T14:45:00Z"]
+
+
+def test_to_sampling_data_dts():
+    sampling_data = to_sampling_data(["2016-11-21", "2016-11-25"] * 10)
+    assert isinstance(sampling_data, DtSamplingData)
+    assert all(len(value) == 10 for value in sampling_data.to_values(sampling_data.sample_many(5)))
+
+    values = [{"start": "2016-11-21T14:45:00Z", "end": "2016-11-21T15:45:00Z"}] * 5
+    values += [{"start": "2016-11-22T14:45:00Z", "end": DT_INF}] * 5
+    sampling_data = to_sampling_data(values, kind=BOUNDS_PERIOD)
+    assert isinstance(sampling_data, SpecialDtDurationSamplingData)
+    assert sampling_data.sample(**values[-1])["start"].endswith("Z")
+
+    assert isinstance(to_sampling_data(["active", "2016-11-21"] * 10), CategoricalSamplingData)
+
+
+def test_infer_sampler_kind():
+    dt_str = "2016-11-21T14:45:00+02:00"
+    assert infer_sampler_kind([dt_str] * 1000) == DATETIME
+    assert infer_sampler_kind([{"start": dt_str}] * 1000) == DATETIME
+    assert infer_sampler_kind([(dt_str, dt_str)] * 1000) == PERIOD
+    assert infer_sampler_kind([{"start": dt_str, "end": dt_str}] * 1000) == PERIOD
+    assert infer_sampler_kind(["active", dt_str] * 500) == CATEGORICAL
+    assert infer_sampler_kind([{"reference": "Patient/1"}] * 1000, unique=True) == UNIQUE
+    assert infer_sampler_kind([]) == CATEGORICAL
+
+
+def test_to_sampling_data_kind():
+    dt_str = "2016-11-21T14:45:00+02:00"
+    periods = [{"start": dt_str, "end": "2016-11-21T15:45:00+02:00"}] * 10
+    sampling_data = to_sampling_data(periods, kind=PERIOD)
+    assert isinstance(sampling_data, DtDurationSamplingData)
+    assert sampling_data.kind == PERIOD
+
+    # Periods without end are sampled as datetimes
+    sampling_data = to_sampling_data([{"start": dt_str}] * 10, kind=PERIOD)
+    assert isinstance(sampling_data, DtSamplingData)
+    assert sampling_data.sample() == {"start": "2016-11-21T14:45:00+02:00"}
+
+    # Values which don't fit the kind are sampled as categorical values
+    sampling_data = to_sampling_data(periods + [{"start": dt_str}], kind=PERIOD)
+    assert isinstance(sampling_data, CategoricalSamplingData)
+    sampling_data = to_sampling_data(["active"] * 10, kind=DATETIME, unique=True)
+    assert isinstance(sampling_data, UniqueCategoricalSamplingData)
+
+    # The kind prevails over the values
+    assert isinstance(to_sampling_data([dt_str] * 10, kind=CATEGORICAL), CategoricalSamplingData)
+    with pytest.raises(ValueError):
+        to_sampling_data([dt_str], kind="continuous")
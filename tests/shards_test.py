@@ -0,0 +1,80 @@
+import copy
+
+import numpy as np
+
+from synthetizer.preprocess import preprocess_sampling_data, suffix_sampling_data
+from synthetizer.sampling_data import CategoricalSamplingData
+from synthetizer.shards import anonymize_sharded
+
+
+def test_anonymize_sharded(patients_actifs_example: dict):
+    n_entries = len(patients_actifs_example["entry"])
+    outputs = []
+    for workers in [1, 2]:
+        resource_bundle = copy.deepcopy(patients_actifs_example)
+        resource_sampling_data = preprocess_sampling_data(
+            resource_name="patients_actifs", resource_bundle=resource_bundle, id_suffix="-1"
+        )
+        outputs.append(
+            list(
+                anonymize_sharded(
+                    resource_name="patients_actifs",
+                    entries=resource_bundle["entry"],
+                    resource_sampling_data=resource_sampling_data,
+                    id_suffix="-1",
+                    seed_sequence=np.random.SeedSequence(0),
+                    workers=workers,
+                    shard_size=max(n_entries // 3, 1),
+                )
+            )
+        )
+
+    # The shards are merged in order, and their samples don't depend on the number of workers
+    assert len(outputs[0]) == n_entries
+    assert outputs[0] == outputs[1]
+    assert [entry["resource"]["id"] for entry in outputs[0]] == [
+        f"{entry['resource']['id']}-1" for entry in patients_actifs_example["entry"]
+    ]
+
+
+def test_anonymize_sharded_replicas(patients_actifs_example: dict):
+    resource_bundle = copy.deepcopy(patients_actifs_example)
+    resource_sampling_data = preprocess_sampling_data(
+        resource_name="patients_actifs", resource_bundle=resource_bundle, id_suffix="-x"
+    )
+    entries = list(
+        anonymize_sharded(
+            resource_name="patients_actifs",
+            entries=resource_bundle["entry"],
+            resource_sampling_data=resource_sampling_data,
+            id_suffix="-x",
+            replicas=3,
+        )
+    )
+
+    # Each replica has its own ids, and its references point to the resources of the replica
+    source_ids = [entry["resource"]["id"] for entry in patients_actifs_example["entry"]]
+    assert sorted(entry["resource"]["id"] for entry in entries) == sorted(
+        f"{source_id}{suffix}" for source_id in source_ids for suffix in ["-x", "-x-1", "-x-2"]
+    )
+    for entry in entries:
+        suffix = entry["resource"]["id"][len(entry["resource"]["id"].split("-")[0]) :]
+        reference = entry["resource"].get("managingOrganization", {}).get("reference")
+        assert reference is None or reference.endswith(suffix)
+
+
+def test_suffix_sampling_data():
+    resource_sampling_data = {
+        "entry.{}.resource.subject": CategoricalSamplingData(
+            values=[{"reference": "Patient/1-x"}, {"reference": "Patient/2-x"}]
+        ),
+        "entry.{}.resource.status": CategoricalSamplingData(values=["active"]),
+    }
+    suffixed = suffix_sampling_data("soins_planifies", resource_sampling_data, suffix="-1")
+
+    subject = suffixed["entry.{}.resource.subject"]
+    assert subject.values == [{"reference": "Patient/1-x-1"}, {"reference": "Patient/2-x-1"}]
+    assert subject.alias_table is resource_sampling_data["entry.{}.resource.subject"].alias_table
+    assert (
+        suffixed["entry.{}.resource.status"] is resource_sampling_data["entry.{}.resource.status"]
+    )
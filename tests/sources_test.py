@@ -0,0 +1,64 @@
+import gzip
+import io
+import json
+import os
+
+import pytest
+
+from synthetizer import anonymization_pipeline
+from synthetizer.sources import iter_bundle_entries, iter_file_pages, load
+from synthetizer.tools.paths import EXAMPLES_PATH
+
+
+@pytest.mark.parametrize("block_size", [1, 7, 1 << 20])
+def test_iter_bundle_entries(patients_actifs_example: dict, block_size: int):
+    data = json.dumps(
+        {"link": [{"url": "http://a/b?entry=1"}], **patients_actifs_example, "total": 12345},
+        ensure_ascii=False,
+        indent=2,
+    ).encode("utf-8")
+
+    entries = list(iter_bundle_entries(io.BytesIO(data), block_size=block_size))
+    assert entries == patients_actifs_example["entry"]
+
+    assert list(iter_bundle_entries(io.BytesIO(b'{"entry": []}'))) == []
+    with pytest.raises(ValueError):
+        list(iter_bundle_entries(io.BytesIO(data[:-10]), block_size=block_size))
+
+
+def test_load(tmp_path):
+    # The example is read again, as the fixture may have been anonymized in-place by other tests
+    with open(os.path.join(EXAMPLES_PATH, "patients_actifs.json"), "r") as f:
+        entries = json.load(f)["entry"]
+    assert load(EXAMPLES_PATH, "patients_actifs")["entry"] == entries
+
+    with gzip.open(tmp_path / "patients_actifs.json.gz", "wt") as f:
+        json.dump({"resourceType": "Bundle", "entry": entries}, f)
+    assert load(str(tmp_path), "patients_actifs")["entry"] == entries
+    os.remove(tmp_path / "patients_actifs.json.gz")
+
+    resources = [entry["resource"] for entry in entries]
+    with gzip.open(tmp_path / "patients_actifs.ndjson.gz", "wt") as f:
+        f.writelines(json.dumps(resource) + "\n" for resource in resources)
+
+    pages = list(iter_file_pages(str(tmp_path), "patients_actifs", page_size=2))
+    assert [len(page["entry"]) for page in pages[:-1]] == [2] * (len(pages) - 1)
+    assert [entry["resource"] for page in pages for entry in page["entry"]] == resources
+
+    with pytest.raises(FileNotFoundError):
+        load(str(tmp_path), "practitioner")
+
+
+@pytest.mark.parametrize("stream, workers", [(False, 1), (True, 1), (False, 2)])
+def test_anonymization_pipeline_input_dir(test_data_path: str, stream: bool, workers: int):
+    output_dir = os.path.join(test_data_path, "input_dir")
+    summaries = anonymization_pipeline(
+        resource_names=["patients_actifs"],
+        output_dir=output_dir,
+        input_dir=EXAMPLES_PATH,
+        stream=stream,
+        workers=workers,
+    )
+
+    assert summaries[0]["n_entries"] == len(load(EXAMPLES_PATH, "patients_actifs")["entry"])
+    assert os.path.isfile(os.path.join(output_dir, "patients_actifs.json"))